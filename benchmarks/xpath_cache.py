@@ -0,0 +1,71 @@
+"""Micro-benchmark of the per-file time saved by re-using compiled
+XPath expressions in the built-in Python FeatureFinders.
+
+Usage: python -m benchmarks.xpath_cache [SOURCE_DIR] [MAX_FILES]
+
+SOURCE_DIR defaults to the directory of the Python standard library.
+
+"""
+import ast
+import os.path
+import sys
+from pathlib import Path
+from timeit import timeit
+
+from codesurvey.analyzers.python import features
+
+XPATHS = [
+    'For/orelse',
+    'Try/finalbody',
+    'FunctionDef/args/arguments//annotation',
+    'Call/func/Name',
+    'Set',
+    'FormattedValue',
+    'IfExp',
+    'Match',
+    'NamedExpr',
+]
+
+
+def uncompiled(xml):
+    for xpath in XPATHS:
+        for el in xml.xpath(f'descendant-or-self::{xpath}'):
+            el.xpath('descendant-or-self::*[@lineno]/@lineno')
+
+
+def compiled(xml):
+    for xpath in XPATHS:
+        for el in features.compile_xpath(f'descendant-or-self::{xpath}')(xml):
+            features._LINE_NUMBERS_XPATH(el)
+
+
+def load_xml_documents(source_dir, max_files):
+    documents = []
+    for path in sorted(Path(source_dir).glob('**/*.py')):
+        if len(documents) >= max_files:
+            break
+        try:
+            tree = ast.parse(path.read_bytes())
+        except (SyntaxError, ValueError):
+            continue
+        documents.append(features.convert_to_xml(tree))
+    return documents
+
+
+def main():
+    source_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(ast.__file__)
+    max_files = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    documents = load_xml_documents(source_dir, max_files)
+    repeat = 3
+    results = {}
+    for func in [uncompiled, compiled]:
+        seconds = timeit(lambda: [func(xml) for xml in documents], number=repeat)
+        results[func.__name__] = seconds / (repeat * len(documents))
+        print(f'{func.__name__:>10}: {results[func.__name__] * 1e6:8.1f} µs per file')
+    saving = results['uncompiled'] - results['compiled']
+    print(f'{"saving":>10}: {saving * 1e6:8.1f} µs per file '
+          f'({saving / results["uncompiled"]:.0%}) over {len(documents)} files')
+
+
+if __name__ == '__main__':
+    main()
@@ -23,7 +23,7 @@ print(survey.get_survey_tree())
 __version__ = '0.1.5'
 
 from .core import CodeSurvey
-from .database import RepoFeature, CodeFeature
+from .database import RepoFeature, CodeFeature, FeatureSummary
 from .utils import logger
 from . import sources
 from . import analyzers
@@ -32,6 +32,7 @@ __all__ = [
     'CodeSurvey',
     'RepoFeature',
     'CodeFeature',
+    'FeatureSummary',
     'logger',
     'sources',
     'analyzers',
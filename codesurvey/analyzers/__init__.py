@@ -1,4 +1,5 @@
-from .core import Analyzer, Code, CodeThunk, FileAnalyzer, FileInfo
+from .cache import FeatureCache
+from .core import Analyzer, Code, CodeThunk, FileAnalyzer, FileInfo, TransientPrepareError
 from .features import (
     Feature, FeatureDict, FeatureFinder,
     feature_finder, partial_feature_finder, union_feature_finder,
@@ -10,6 +11,8 @@ __all__ = [
     'CodeThunk',
     'FileAnalyzer',
     'FileInfo',
+    'TransientPrepareError',
+    'FeatureCache',
     'Feature',
     'FeatureDict',
     'FeatureFinder',
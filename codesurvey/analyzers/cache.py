@@ -0,0 +1,263 @@
+"""On-disk cache of Feature results for source-code content."""
+
+import hashlib
+import io
+import json
+import marshal
+import os
+import pickle
+import sqlite3
+import time
+import types
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from codesurvey.utils import record_stat
+from .features import Feature
+
+FEATURE_CACHE_HITS_STAT = 'feature_cache_hits'
+"""Name of the run statistic counting Feature results retrieved from a
+FeatureCache."""
+
+FEATURE_CACHE_MISSES_STAT = 'feature_cache_misses'
+"""Name of the run statistic counting Feature results that were not
+found in a FeatureCache."""
+
+FEATURE_CACHE_EVICTIONS_STAT = 'feature_cache_evictions'
+"""Name of the run statistic counting Feature results evicted from a
+FeatureCache to keep it within its maximum size."""
+
+
+def get_content_hash(content: bytes) -> str:
+    """Returns the hash identifying source-code content in a FeatureCache."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def _fingerprint_placeholder(*args: Any) -> None:
+    """Stands in for objects that are pickled by their code and state
+    when computing fingerprints. Never called."""
+
+
+class _FingerprintPickler(pickle.Pickler):
+    """Pickler that pickles functions by their code, closure and
+    attributes rather than by reference, so that changes to the
+    implementation of a function change its fingerprint."""
+
+    def reducer_override(self, obj):
+        if obj is _fingerprint_placeholder:
+            return NotImplemented
+        if isinstance(obj, types.FunctionType):
+            closure = tuple(cell.cell_contents for cell in (obj.__closure__ or ()))
+            return (_fingerprint_placeholder, (
+                obj.__module__, obj.__qualname__, marshal.dumps(obj.__code__),
+                closure, obj.__defaults__, obj.__kwdefaults__, vars(obj),
+            ))
+        if hasattr(obj, '__wrapped__') and not isinstance(obj, type):
+            # E.g. FeatureFinders defined by decorators, which would
+            # otherwise be pickled by reference.
+            return (_fingerprint_placeholder, (type(obj), vars(obj)))
+        return NotImplemented
+
+
+def get_fingerprint(obj: Any) -> Optional[str]:
+    """Returns a hash of the given object's state and code, or `None` if
+    a fingerprint cannot be determined for the object."""
+    buffer = io.BytesIO()
+    try:
+        _FingerprintPickler(buffer, protocol=4).dump(obj)
+    except Exception:
+        return None
+    return hashlib.sha256(buffer.getvalue()).hexdigest()
+
+
+_connections: Dict[Tuple[str, int], sqlite3.Connection] = {}
+
+
+class FeatureCache:
+    """On-disk cache of Feature results, shared by all survey workers
+    and across survey runs.
+
+    Results are keyed by a hash of the content of each source-code
+    file, and by a fingerprint of the Analyzer type and the
+    FeatureFinder that found each Feature, so that identical files in
+    different Repos (such as vendored libraries or copied boilerplate)
+    only need to be analyzed once.
+
+    Fingerprints include the code of FeatureFinder functions, but not
+    any global state they depend on: clear the cache (by deleting its
+    file) if the results of a FeatureFinder change for another reason.
+
+    When the cache exceeds `max_size_mb`, the least recently used
+    results are evicted.
+
+    Example usage:
+
+    ```python
+    PythonAstAnalyzer(
+        feature_finders=[has_set],
+        cache=FeatureCache('feature_cache.sqlite3'),
+    )
+    ```
+
+    """
+
+    EVICTION_CHECK_INTERVAL = 100
+    """Number of results to add to the cache between checks of its size."""
+
+    TOUCH_INTERVAL_SECONDS = 3600
+    """Minimum seconds between updates to the last-used time of a cached
+    result, avoiding a database write for every cache hit."""
+
+    def __init__(self, path: str, *, max_size_mb: float = 1024):
+        """
+        Args:
+            path: Path to the SQLite database file storing the cache. The
+                file is created if it does not exist.
+            max_size_mb: Maximum size of cached results, in megabytes.
+        """
+        self.path = os.path.abspath(path)
+        self.max_size_mb = max_size_mb
+        self._put_count = 0
+
+    def __str__(self):
+        return self.path
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self})'
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_put_count'] = 0
+        return state
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Connection to the cache database for the current process.
+
+        Connections cannot be shared with sub-processes, so each
+        process opens its own connection the first time it is needed.
+
+        """
+        conn_key = (self.path, os.getpid())
+        conn = _connections.get(conn_key)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS feature_cache ('
+                'content_hash TEXT NOT NULL, '
+                'fingerprint TEXT NOT NULL, '
+                'ignore INTEGER NOT NULL, '
+                'occurrences TEXT NOT NULL, '
+                'last_used REAL NOT NULL, '
+                'PRIMARY KEY (content_hash, fingerprint))'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS feature_cache_last_used ON feature_cache (last_used)')
+            conn.commit()
+            _connections[conn_key] = conn
+        return conn
+
+    def get(self, content_hash: str, fingerprints: Mapping[str, str]) -> Dict[str, Feature]:
+        """Returns cached Feature results for the given content.
+
+        Args:
+            content_hash: Hash of the source-code content returned by
+                `get_content_hash()`.
+            fingerprints: Mapping of feature names to the fingerprints
+                of their FeatureFinders.
+
+        Returns:
+            A dictionary mapping feature names to cached
+                [`Feature`][codesurvey.analyzers.Feature] results, which
+                only includes features that were found in the cache.
+
+        """
+        if not fingerprints:
+            return {}
+        fingerprint_features = {fingerprint: feature_name for feature_name, fingerprint in fingerprints.items()}
+        placeholders = ', '.join('?' * len(fingerprint_features))
+        rows = self.conn.execute(
+            ('SELECT fingerprint, ignore, occurrences, last_used FROM feature_cache '
+             f'WHERE content_hash = ? AND fingerprint IN ({placeholders})'),
+            (content_hash, *fingerprint_features.keys()),
+        ).fetchall()
+
+        now = time.time()
+        features = {}
+        stale_fingerprints = []
+        for fingerprint, ignore, occurrences, last_used in rows:
+            feature_name = fingerprint_features[fingerprint]
+            features[feature_name] = Feature(
+                name=feature_name,
+                occurrences=json.loads(occurrences),
+                ignore=bool(ignore),
+            )
+            if last_used < now - self.TOUCH_INTERVAL_SECONDS:
+                stale_fingerprints.append(fingerprint)
+        if stale_fingerprints:
+            placeholders = ', '.join('?' * len(stale_fingerprints))
+            with self.conn:
+                self.conn.execute(
+                    f'UPDATE feature_cache SET last_used = ? WHERE content_hash = ? AND fingerprint IN ({placeholders})',
+                    (now, content_hash, *stale_fingerprints),
+                )
+
+        record_stat(FEATURE_CACHE_HITS_STAT, len(features))
+        record_stat(FEATURE_CACHE_MISSES_STAT, len(fingerprints) - len(features))
+        return features
+
+    def put(self, content_hash: str, fingerprinted_features: Mapping[str, Feature]) -> None:
+        """Adds Feature results for the given content to the cache.
+
+        Args:
+            content_hash: Hash of the source-code content returned by
+                `get_content_hash()`.
+            fingerprinted_features: Mapping of FeatureFinder fingerprints
+                to the Feature results they found.
+
+        """
+        if not fingerprinted_features:
+            return
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO feature_cache VALUES (?, ?, ?, ?, ?)',
+                [
+                    (content_hash, fingerprint, int(feature.ignore), json.dumps(feature.occurrences), now)
+                    for fingerprint, feature in fingerprinted_features.items()
+                ],
+            )
+        self._put_count += len(fingerprinted_features)
+        if self._put_count >= self.EVICTION_CHECK_INTERVAL:
+            self._put_count = 0
+            self.evict()
+
+    def get_size_mb(self) -> float:
+        """Returns the size of the pages used to store the cache, in megabytes."""
+        page_size, = self.conn.execute('PRAGMA page_size').fetchone()
+        page_count, = self.conn.execute('PRAGMA page_count').fetchone()
+        freelist_count, = self.conn.execute('PRAGMA freelist_count').fetchone()
+        return (page_count - freelist_count) * page_size / 1_000_000
+
+    def evict(self) -> None:
+        """Evicts the least recently used results until the cache is
+        within its maximum size."""
+        # Evict down to nine tenths of the maximum size, so that
+        # eviction is not needed again immediately.
+        target_size_mb = self.max_size_mb * 0.9
+        size_mb = self.get_size_mb()
+        if size_mb <= self.max_size_mb:
+            return
+        while size_mb > target_size_mb:
+            row_count, = self.conn.execute('SELECT COUNT(*) FROM feature_cache').fetchone()
+            if row_count == 0:
+                break
+            evict_count = max(1, int(row_count * (1 - target_size_mb / size_mb)))
+            with self.conn:
+                self.conn.execute(
+                    ('DELETE FROM feature_cache WHERE rowid IN '
+                     '(SELECT rowid FROM feature_cache ORDER BY last_used LIMIT ?)'),
+                    (evict_count,),
+                )
+            record_stat(FEATURE_CACHE_EVICTIONS_STAT, evict_count)
+            size_mb = self.get_size_mb()
@@ -1,15 +1,35 @@
 """Base classes for Analyzers of code in Repos."""
 
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from functools import partial
-from glob import iglob
+from dataclasses import dataclass, field, replace
+from functools import cached_property, partial
+import io
 import os.path
-from typing import Callable, Dict, Generic, Iterator, Optional, Sequence, Union
+from typing import Callable, Dict, Generic, Iterator, Optional, Sequence, Tuple, Union
 
-from codesurvey.utils import get_duplicates
+from codesurvey import __version__
+from codesurvey.utils import filter_glob_paths, get_duplicates, iter_glob_files, logger, pop_stats, record_stat
 from codesurvey.sources import Repo, TestSource
-from .features import CodeReprT, FeatureFinder, Feature
+from codesurvey.sources.core import SourceError, get_git_index_files
+from .cache import FeatureCache, get_content_hash, get_fingerprint
+from .features import CodeReprT, FeatureFinder, Feature, get_prefilter
+
+PREFILTERED_FILES_STAT = 'prefiltered_files'
+"""Name of the run statistic counting files that were only checked
+instead of being prepared for analysis because none of their analyzed
+features' prefilters matched the text of the file."""
+
+
+class TransientPrepareError(Exception):
+    """Raised by [`FileAnalyzer.prepare_file()`][codesurvey.analyzers.FileAnalyzer.prepare_file]
+    when a file could not be prepared for analysis for a reason that
+    may not recur in a later run (e.g. a crashed parser process).
+
+    The file's features are ignored, as if `prepare_file()` had
+    returned `None`, but the ignored results are not cached in a
+    FeatureCache.
+
+    """
 
 
 @dataclass(frozen=True)
@@ -29,6 +49,14 @@ class Code:
     features: Dict[str, Feature]
     """A mapping of feature names to Feature survey results."""
 
+    stats: Dict[str, int] = field(default_factory=dict)
+    """Counters of notable events during the analysis (such as restarted
+    parser processes), which are aggregated into the statistics of the
+    survey run."""
+
+    blob_sha: Optional[str] = None
+    """SHA of the Git blob of the Code's content, if known."""
+
 
 @dataclass(frozen=True)
 class CodeThunk:
@@ -50,6 +78,11 @@ class CodeThunk:
     thunk: Callable[[], Code]
     """Function to be called to perform the analysis."""
 
+    blob_sha: Optional[str] = None
+    """SHA of the Git blob of the Code's content, if known. Allows saved
+    features of another Code with identical content to be used instead
+    of performing the analysis."""
+
 
 class Analyzer(ABC, Generic[CodeReprT]):
     """Analyzes Repos to produce Code feature analysis results of
@@ -84,10 +117,11 @@ class Analyzer(ABC, Generic[CodeReprT]):
         self.feature_finders = {feature.name: feature for feature in feature_finders}
 
     @abstractmethod
-    def prepare_code_representation(self, repo: Repo, code_key: str) -> CodeReprT:
+    def prepare_code_representation(self, repo: Repo, code_key: str) -> Optional[CodeReprT]:
         """Returns a representation of a source-code unit that can be passed
         to the [FeatureFinders][codesurvey.analyzers.FeatureFinder] of
-        this Analyzer.
+        this Analyzer, or `None` if the source-code unit cannot be
+        analyzed (in which case its features are ignored).
 
         Args:
             repo: Repo containing the source-code to be analyzed.
@@ -133,18 +167,43 @@ class Analyzer(ABC, Generic[CodeReprT]):
 
         """
         code_repr = self.prepare_code_representation(repo=repo, code_key=code_key)
-        if code_repr is None:
-            feature_results = {feature_name: Feature(name=feature_name, ignore=True)
-                               for feature_name in features}
-        else:
-            feature_results = {feature_name: self.feature_finders[feature_name](code_repr)
-                               for feature_name in features}
+        feature_results = self._find_code_repr_features(code_repr, features)
         return self.code(
             repo=repo,
             key=code_key,
             features=feature_results,
+            stats=pop_stats(),
         )
 
+    def _find_code_repr_features(self, code_repr: Optional[CodeReprT], features: Sequence[str]) -> Dict[str, Feature]:
+        """Finds the named features in the code representation, or
+        ignores them if the code could not be represented."""
+        if code_repr is None:
+            return {feature_name: Feature(name=feature_name, ignore=True)
+                    for feature_name in features}
+        return self.find_features(code_repr, features)
+
+    def find_features(self, code_repr: CodeReprT, features: Sequence[str]) -> Dict[str, Feature]:
+        """Applies the FeatureFinders of the named features to a
+        representation of a source-code unit.
+
+        Analyzers may override this method to find multiple features
+        together more efficiently than applying each FeatureFinder in
+        turn.
+
+        Args:
+            code_repr: Representation of the source-code unit returned by
+                [`prepare_code_representation()`][codesurvey.analyzers.Analyzer.prepare_code_representation].
+            features: Names of features to find.
+
+        Returns:
+            A dictionary mapping feature names to
+                [`Feature`][codesurvey.analyzers.Feature] results.
+
+        """
+        return {feature_name: self.feature_finders[feature_name](code_repr)
+                for feature_name in features}
+
     def get_feature_names(self) -> Sequence[str]:
         """Returns the names of all features analyzed by this Analyzer instance."""
         return list(self.feature_finders.keys())
@@ -162,7 +221,7 @@ class Analyzer(ABC, Generic[CodeReprT]):
 
 @dataclass(frozen=True)
 class FileInfo:
-    """Details identifying a source-code file within a Repo."""
+    """Details identifying a source-code file (or directory) within a Repo."""
 
     repo: Repo
     """Repo that the file belongs to."""
@@ -170,11 +229,28 @@ class FileInfo:
     rel_path: str
     """Relative path to the file from the Repo directory."""
 
+    git_blob_sha: Optional[str] = field(default=None, compare=False)
+    """SHA of the file's Git blob, if the file was found from the index
+    of a Git-backed Repo."""
+
     @property
     def abs_path(self) -> str:
         """Absolute path to the file."""
         return os.path.join(self.repo.path, self.rel_path)
 
+    @cached_property
+    def content(self) -> bytes:
+        """Binary content of the file, which is only read once."""
+        with open(self.abs_path, 'rb') as f:
+            return f.read()
+
+    @cached_property
+    def text(self) -> str:
+        """Text content of the file, decoded in the same way as a file
+        opened in text mode with default arguments, which is only decoded
+        once."""
+        return io.TextIOWrapper(io.BytesIO(self.content)).read()
+
 
 class FileAnalyzer(Analyzer[CodeReprT]):
     """Base class for Analyzers that analyze each source-code file as the
@@ -194,10 +270,19 @@ class FileAnalyzer(Analyzer[CodeReprT]):
     assigned to FileAnalyzers of this type if custom filters are not
     specified."""
 
+    default_dir_filters: Sequence[Callable[[FileInfo], bool]] = []
+    """Default filters to identify directories to exclude from analysis.
+    To be assigned to FileAnalyzers of this type if custom filters are
+    not specified."""
+
     def __init__(self, feature_finders: Sequence[FeatureFinder], *,
                  file_glob: Optional[str] = None,
                  file_filters: Optional[Sequence[Callable[[FileInfo], bool]]] = None,
-                 name: Optional[str] = None):
+                 dir_filters: Optional[Sequence[Callable[[FileInfo], bool]]] = None,
+                 name: Optional[str] = None,
+                 cache: Optional[FeatureCache] = None,
+                 use_prefilters: bool = False,
+                 use_git_index: bool = True):
         """
         Args:
             feature_finders:
@@ -211,47 +296,247 @@ class FileAnalyzer(Analyzer[CodeReprT]):
                 returns `True` if the file should be excluded. file_filters
                 cannot be lambdas, as they need to be pickled when passed to
                 sub-processes.
+            dir_filters: Filters to identify directories to exclude from
+                analysis. Each filter is a function that takes a
+                [`FileInfo`][codesurvey.analyzers.FileInfo] for a
+                directory and returns `True` if no files within the
+                directory should be analyzed, so that the directory does
+                not need to be scanned. dir_filters cannot be lambdas.
             name: Name to identify the Analyzer. If `None`, defaults to the
                 Analyzer type's default_name.
+            cache: An optional [`FeatureCache`][codesurvey.analyzers.FeatureCache]
+                to retrieve and store the Feature results of files by their
+                content, so that files with identical content are only
+                analyzed once.
+            use_prefilters: If `True`, features are not analyzed for files
+                whose text does not match the prefilter of their
+                FeatureFinder, and such features are given a result with
+                no occurrences. Files are only checked with
+                [`check_file()`][codesurvey.analyzers.FileAnalyzer.check_file]
+                instead of being prepared for analysis if none of the
+                analyzed features' prefilters match, so that files that
+                cannot be prepared (e.g. a file with a syntax error) still
+                have their features ignored.
+            use_git_index: If `True` (the default), the files of Repos from
+                [Git-backed][codesurvey.sources.Source.git_backed] Sources
+                are found from the Git index instead of scanning the Repo
+                directory, so untracked files are not analyzed.
 
         """
         super().__init__(feature_finders=feature_finders, name=name)
         self.file_glob = self.default_file_glob if file_glob is None else file_glob
         self.file_filters = self.default_file_filters if file_filters is None else file_filters
+        self.dir_filters = self.default_dir_filters if dir_filters is None else dir_filters
+        self.cache = cache
+        self.use_prefilters = use_prefilters
+        self.use_git_index = use_git_index
+        self._fingerprints: Dict[str, Optional[str]] = {}
 
     @abstractmethod
-    def prepare_file(self, file_info: FileInfo) -> CodeReprT:
+    def prepare_file(self, file_info: FileInfo) -> Optional[CodeReprT]:
         """Given a [`FileInfo`][codesurvey.analyzers.FileInfo] identifying the
         location of a target source-code file, returns a
         representation of the code that can be passed to the
         [FeatureFinders][codesurvey.analyzers.FeatureFinder] of this
-        Analyzer."""
+        Analyzer, or `None` if the file cannot be analyzed.
+
+        Raises:
+            TransientPrepareError: The file could not be prepared for a
+                reason that may not recur in a later run.
+
+        """
+
+    def check_file(self, file_info: FileInfo) -> bool:
+        """Returns whether the file identified by the given
+        [`FileInfo`][codesurvey.analyzers.FileInfo] can be prepared for
+        analysis.
+
+        Used instead of `prepare_file()` for files whose features are
+        all excluded by prefilters. Subclasses may override it with a
+        cheaper check than preparing the file.
 
-    def prepare_code_representation(self, repo: Repo, code_key: str) -> CodeReprT:
+        Raises:
+            TransientPrepareError: The file could not be checked for a
+                reason that may not recur in a later run.
+
+        """
+        return self.prepare_file(file_info) is not None
+
+    def prepare_code_representation(self, repo: Repo, code_key: str) -> Optional[CodeReprT]:
         file_info = FileInfo(repo=repo, rel_path=code_key)
-        return self.prepare_file(file_info)
+        try:
+            return self.prepare_file(file_info)
+        except TransientPrepareError:
+            return None
+
+    def _get_fingerprint(self, feature_name: str) -> Optional[str]:
+        """Returns the fingerprint identifying the results of the named
+        feature's FeatureFinder in the cache."""
+        if feature_name not in self._fingerprints:
+            fingerprint = get_fingerprint((
+                __version__,
+                self.__class__.__module__,
+                self.__class__.__qualname__,
+                feature_name,
+                self.feature_finders[feature_name],
+            ))
+            if fingerprint is None:
+                logger.warning((f'Results of feature "{feature_name}" of analyzer "{self}" '
+                                'will not be cached, as its FeatureFinder could not be fingerprinted'))
+            self._fingerprints[feature_name] = fingerprint
+        return self._fingerprints[feature_name]
+
+    def _find_file_features(self, file_info: FileInfo, features: Sequence[str]) -> Tuple[Dict[str, Feature], bool]:
+        """Prepares the file (or only checks it, if every feature is
+        excluded by a prefilter) and finds the named features in it, skipping
+        features whose prefilters do not match the file's text when
+        use_prefilters is enabled.
+
+        Also returns `False` if the results may not be cached because
+        the file could not be prepared due to a TransientPrepareError.
 
-    def _get_file_keys(self, repo: Repo) -> Iterator[str]:
-        """Generator yielding the code_keys (relative file paths) within the
-        given Repo, applying configured file_filters."""
-        for abs_path in iglob(os.path.join(repo.path, self.file_glob), recursive=True):
-            if not os.path.isfile(abs_path):
-                continue
-            file_info = FileInfo(
+        """
+        feature_results: Dict[str, Feature] = {}
+        cacheable = True
+        if self.use_prefilters:
+            for feature_name in features:
+                prefilter = get_prefilter(self.feature_finders[feature_name])
+                if prefilter is not None and prefilter.search(file_info.text) is None:
+                    feature_results[feature_name] = Feature(name=feature_name)
+        unfiltered_features = [feature_name for feature_name in features if feature_name not in feature_results]
+        if unfiltered_features:
+            try:
+                code_repr = self.prepare_file(file_info)
+            except TransientPrepareError:
+                code_repr = None
+                cacheable = False
+            # All features are ignored if the file could not be
+            # prepared, including those excluded by prefilters.
+            feature_results.update(self._find_code_repr_features(
+                code_repr, unfiltered_features if code_repr is not None else features,
+            ))
+        elif features:
+            try:
+                checked = self.check_file(file_info)
+            except TransientPrepareError:
+                checked = False
+                cacheable = False
+            if checked:
+                record_stat(PREFILTERED_FILES_STAT)
+            else:
+                feature_results = self._find_code_repr_features(None, features)
+        return {feature_name: feature_results[feature_name] for feature_name in features}, cacheable
+
+    def analyze_code(self, repo: Repo, code_key: str, features: Sequence[str], *,
+                     blob_sha: Optional[str] = None) -> Code:
+        """Produces a [Code][codesurvey.analyzers.Code] analysis for a single
+        source-code file within a Repo.
+
+        Args:
+            repo: Repo containing the source-code to be analyzed.
+            code_key: Relative path of the file within the Repo.
+            features: Names of features to include in the analysis.
+            blob_sha: SHA of the file's Git blob to record for the Code,
+                if known.
+
+        """
+        if self.cache is None and not self.use_prefilters:
+            code = super().analyze_code(repo=repo, code_key=code_key, features=features)
+            return replace(code, blob_sha=blob_sha) if blob_sha is not None else code
+
+        file_info = FileInfo(repo=repo, rel_path=code_key)
+        if self.cache is None:
+            feature_results, _ = self._find_file_features(file_info, features)
+            return self.code(
                 repo=repo,
-                rel_path=os.path.relpath(abs_path, start=repo.path),
+                key=code_key,
+                features=feature_results,
+                stats=pop_stats(),
+                blob_sha=blob_sha,
             )
+
+        content_hash = get_content_hash(file_info.content)
+        # Features whose FeatureFinders cannot be fingerprinted are
+        # not cached.
+        fingerprints = {}
+        for feature_name in features:
+            fingerprint = self._get_fingerprint(feature_name)
+            if fingerprint is not None:
+                fingerprints[feature_name] = fingerprint
+        feature_results = self.cache.get(content_hash, fingerprints)
+        missing_features = [feature_name for feature_name in features if feature_name not in feature_results]
+        if missing_features:
+            missing_results, cacheable = self._find_file_features(file_info, missing_features)
+            if cacheable:
+                self.cache.put(content_hash, {
+                    fingerprints[feature_name]: feature
+                    for feature_name, feature in missing_results.items()
+                    if feature_name in fingerprints
+                })
+            feature_results.update(missing_results)
+        return self.code(
+            repo=repo,
+            key=code_key,
+            features={feature_name: feature_results[feature_name] for feature_name in features},
+            stats=pop_stats(),
+            blob_sha=blob_sha,
+        )
+
+    def _is_dir_filtered_out(self, repo: Repo, rel_path: str) -> bool:
+        dir_info = FileInfo(repo=repo, rel_path=rel_path)
+        return any(dir_filter(dir_info) for dir_filter in self.dir_filters)
+
+    def _get_file_infos(self, repo: Repo) -> Iterator[FileInfo]:
+        """Generator yielding FileInfos for the files within the given Repo
+        that match the file_glob, applying configured file_filters and
+        dir_filters.
+
+        Files of Git-backed Repos are found from the Git index if
+        use_git_index is enabled. Otherwise, directories excluded by
+        dir_filters, and directories that cannot contain files matching
+        the file_glob, are not scanned. Symlinks to directories are
+        followed, except for symlink loops.
+
+        """
+        exclude_dir = partial(self._is_dir_filtered_out, repo) if self.dir_filters else None
+        file_infos: Iterator[FileInfo]
+        git_files = None
+        if self.use_git_index and repo.source.git_backed:
+            try:
+                git_files = get_git_index_files(repo.path)
+            except SourceError as ex:
+                logger.warning(f'Scanning files of repo "{repo}" that could not be found from the Git index: {ex}')
+        if git_files is None:
+            file_infos = (
+                FileInfo(repo=repo, rel_path=rel_path)
+                for rel_path in iter_glob_files(repo.path, self.file_glob, exclude_dir=exclude_dir)
+            )
+        else:
+            file_infos = (
+                FileInfo(repo=repo, rel_path=git_path.replace('/', os.sep), git_blob_sha=git_files[git_path])
+                for git_path in filter_glob_paths(git_files.keys(), self.file_glob, exclude_dir=exclude_dir)
+                # Only symlinks that link to files are analyzed.
+                if git_files[git_path] is not None or os.path.isfile(os.path.join(repo.path, git_path))
+            )
+        for file_info in file_infos:
             filtered_out = any([
                 file_filter(file_info)
                 for file_filter in self.file_filters
             ])
             if filtered_out:
                 continue
+            yield file_info
+
+    def _get_file_keys(self, repo: Repo) -> Iterator[str]:
+        """Generator yielding the code_keys (relative file paths) within the
+        given Repo, applying configured file_filters and dir_filters."""
+        for file_info in self._get_file_infos(repo):
             yield file_info.rel_path
 
     def code_generator(self, repo: Repo, *,
                        get_code_features: Callable[[str], Sequence[str]]) -> Iterator[CodeThunk]:
-        for file_key in self._get_file_keys(repo):
+        for file_info in self._get_file_infos(repo):
+            file_key = file_info.rel_path
             features = get_code_features(file_key)
             if len(features) == 0:
                 continue
@@ -260,7 +545,9 @@ class FileAnalyzer(Analyzer[CodeReprT]):
                 repo=repo,
                 key=file_key,
                 features=features,
-                thunk=partial(self.analyze_code, repo=repo, code_key=file_key, features=features),
+                thunk=partial(self.analyze_code, repo=repo, code_key=file_key, features=features,
+                              blob_sha=file_info.git_blob_sha),
+                blob_sha=file_info.git_blob_sha,
             )
 
     def test(self, code_snippet: str, *, test_filename: str = 'test_file.txt') -> Dict[str, Feature]:
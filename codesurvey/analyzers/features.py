@@ -1,6 +1,7 @@
 from dataclasses import dataclass, field
 from functools import wraps
-from typing import cast, Any, Callable, Dict, Generic, Mapping, Protocol, Sequence, TypeVar, Union
+import re
+from typing import cast, Any, Callable, Dict, Generic, Mapping, Optional, Pattern, Protocol, Sequence, TypeVar, Union
 
 
 @dataclass
@@ -43,6 +44,45 @@ class FeatureFinder(Protocol, Generic[CodeReprInputT]):
         pass
 
 
+def compile_prefilter(prefilter: Union[None, str, Pattern[str]]) -> Optional[Pattern[str]]:
+    """Returns the given prefilter as a compiled regular expression."""
+    if prefilter is None:
+        return None
+    return re.compile(prefilter)
+
+
+def get_prefilter(feature_finder: object) -> Optional[Pattern[str]]:
+    """Returns the prefilter of the given FeatureFinder, or `None` if it
+    does not declare a prefilter.
+
+    A prefilter is a regular expression that must be found in the text
+    of a source-code file for the feature to occur in the file. If
+    [`FileAnalyzer.use_prefilters`][codesurvey.analyzers.FileAnalyzer.__init__]
+    is enabled, the FeatureFinder is not applied to files whose text
+    does not match its prefilter.
+
+    """
+    return getattr(feature_finder, 'prefilter', None)
+
+
+def union_prefilter(feature_finders: Sequence[object]) -> Optional[Pattern[str]]:
+    """Returns a prefilter matching any text that matches the prefilter
+    of one of the given `feature_finders`, or `None` if any of the
+    `feature_finders` does not declare a prefilter."""
+    prefilters = [get_prefilter(finder) for finder in feature_finders]
+    if len(prefilters) == 0:
+        return None
+    flags = {prefilter.flags for prefilter in prefilters if prefilter is not None}
+    # Prefilters with different flags cannot be combined into a
+    # single pattern.
+    if None in prefilters or len(flags) != 1:
+        return None
+    return re.compile(
+        '|'.join(f'(?:{prefilter.pattern})' for prefilter in prefilters if prefilter is not None),
+        flags.pop(),
+    )
+
+
 def _normalize_feature(*, name: str, feature: Union[Feature, FeatureDict]) -> Feature:
     """Helper for producing a named Feature result from a given Feature or
     FeatureDict.
@@ -69,9 +109,16 @@ def _normalize_feature(*, name: str, feature: Union[Feature, FeatureDict]) -> Fe
 FeatureFinderFunction = Callable[[CodeReprT], Union[Feature, FeatureDict]]
 
 
-def feature_finder(name: str) -> Callable[[FeatureFinderFunction[CodeReprT]], FeatureFinder[CodeReprT]]:
+def feature_finder(name: str, *,
+                   prefilter: Optional[str] = None) -> Callable[[FeatureFinderFunction[CodeReprT]], FeatureFinder[CodeReprT]]:
     """Decorator for defining a named `FeatureFinder`.
 
+    An optional `prefilter` regular expression can be given that must
+    be found in the text of a source-code file for the feature to
+    occur in the file (e.g. `':='` for walrus operators), so that
+    FileAnalyzers with `use_prefilters` enabled can avoid parsing files
+    that cannot contain any of the features being analyzed.
+
     Example usage:
 
     ```python
@@ -98,6 +145,7 @@ def feature_finder(name: str) -> Callable[[FeatureFinderFunction[CodeReprT]], Fe
 
         wrapped_feature_finder = cast(FeatureFinder[CodeReprT], decorated)
         wrapped_feature_finder.name = name
+        setattr(wrapped_feature_finder, 'prefilter', compile_prefilter(prefilter))
         return wrapped_feature_finder
 
     return decorator
@@ -105,11 +153,13 @@ def feature_finder(name: str) -> Callable[[FeatureFinderFunction[CodeReprT]], Fe
 
 class PartialFeatureFinder(Generic[CodeReprT]):
 
-    def __init__(self, name: str, feature_finder_function: FeatureFinderFunction[CodeReprT], args: Sequence, kwargs: Mapping):
+    def __init__(self, name: str, feature_finder_function: Callable[..., Union[Feature, FeatureDict]], args: Sequence, kwargs: Mapping, *,
+                 prefilter: Union[None, str, Pattern[str]] = None):
         self.name = name
         self.feature_finder_function = feature_finder_function
         self.args = args
         self.kwargs = kwargs
+        self.prefilter = compile_prefilter(prefilter)
 
     def __call__(self, *args, **kwargs):
         keywords = {**self.kwargs, **kwargs}
@@ -166,5 +216,14 @@ def union_feature_finder(name: str, feature_finders: Sequence[FeatureFinder[Code
     has_loop = union_feature_finder('loop', [has_for_loop, has_while_loop])
     ```
 
+    If all `feature_finders` declare prefilters, the union's prefilter
+    matches wherever any of their prefilters match.
+
     """
-    return partial_feature_finder(name, _union_feature_finder, feature_finders=feature_finders)
+    return PartialFeatureFinder(
+        name=name,
+        feature_finder_function=_union_feature_finder,
+        args=(),
+        kwargs=dict(feature_finders=feature_finders),
+        prefilter=union_prefilter(feature_finders),
+    )
@@ -1,9 +1,24 @@
-from .core import PythonAstAnalyzer
+from .core import (
+    PythonAstAnalyzer, PythonNativeAstAnalyzer,
+    node_modules_dir_filter, py_site_packages_dir_filter, py_virtualenv_dir_filter,
+)
 from .features import py_ast_feature_finder, py_module_feature_finder, py_ast_feature_finder_with_transform
+from .native_features import (
+    py_node_feature_finder, py_node_feature_finder_with_transform,
+    py_node_module_feature_finder, py_node_union_feature_finder,
+)
 
 __all__ = [
     'PythonAstAnalyzer',
+    'PythonNativeAstAnalyzer',
     'py_ast_feature_finder',
     'py_ast_feature_finder_with_transform',
     'py_module_feature_finder',
+    'py_node_feature_finder',
+    'py_node_feature_finder_with_transform',
+    'py_node_module_feature_finder',
+    'py_node_union_feature_finder',
+    'py_site_packages_dir_filter',
+    'py_virtualenv_dir_filter',
+    'node_modules_dir_filter',
 ]
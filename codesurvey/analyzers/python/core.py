@@ -1,13 +1,15 @@
 import ast
-from multiprocessing import Process, Queue
+import os.path
 import re
-from typing import Optional
+from typing import Callable, Dict, Optional, Sequence, Tuple
 
-import astpath
 from lxml.etree import Element
 
-from codesurvey.analyzers import FileAnalyzer, FileInfo
+from codesurvey.analyzers import Feature, FeatureCache, FeatureFinder, FileAnalyzer, FileInfo, TransientPrepareError
 from codesurvey.utils import logger
+from .features import convert_to_xml
+from .native_features import NodeFeatureDispatcher, PyNodeFeatureFinder, PyNodeUnionFeatureFinder
+from .parser import ParserCrashError, get_ast_parser
 
 SITE_PACKAGES_REGEX = re.compile(r'.*[/\\]site-packages[/\\].*')
 
@@ -17,6 +19,70 @@ def py_site_packages_filter(file_info):
     return SITE_PACKAGES_REGEX.fullmatch(file_info.rel_path)
 
 
+SITE_PACKAGES_DIR_REGEX = re.compile(r'.*[/\\]site-packages')
+
+
+def py_site_packages_dir_filter(dir_info):
+    """Filter to exclude `site-packages` directories."""
+    return SITE_PACKAGES_DIR_REGEX.fullmatch(dir_info.rel_path)
+
+
+def py_virtualenv_dir_filter(dir_info):
+    """Filter to exclude Python virtual environment directories (which
+    contain a `pyvenv.cfg` file)."""
+    return os.path.isfile(os.path.join(dir_info.abs_path, 'pyvenv.cfg'))
+
+
+def node_modules_dir_filter(dir_info):
+    """Filter to exclude `node_modules` directories of Node.js packages."""
+    return os.path.basename(dir_info.rel_path) == 'node_modules'
+
+
+def parse_python_file(file_info: FileInfo) -> Optional[ast.AST]:
+    """Parses the given Python file into an AST, or returns `None` if it
+    cannot be parsed.
+
+    Raises:
+        TransientPrepareError: The parser process crashed while parsing
+            the file, so it might be parsed in a later run.
+
+    """
+    file_text = file_info.text
+
+    # Parse ast in a persistent helper process, as sufficiently
+    # complex files can crash the interpreter:
+    # https://docs.python.org/3/library/ast.html#ast.parse
+    try:
+        return get_ast_parser().parse(file_text)
+    except (SyntaxError, ValueError, ParserCrashError) as ex:
+        _handle_parse_error(file_info, ex)
+        return None
+
+
+def check_python_file(file_info: FileInfo) -> bool:
+    """Returns whether the given Python file can be parsed, without the
+    cost of returning its AST from the parser process.
+
+    Raises:
+        TransientPrepareError: The parser process crashed while parsing
+            the file, so it might be parsed in a later run.
+
+    """
+    try:
+        get_ast_parser().check(file_info.text)
+    except (SyntaxError, ValueError, ParserCrashError) as ex:
+        _handle_parse_error(file_info, ex)
+        return False
+    return True
+
+
+def _handle_parse_error(file_info: FileInfo, ex: Exception) -> None:
+    logger.error((f'Skipping Python file "{file_info.rel_path}" in '
+                  f'repo "{file_info.repo}" that could not be parsed: {ex}'))
+    if isinstance(ex, ParserCrashError):
+        raise TransientPrepareError(str(ex)) from ex
+
+
 class PythonAstAnalyzer(FileAnalyzer[Element]):
     """Analyzer that finds .py files and parses them into lxml documents
     representing Python abstract syntax trees for feature analysis."""
@@ -27,38 +93,143 @@ class PythonAstAnalyzer(FileAnalyzer[Element]):
     ]
     """Excludes files under a `site-packages` directory that are unlikely
     to belong to the Repo under analysis."""
-
-    def _subprocess_parse_ast(self, *, queue: Queue, file_text: str):
-        try:
-            file_tree = ast.parse(file_text)
-        except Exception as ex:
-            queue.put(ex)
-        else:
-            queue.put(file_tree)
+    default_dir_filters = [
+        py_site_packages_dir_filter,
+    ]
+    """Skips scanning `site-packages` directories, whose files are
+    excluded by the default file_filters. `py_virtualenv_dir_filter` and
+    `node_modules_dir_filter` can also be given as dir_filters to exclude
+    virtual environment and `node_modules` directories."""
 
     def prepare_file(self, file_info: FileInfo) -> Optional[Element]:
-        with open(file_info.abs_path, 'r') as f:
-            file_text = f.read()
-
-        # Parse ast in a subprocess, as sufficiently complex files can
-        # crash the interpreter:
-        # https://docs.python.org/3/library/ast.html#ast.parse
-        queue: Queue = Queue()
-        process = Process(target=self._subprocess_parse_ast, kwargs=dict(
-            queue=queue,
-            file_text=file_text,
-        ))
-        try:
-            process.start()
-            result = queue.get()
-            process.join()
-            if isinstance(result, Exception):
-                raise result
-        except (SyntaxError, ValueError) as ex:
-            logger.error((f'Skipping Python file "{file_info.rel_path}" in '
-                          f'repo "{file_info.repo}" that could not be parsed: {ex}'))
+        file_tree = parse_python_file(file_info)
+        if file_tree is None:
             return None
-
-        file_tree = result
-        file_xml = astpath.convert_to_xml(file_tree)
+        file_xml = convert_to_xml(file_tree)
         return file_xml
+
+    def check_file(self, file_info: FileInfo) -> bool:
+        return check_python_file(file_info)
+
+
+class PythonNativeAstAnalyzer(FileAnalyzer[Optional[ast.AST]]):
+    """Analyzer that finds .py files and parses them into Python abstract
+    syntax trees for feature analysis.
+
+    Unlike `PythonAstAnalyzer`, FeatureFinders receive `ast.AST`
+    trees directly, avoiding the cost of converting each tree into an
+    lxml document. Use FeatureFinders from
+    `codesurvey.analyzers.python.native_features`.
+
+    """
+    default_name = 'python_native'
+    default_file_glob = '**/*.py'
+    default_file_filters = [
+        py_site_packages_filter,
+    ]
+    """Excludes files under a `site-packages` directory that are unlikely
+    to belong to the Repo under analysis."""
+    default_dir_filters = [
+        py_site_packages_dir_filter,
+    ]
+    """Skips scanning `site-packages` directories, whose files are
+    excluded by the default file_filters. `py_virtualenv_dir_filter` and
+    `node_modules_dir_filter` can also be given as dir_filters to exclude
+    virtual environment and `node_modules` directories."""
+
+    def __init__(self, feature_finders: Sequence[FeatureFinder], *,
+                 file_glob: Optional[str] = None,
+                 file_filters: Optional[Sequence[Callable[[FileInfo], bool]]] = None,
+                 dir_filters: Optional[Sequence[Callable[[FileInfo], bool]]] = None,
+                 name: Optional[str] = None,
+                 cache: Optional[FeatureCache] = None,
+                 use_prefilters: bool = False,
+                 single_pass: bool = True):
+        """
+        Args:
+            feature_finders:
+                The [FeatureFinders][codesurvey.analyzers.FeatureFinder]
+                for analyzing each source-code file.
+            file_glob: Glob pattern for finding source-code files within
+                the Repo.
+            file_filters: Filters to identify files to exclude from analysis.
+                Each filter is a function that takes a
+                [`FileInfo`][codesurvey.analyzers.FileInfo] and
+                returns `True` if the file should be excluded. file_filters
+                cannot be lambdas, as they need to be pickled when passed to
+                sub-processes.
+            dir_filters: Filters to identify directories to exclude from
+                analysis. Each filter is a function that takes a
+                [`FileInfo`][codesurvey.analyzers.FileInfo] for a
+                directory and returns `True` if no files within the
+                directory should be analyzed, so that the directory does
+                not need to be scanned. dir_filters cannot be lambdas.
+            name: Name to identify the Analyzer. If `None`, defaults to the
+                Analyzer type's default_name.
+            cache: An optional [`FeatureCache`][codesurvey.analyzers.FeatureCache]
+                to retrieve and store the Feature results of files by their
+                content, so that files with identical content are only
+                analyzed once.
+            use_prefilters: If `True`, features are not analyzed for files
+                whose text does not match the prefilter of their
+                FeatureFinder, and such files are not parsed at all if none
+                of the analyzed features' prefilters match. Such features
+                are given a result with no occurrences, even for files with
+                syntax errors, where an ignored result would otherwise be
+                given.
+            single_pass: If `True` (the default), all py_node
+                FeatureFinders are evaluated together in a single walk of
+                each file's tree, with each node only dispatched to the
+                FeatureFinders that look for its node type. If `False`,
+                each FeatureFinder walks the tree separately. Other
+                FeatureFinders are always applied separately.
+
+        """
+        super().__init__(
+            feature_finders=feature_finders,
+            file_glob=file_glob,
+            file_filters=file_filters,
+            dir_filters=dir_filters,
+            name=name,
+            cache=cache,
+            use_prefilters=use_prefilters,
+        )
+        self.single_pass = single_pass
+        self._dispatchers: Dict[Tuple[str, ...], NodeFeatureDispatcher] = {}
+
+    def prepare_file(self, file_info: FileInfo) -> Optional[ast.AST]:
+        return parse_python_file(file_info)
+
+    def check_file(self, file_info: FileInfo) -> bool:
+        return check_python_file(file_info)
+
+    def _get_dispatcher(self, feature_names: Tuple[str, ...]) -> NodeFeatureDispatcher:
+        """Returns a NodeFeatureDispatcher for the given features, which are
+        compiled once and re-used for every file."""
+        dispatcher = self._dispatchers.get(feature_names)
+        if dispatcher is None:
+            finders = [self.feature_finders[feature_name] for feature_name in feature_names]
+            dispatcher = NodeFeatureDispatcher(finders)  # type: ignore[arg-type]
+            self._dispatchers[feature_names] = dispatcher
+        return dispatcher
+
+    def find_features(self, code_repr: Optional[ast.AST], features: Sequence[str]) -> Dict[str, Feature]:
+        if not self.single_pass:
+            return super().find_features(code_repr, features)
+
+        node_finder_types: Tuple[type, ...] = (PyNodeFeatureFinder, PyNodeUnionFeatureFinder)
+        node_feature_names = tuple(
+            feature_name for feature_name in features
+            if isinstance(self.feature_finders[feature_name], node_finder_types)
+        )
+        other_feature_names = [
+            feature_name for feature_name in features
+            if feature_name not in node_feature_names
+        ]
+        feature_results: Dict[str, Feature] = {}
+        if node_feature_names:
+            dispatcher = self._get_dispatcher(node_feature_names)
+            feature_results.update(zip(node_feature_names, dispatcher(code_repr)))
+        feature_results.update(super().find_features(code_repr, other_feature_names))
+        # Preserve the requested order of features.
+        return {feature_name: feature_results[feature_name] for feature_name in features}
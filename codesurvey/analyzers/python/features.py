@@ -1,20 +1,141 @@
-from functools import wraps
-from typing import Callable, Optional, Sequence
+import ast
+import codecs
+import re
+from functools import lru_cache, wraps
+from numbers import Number
+from typing import Any, Callable, Optional, Sequence, Tuple
 
 import lxml.etree
 
 from codesurvey.analyzers import (
     FeatureDict, FeatureFinder,
-    feature_finder, partial_feature_finder, union_feature_finder,
+    feature_finder, union_feature_finder,
 )
+from codesurvey.analyzers.features import PartialFeatureFinder
 
 
 ElementTransform = Callable[[lxml.etree.Element], Optional[lxml.etree.Element]]
 
 
+@lru_cache(maxsize=None)
+def compile_xpath(path: str) -> lxml.etree.XPath:
+    """Returns a compiled `lxml.etree.XPath` for the given path.
+
+    Each path is only compiled once per process, so that the
+    expression does not need to be re-parsed for every file.
+    FeatureFinders store their paths as strings rather than compiled
+    XPaths, as compiled XPaths cannot be pickled when passed to
+    sub-processes.
+
+    """
+    return lxml.etree.XPath(path)
+
+
+_LINE_NUMBERS_XPATH = lxml.etree.XPath('descendant-or-self::*[@lineno]/@lineno')
+_IMPORT_XPATH = lxml.etree.XPath('descendant-or-self::Import')
+_IMPORT_ALIAS_XPATH = lxml.etree.XPath('names/alias')
+_IMPORT_FROM_XPATH = lxml.etree.XPath('descendant-or-self::ImportFrom')
+
+
+# Documents created by convert_to_xml() are marked by their URL, which
+# is not part of the element tree itself.
+_LINE_INDEX_DOCUMENT_URL = 'codesurvey:line-index'
+# Line numbers are stored in each element's otherwise unused
+# sourceline, which is limited to an unsigned short.
+_MAX_INDEXED_LINE_NUMBER = 65535
+
+
+def _encode_literal(literal: Any) -> bytes:
+    if isinstance(literal, Number):
+        literal = str(literal)
+    return codecs.encode(literal, 'ascii', 'xmlcharrefreplace')
+
+
+def _set_literal_attribute(element: lxml.etree.Element, name: str, literal: Any) -> None:
+    try:
+        element.set(name, _encode_literal(literal))
+    except Exception:
+        # E.g. a null byte.
+        element.set(name, '')
+
+
+def _set_literal_text(element: lxml.etree.Element, literal: Any) -> None:
+    try:
+        element.text = _encode_literal(literal)
+    except Exception:
+        # E.g. a null byte.
+        element.text = ''
+
+
+def _set_first_line_number(element: lxml.etree.Element, line_no: Optional[int]) -> None:
+    if line_no is not None and line_no <= _MAX_INDEXED_LINE_NUMBER:
+        element.sourceline = line_no
+
+
+def _convert_to_xml(node: ast.AST) -> Tuple[lxml.etree.Element, Optional[int]]:
+    """Converts the node to an element, returning it along with the
+    earliest line number within the node."""
+    xml_node = lxml.etree.Element(node.__class__.__name__)
+    first_line_no = getattr(node, 'lineno', None)
+    for attr in ('lineno', 'col_offset'):
+        value = getattr(node, attr, None)
+        if value is not None:
+            xml_node.set(attr, str(value))
+
+    for field_name in node._fields:
+        field_value = getattr(node, field_name)
+        if isinstance(field_value, ast.AST):
+            field = lxml.etree.SubElement(xml_node, field_name)
+            child, field_line_no = _convert_to_xml(field_value)
+            field.append(child)
+        elif isinstance(field_value, list):
+            field = lxml.etree.SubElement(xml_node, field_name)
+            field_line_no = None
+            for item in field_value:
+                if isinstance(item, ast.AST):
+                    child, child_line_no = _convert_to_xml(item)
+                    field.append(child)
+                    if child_line_no is not None and (field_line_no is None or child_line_no < field_line_no):
+                        field_line_no = child_line_no
+                else:
+                    _set_literal_text(lxml.etree.SubElement(field, 'item'), item)
+        else:
+            if field_value is not None:
+                _set_literal_attribute(xml_node, 'type', type(field_value).__name__)
+                _set_literal_attribute(xml_node, field_name, field_value)
+            continue
+        _set_first_line_number(field, field_line_no)
+        if field_line_no is not None and (first_line_no is None or field_line_no < first_line_no):
+            first_line_no = field_line_no
+
+    _set_first_line_number(xml_node, first_line_no)
+    return xml_node, first_line_no
+
+
+def convert_to_xml(tree: ast.AST) -> lxml.etree.Element:
+    """Converts a Python AST into an lxml document with the same
+    structure as `astpath.convert_to_xml()`.
+
+    The earliest line number of each element (including those of its
+    descendents) is recorded while converting the tree, so that it
+    can be looked up by `get_first_line_number()` in constant time
+    instead of scanning the descendents of each matched element.
+
+    """
+    xml, _ = _convert_to_xml(tree)
+    xml.getroottree().docinfo.URL = _LINE_INDEX_DOCUMENT_URL
+    return xml
+
+
 def get_first_line_number(element: lxml.etree.Element) -> Optional[int]:
     """Returns the earliest line number of an element of any of its descendents."""
-    line_no_strs = set(element.xpath('descendant-or-self::*[@lineno]/@lineno'))
+    sourceline = element.sourceline
+    if sourceline is not None and element.getroottree().docinfo.URL == _LINE_INDEX_DOCUMENT_URL:
+        return sourceline
+    # Fallback to scanning the descendents of elements from documents
+    # that were not created with convert_to_xml(), or of elements
+    # without indexed line numbers.
+    line_no_strs = set(_LINE_NUMBERS_XPATH(element))
     if len(line_no_strs) == 0:
         return None
     return min(map(int, line_no_strs))
@@ -22,7 +143,7 @@ def get_first_line_number(element: lxml.etree.Element) -> Optional[int]:
 
 def _py_ast_feature_finder(xml: lxml.etree.Element, *, xpath: str,
                            transform: Optional[ElementTransform] = None) -> FeatureDict:
-    elements = xml.xpath(f'descendant-or-self::{xpath}')
+    elements = compile_xpath(f'descendant-or-self::{xpath}')(xml)
     if transform is not None:
         elements = [el for el in map(transform, elements) if el is not None]
     return dict(
@@ -33,19 +154,30 @@ def _py_ast_feature_finder(xml: lxml.etree.Element, *, xpath: str,
     )
 
 
-def py_ast_feature_finder(name: str, *, xpath: str) -> FeatureFinder[lxml.etree.Element]:
+def py_ast_feature_finder(name: str, *, xpath: str, prefilter: Optional[str] = None) -> FeatureFinder[lxml.etree.Element]:
     """Defines a FeatureFinder that looks for elements in a Python AST
     matching the given xpath query.
 
+    An optional `prefilter` regular expression can be given that must
+    be found in the text of a file for the feature to occur in it (see
+    [`feature_finder()`][codesurvey.analyzers.feature_finder]).
+
     To explore the AST structure of the code constructs you are
     interested in identifying, consider using a tool like:
     https://python-ast-explorer.com/
 
     """
-    return partial_feature_finder(name, _py_ast_feature_finder, xpath=xpath)
+    return PartialFeatureFinder(
+        name=name,
+        feature_finder_function=_py_ast_feature_finder,
+        args=(),
+        kwargs=dict(xpath=xpath),
+        prefilter=prefilter,
+    )
 
 
-def py_ast_feature_finder_with_transform(name: str, *, xpath: str) -> Callable[[ElementTransform], FeatureFinder[lxml.etree.Element]]:
+def py_ast_feature_finder_with_transform(name: str, *, xpath: str,
+                                         prefilter: Optional[str] = None) -> Callable[[ElementTransform], FeatureFinder[lxml.etree.Element]]:
     """Decorator for defining a FeatureFinder that looks for elements in a
     Python AST matching the given xpath query, transforming found elements
     with decorated function.
@@ -54,6 +186,10 @@ def py_ast_feature_finder_with_transform(name: str, *, xpath: str) -> Callable[[
     return `None` if the element should not be considered an
     occurrence of the feature.
 
+    An optional `prefilter` regular expression can be given that must
+    be found in the text of a file for the feature to occur in it (see
+    [`feature_finder()`][codesurvey.analyzers.feature_finder]).
+
     Example usage to look for function calls where the function name
     is 'set':
 
@@ -74,7 +210,7 @@ def py_ast_feature_finder_with_transform(name: str, *, xpath: str) -> Callable[[
     def decorator(func: ElementTransform) -> FeatureFinder[lxml.etree.Element]:
 
         @wraps(func)
-        @feature_finder(name)
+        @feature_finder(name, prefilter=prefilter)
         def decorated(xml):
             return _py_ast_feature_finder(xml, xpath=xpath, transform=func)
 
@@ -87,15 +223,15 @@ def _py_module_feature_finder(xml: lxml.etree.Element, *, modules: Sequence[str]
     matched_els = []
 
     # import syntax
-    import_els = xml.xpath('descendant-or-self::Import')
+    import_els = _IMPORT_XPATH(xml)
     for import_el in import_els:
-        indiv_import_els = import_el.xpath('names/alias')
+        indiv_import_els = _IMPORT_ALIAS_XPATH(import_el)
         for indiv_import_el in indiv_import_els:
             module = indiv_import_el.get('name')
             if module and any([module.startswith(target_module) for target_module in modules]):
                 matched_els.append(indiv_import_el)
     # from syntax
-    from_els = xml.xpath('descendant-or-self::ImportFrom')
+    from_els = _IMPORT_FROM_XPATH(xml)
     for from_el in from_els:
         module = from_el.get('module')
         if module and any([module.startswith(target_module) for target_module in modules]):
@@ -109,6 +245,17 @@ def _py_module_feature_finder(xml: lxml.etree.Element, *, modules: Sequence[str]
     )
 
 
+def get_module_prefilter(modules: Sequence[str]) -> str:
+    """Returns a prefilter for imports of the given target modules.
+
+    Only the first component of each module is required, as the
+    components of an imported module name may be separated by
+    whitespace (e.g. `import os . path`).
+
+    """
+    return '|'.join(re.escape(module.split('.')[0]) for module in modules)
+
+
 def py_module_feature_finder(name: str, *, modules: Sequence[str]) -> FeatureFinder:
     """Defines a FeatureFinder that looks for import statements of one or
     more target Python `modules`.
@@ -120,13 +267,23 @@ def py_module_feature_finder(name: str, *, modules: Sequence[str]) -> FeatureFin
     ```
 
     """
-    return partial_feature_finder(name, _py_module_feature_finder, modules=modules)
+    return PartialFeatureFinder(
+        name=name,
+        feature_finder_function=_py_module_feature_finder,
+        args=(),
+        kwargs=dict(modules=modules),
+        prefilter=get_module_prefilter(modules),
+    )
 
 
 # ==== Python AST Feature Finders ====
 
+# String prefixes of f-strings.
+FSTRING_PREFILTER = r'''(?i:\b(?:f|fr|rf)['"])'''
+
+
 # https://docs.python.org/3/library/ast.html#ast.Try
-@py_ast_feature_finder_with_transform('for_else', xpath='For/orelse')
+@py_ast_feature_finder_with_transform('for_else', xpath='For/orelse', prefilter=r'\belse\b')
 def has_for_else(orelse_el):
     """FeatureFinder for else clauses in for loops."""
     if len(orelse_el) == 0:
@@ -135,7 +292,7 @@ def has_for_else(orelse_el):
 
 
 # https://docs.python.org/3/library/ast.html#ast.Try
-@py_ast_feature_finder_with_transform('try_finally', xpath='Try/finalbody')
+@py_ast_feature_finder_with_transform('try_finally', xpath='Try/finalbody', prefilter=r'\bfinally\b')
 def has_try_finally(finalbody_el):
     """FeatureFinder for finally clauses in try statements."""
     if len(finalbody_el) == 0:
@@ -147,9 +304,10 @@ def has_try_finally(finalbody_el):
 @py_ast_feature_finder_with_transform('type_hint', xpath='FunctionDef/args/arguments//annotation')
 def has_type_hint(annotation_el):
     """FeatureFinder for type hints."""
-    if annotation_el.get('*') is not None:
-        return annotation_el
-    return None
+    # Annotation elements are only present for annotated arguments.
+    if len(annotation_el) == 0:
+        return None
+    return annotation_el
 
 
 # The set function
@@ -171,18 +329,18 @@ has_set = union_feature_finder('set', [has_set_function, has_set_value])
 
 # Node representing a single formatting field in an f-string.
 # https://docs.python.org/3/library/ast.html#ast.FormattedValue
-has_fstring = py_ast_feature_finder('fstring', xpath='FormattedValue')
+has_fstring = py_ast_feature_finder('fstring', xpath='FormattedValue', prefilter=FSTRING_PREFILTER)
 """FeatureFinder for f-strings."""
 
 # E.g. `if b else c`
 # https://docs.python.org/3/library/ast.html#ast.IfExp
-has_ternary = py_ast_feature_finder('ternary', xpath='IfExp')
+has_ternary = py_ast_feature_finder('ternary', xpath='IfExp', prefilter=r'\belse\b')
 """FeatureFinder for ternary expressions."""
 
 # https://docs.python.org/3/library/ast.html#ast.Match
-has_pattern_matching = py_ast_feature_finder('pattern_matching', xpath='Match')
+has_pattern_matching = py_ast_feature_finder('pattern_matching', xpath='Match', prefilter=r'\bmatch\b')
 """FeatureFinder for pattern matching."""
 
 # https://docs.python.org/3/library/ast.html#ast.NamedExpr
-has_walrus = py_ast_feature_finder('walrus', xpath='NamedExpr')
+has_walrus = py_ast_feature_finder('walrus', xpath='NamedExpr', prefilter=':=')
 """FeatureFinder for the walrus operator."""
@@ -0,0 +1,432 @@
+import ast
+from functools import partial, update_wrapper
+from typing import Callable, Dict, Iterator, List, Optional, Pattern, Sequence, Type, Union
+
+from codesurvey.analyzers import Feature
+from codesurvey.analyzers.features import compile_prefilter, union_prefilter
+from .features import FSTRING_PREFILTER, get_module_prefilter
+
+
+NodeTransform = Callable[[ast.AST], Union[None, ast.AST, Sequence[ast.AST]]]
+
+
+def iter_nodes(node: ast.AST) -> Iterator[ast.AST]:
+    """Yields the given node and all of its descendents in depth-first
+    pre-order.
+
+    Child nodes are visited in the order of their node's fields, which
+    is the same order as elements in the lxml documents used by
+    `PythonAstAnalyzer`.
+
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(list(ast.iter_child_nodes(node))))
+
+
+def get_node_first_line_number(node: ast.AST) -> Optional[int]:
+    """Returns the earliest line number of a node or any of its descendents."""
+    line_nos = [
+        line_no for line_no in (getattr(desc_node, 'lineno', None) for desc_node in iter_nodes(node))
+        if line_no is not None
+    ]
+    if len(line_nos) == 0:
+        return None
+    return min(line_nos)
+
+
+class PyNodeFeatureFinder:
+    """FeatureFinder that looks for nodes of the given types in a Python
+    AST, optionally transforming each found node into the node(s) that
+    locate its occurrences.
+
+    Create instances with
+    [`py_node_feature_finder()`][codesurvey.analyzers.python.py_node_feature_finder]
+    or
+    [`py_node_feature_finder_with_transform()`][codesurvey.analyzers.python.py_node_feature_finder_with_transform].
+
+    """
+
+    def __init__(self, name: str, *,
+                 node_types: Sequence[Type[ast.AST]],
+                 transform: Optional[NodeTransform] = None,
+                 prefilter: Union[None, str, Pattern[str]] = None):
+        self.name = name
+        self.node_types = tuple(node_types)
+        self.transform = transform
+        self.prefilter = compile_prefilter(prefilter)
+
+    @property
+    def parts(self) -> Sequence['PyNodeFeatureFinder']:
+        """The PyNodeFeatureFinders whose occurrences make up the
+        occurrences of this FeatureFinder."""
+        return [self]
+
+    def get_occurrence_nodes(self, node: ast.AST) -> Sequence[ast.AST]:
+        """Returns the nodes locating occurrences of the feature for a node
+        of one of the node_types."""
+        if self.transform is None:
+            return [node]
+        transformed = self.transform(node)
+        if transformed is None:
+            return []
+        if isinstance(transformed, ast.AST):
+            return [transformed]
+        return transformed
+
+    def __call__(self, tree: Optional[ast.AST]) -> Feature:
+        return _find_node_features(tree, [self])[0]
+
+    def __reduce_ex__(self, protocol):
+        # FeatureFinders created by decorating a module-level
+        # transform function replace that function in its module, so
+        # they must be pickled by reference.
+        if getattr(self, '__wrapped__', None) is not None:
+            return self.__qualname__
+        return super().__reduce_ex__(protocol)
+
+
+class PyNodeUnionFeatureFinder:
+    """FeatureFinder that returns the union of the occurrences of the
+    given PyNodeFeatureFinders.
+
+    Create instances with
+    [`py_node_union_feature_finder()`][codesurvey.analyzers.python.py_node_union_feature_finder].
+
+    """
+
+    def __init__(self, name: str, feature_finders: Sequence[Union[PyNodeFeatureFinder, 'PyNodeUnionFeatureFinder']], *,
+                 prefilter: Union[None, str, Pattern[str]] = None):
+        self.name = name
+        self.feature_finders = feature_finders
+        self.prefilter = union_prefilter(feature_finders) if prefilter is None else compile_prefilter(prefilter)
+
+    @property
+    def parts(self) -> Sequence[PyNodeFeatureFinder]:
+        """The PyNodeFeatureFinders whose occurrences make up the
+        occurrences of this FeatureFinder."""
+        return [part for finder in self.feature_finders for part in finder.parts]
+
+    def __call__(self, tree: Optional[ast.AST]) -> Feature:
+        return _find_node_features(tree, [self])[0]
+
+
+PyNodeFeatureFinderT = Union[PyNodeFeatureFinder, PyNodeUnionFeatureFinder]
+
+
+class _TreeIndex:
+    """Pre-order listing of the nodes in an AST, with the position and
+    first line number of each node's subtree."""
+
+    def __init__(self, tree: ast.AST):
+        self.tree = tree
+        self.nodes: List[ast.AST] = []
+        parent_indexes: List[int] = []
+        stack = [(tree, -1)]
+        while stack:
+            node, parent_index = stack.pop()
+            node_index = len(self.nodes)
+            self.nodes.append(node)
+            parent_indexes.append(parent_index)
+            stack.extend((child, node_index) for child in reversed(list(ast.iter_child_nodes(node))))
+
+        self.positions = {id(node): node_index for node_index, node in enumerate(self.nodes)}
+        # Propagate the earliest line number of each subtree up to its
+        # root in a single reverse pass.
+        self.first_line_numbers: List[Optional[int]] = [getattr(node, 'lineno', None) for node in self.nodes]
+        for node_index in range(len(self.nodes) - 1, 0, -1):
+            line_no = self.first_line_numbers[node_index]
+            parent_index = parent_indexes[node_index]
+            parent_line_no = self.first_line_numbers[parent_index]
+            if line_no is not None and (parent_line_no is None or line_no < parent_line_no):
+                self.first_line_numbers[parent_index] = line_no
+
+    def get_position(self, node: ast.AST) -> int:
+        """Returns the pre-order position of a node in the tree."""
+        return self.positions.get(id(node), len(self.nodes))
+
+    def get_first_line_number(self, node: ast.AST) -> Optional[int]:
+        """Returns the earliest line number of a node or any of its descendents."""
+        node_index = self.positions.get(id(node))
+        if node_index is None:
+            return get_node_first_line_number(node)
+        return self.first_line_numbers[node_index]
+
+
+_last_tree_index: Optional[_TreeIndex] = None
+
+
+def _get_tree_index(tree: ast.AST) -> _TreeIndex:
+    """Returns a _TreeIndex for the given tree, re-using the index of the
+    most recently indexed tree when FeatureFinders are applied to the
+    same tree in succession."""
+    global _last_tree_index
+    if _last_tree_index is None or _last_tree_index.tree is not tree:
+        _last_tree_index = _TreeIndex(tree)
+    return _last_tree_index
+
+
+class NodeFeatureDispatcher:
+    """Finds the Features of multiple PyNode FeatureFinders in a single
+    walk of an AST.
+
+    Each node is only dispatched to the FeatureFinders that look for
+    its node type, so the cost of analyzing a tree grows with the size
+    of the tree rather than with the size of the tree multiplied by the
+    number of FeatureFinders.
+
+    """
+
+    def __init__(self, finders: Sequence[PyNodeFeatureFinderT]):
+        self.finders = finders
+        self.parts = [part for finder in finders for part in finder.parts]
+        self._type_part_indexes: Dict[type, List[int]] = {}
+
+    def _get_part_indexes(self, node_type: type) -> List[int]:
+        """Returns the indexes of parts that look for the given node type."""
+        part_indexes = self._type_part_indexes.get(node_type)
+        if part_indexes is None:
+            part_indexes = [
+                part_index for part_index, part in enumerate(self.parts)
+                if issubclass(node_type, part.node_types)
+            ]
+            self._type_part_indexes[node_type] = part_indexes
+        return part_indexes
+
+    def __call__(self, tree: Optional[ast.AST]) -> List[Feature]:
+        """Returns the Features of each of the finders for the given tree."""
+        if tree is None:
+            return [Feature(name=finder.name, ignore=True) for finder in self.finders]
+
+        tree_index = _get_tree_index(tree)
+        part_nodes: List[List[ast.AST]] = [[] for _ in self.parts]
+        get_part_indexes = self._get_part_indexes
+        for node in tree_index.nodes:
+            for part_index in get_part_indexes(type(node)):
+                part_nodes[part_index].extend(self.parts[part_index].get_occurrence_nodes(node))
+        return _get_node_features(tree_index, self.finders, part_nodes)
+
+
+def _find_node_features(tree: Optional[ast.AST], finders: Sequence[PyNodeFeatureFinderT]) -> List[Feature]:
+    """Find the Features of all given finders in a single walk of the tree."""
+    return NodeFeatureDispatcher(finders)(tree)
+
+
+def _get_node_features(tree_index: _TreeIndex, finders: Sequence[PyNodeFeatureFinderT],
+                       part_nodes: Sequence[List[ast.AST]]) -> List[Feature]:
+    """Returns Features for the given finders, given the list of
+    occurrence nodes found for each of the finders' parts."""
+    features = []
+    part_index = 0
+    for finder in finders:
+        occurrences = []
+        for part, nodes in zip(finder.parts, part_nodes[part_index:part_index + len(finder.parts)]):
+            if part.transform is not None:
+                # Transformed nodes may not be found in the order they
+                # appear in the tree (e.g. nested try/finally blocks).
+                nodes = sorted(nodes, key=tree_index.get_position)
+            occurrences.extend([
+                {'first_line_number': tree_index.get_first_line_number(node)}
+                for node in nodes
+            ])
+        part_index += len(finder.parts)
+        features.append(Feature(name=finder.name, occurrences=occurrences))
+    return features
+
+
+def py_node_feature_finder(name: str, *, node_types: Sequence[Type[ast.AST]],
+                           prefilter: Optional[str] = None) -> PyNodeFeatureFinder:
+    """Defines a FeatureFinder that looks for nodes of the given
+    `node_types` in a Python AST.
+
+    An optional `prefilter` regular expression can be given that must
+    be found in the text of a file for the feature to occur in it (see
+    [`feature_finder()`][codesurvey.analyzers.feature_finder]).
+
+    Example usage:
+
+    ```python
+    has_set_value = py_node_feature_finder('set_value', node_types=[ast.Set])
+    ```
+
+    To explore the AST structure of the code constructs you are
+    interested in identifying, consider using a tool like:
+    https://python-ast-explorer.com/
+
+    """
+    return PyNodeFeatureFinder(name, node_types=node_types, prefilter=prefilter)
+
+
+def py_node_feature_finder_with_transform(name: str, *,
+                                          node_types: Sequence[Type[ast.AST]],
+                                          prefilter: Optional[str] = None) -> Callable[[NodeTransform], PyNodeFeatureFinder]:
+    """Decorator for defining a FeatureFinder that looks for nodes of the
+    given `node_types` in a Python AST, transforming found nodes with
+    the decorated function.
+
+    The function should receive an `ast.AST` node, and return either
+    the node (or another node) locating an occurrence of the feature,
+    a list of nodes locating multiple occurrences, or `None` if the node
+    is not an occurrence of the feature.
+
+    An optional `prefilter` regular expression can be given that must
+    be found in the text of a file for the feature to occur in it (see
+    [`feature_finder()`][codesurvey.analyzers.feature_finder]).
+
+    Example usage to look for function calls where the function name
+    is 'set':
+
+    ```python
+    @py_node_feature_finder_with_transform('set_function', node_types=[ast.Call])
+    def has_set_function(call_node):
+        if isinstance(call_node.func, ast.Name) and call_node.func.id == 'set':
+            return call_node.func
+        return None
+    ```
+
+    To explore the AST structure of the code constructs you are
+    interested in identifying, consider using a tool like:
+    https://python-ast-explorer.com/
+
+    """
+
+    def decorator(func: NodeTransform) -> PyNodeFeatureFinder:
+        finder = PyNodeFeatureFinder(name, node_types=node_types, transform=func, prefilter=prefilter)
+        update_wrapper(finder, func)
+        return finder
+
+    return decorator
+
+
+def py_node_union_feature_finder(name: str, feature_finders: Sequence[PyNodeFeatureFinderT]) -> PyNodeUnionFeatureFinder:
+    """Defines a FeatureFinder that returns the union of the occurrences
+    of the given `feature_finders`, which must have been defined with
+    the `py_node_*` functions.
+
+    Unlike
+    [`union_feature_finder()`][codesurvey.analyzers.union_feature_finder],
+    the occurrences of all `feature_finders` are found in a single walk
+    of the AST.
+
+    If all `feature_finders` declare prefilters, the union's prefilter
+    matches wherever any of their prefilters match.
+
+    Example usage:
+
+    ```python
+    has_set = py_node_union_feature_finder('set', [has_set_function, has_set_value])
+    ```
+
+    """
+    return PyNodeUnionFeatureFinder(name, feature_finders)
+
+
+def _import_transform(import_node: ast.Import, *, modules: Sequence[str]) -> List[ast.AST]:
+    return [
+        alias for alias in import_node.names
+        if alias.name and any([alias.name.startswith(target_module) for target_module in modules])
+    ]
+
+
+def _import_from_transform(import_from_node: ast.ImportFrom, *, modules: Sequence[str]) -> Optional[ast.AST]:
+    module = import_from_node.module
+    if module and any([module.startswith(target_module) for target_module in modules]):
+        return import_from_node
+    return None
+
+
+def py_node_module_feature_finder(name: str, *, modules: Sequence[str]) -> PyNodeUnionFeatureFinder:
+    """Defines a FeatureFinder that looks for import statements of one or
+    more target Python `modules`.
+
+    Example usage:
+
+    ```python
+    has_dataclasses = py_node_module_feature_finder('dataclasses_module', modules=['dataclasses'])
+    ```
+
+    """
+    return PyNodeUnionFeatureFinder(name, [
+        # import syntax
+        PyNodeFeatureFinder(name, node_types=[ast.Import],
+                            transform=partial(_import_transform, modules=modules)),
+        # from syntax
+        PyNodeFeatureFinder(name, node_types=[ast.ImportFrom],
+                            transform=partial(_import_from_transform, modules=modules)),
+    ], prefilter=get_module_prefilter(modules))
+
+
+def _optional_node_types(*type_names: str) -> List[Type[ast.AST]]:
+    """Returns the AST node types with the given names that exist in the
+    running version of Python."""
+    return [getattr(ast, type_name) for type_name in type_names if hasattr(ast, type_name)]
+
+
+# ==== Python AST Feature Finders ====
+
+# https://docs.python.org/3/library/ast.html#ast.For
+@py_node_feature_finder_with_transform('for_else', node_types=[ast.For], prefilter=r'\belse\b')
+def has_for_else(for_node):
+    """FeatureFinder for else clauses in for loops."""
+    if len(for_node.orelse) == 0:
+        return None
+    return for_node.orelse[0]
+
+
+# https://docs.python.org/3/library/ast.html#ast.Try
+@py_node_feature_finder_with_transform('try_finally', node_types=[ast.Try], prefilter=r'\bfinally\b')
+def has_try_finally(try_node):
+    """FeatureFinder for finally clauses in try statements."""
+    if len(try_node.finalbody) == 0:
+        return None
+    return try_node.finalbody[0]
+
+
+# E.g. `def greeting(name: str):`
+@py_node_feature_finder_with_transform('type_hint', node_types=[ast.FunctionDef])
+def has_type_hint(function_node):
+    """FeatureFinder for type hints."""
+    args = function_node.args
+    return [
+        arg.annotation
+        for arg in [*args.posonlyargs, *args.args, args.vararg, *args.kwonlyargs, args.kwarg]
+        if arg is not None and arg.annotation is not None
+    ]
+
+
+# The set function
+@py_node_feature_finder_with_transform('set_function', node_types=[ast.Call])
+def has_set_function(call_node):
+    """FeatureFinder for the set function."""
+    if isinstance(call_node.func, ast.Name) and call_node.func.id == 'set':
+        return call_node.func
+    return None
+
+
+# A set literal
+has_set_value = py_node_feature_finder('set_value', node_types=[ast.Set])
+"""FeatureFinder for set literals."""
+
+# The set function or literal
+has_set = py_node_union_feature_finder('set', [has_set_function, has_set_value])
+"""FeatureFinder for sets."""
+
+# Node representing a single formatting field in an f-string.
+# https://docs.python.org/3/library/ast.html#ast.FormattedValue
+has_fstring = py_node_feature_finder('fstring', node_types=[ast.FormattedValue], prefilter=FSTRING_PREFILTER)
+"""FeatureFinder for f-strings."""
+
+# E.g. `if b else c`
+# https://docs.python.org/3/library/ast.html#ast.IfExp
+has_ternary = py_node_feature_finder('ternary', node_types=[ast.IfExp], prefilter=r'\belse\b')
+"""FeatureFinder for ternary expressions."""
+
+# https://docs.python.org/3/library/ast.html#ast.Match
+has_pattern_matching = py_node_feature_finder('pattern_matching', node_types=_optional_node_types('Match'), prefilter=r'\bmatch\b')
+"""FeatureFinder for pattern matching."""
+
+# https://docs.python.org/3/library/ast.html#ast.NamedExpr
+has_walrus = py_node_feature_finder('walrus', node_types=[ast.NamedExpr], prefilter=':=')
+"""FeatureFinder for the walrus operator."""
@@ -0,0 +1,159 @@
+"""Crash-isolated parsing of Python source-code into abstract syntax trees."""
+
+import ast
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection
+import os
+import signal
+from typing import Optional
+
+from codesurvey.utils import record_stat
+
+PARSER_RESPAWNS_STAT = 'python_parser_respawns'
+"""Name of the run statistic counting restarts of dead parser helper
+processes."""
+
+
+class ParserCrashError(Exception):
+    """Raised when a parser helper process dies while parsing source-code."""
+
+
+def _parser_helper_main(conn: Connection, parent_conn: Connection):
+    """Entry-point of a parser helper process.
+
+    Parses each source-code string received over the connection, and
+    sends back either the parsed tree (or `None` if only a check that
+    the source-code can be parsed was requested) or the exception
+    raised while parsing. Exits when the connection is closed by the
+    parent process.
+
+    """
+    # Close the inherited copy of the parent's end of the pipe, so
+    # that the connection is closed when the parent exits.
+    parent_conn.close()
+    # Interrupts are handled by the parent process, which will close
+    # the connection.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            file_text, check_only = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            result = ast.parse(file_text)
+            if check_only:
+                result = None
+        except Exception as ex:
+            result = ex
+        try:
+            conn.send(result)
+        except Exception as ex:
+            # E.g. a tree that is too deeply nested to be pickled.
+            conn.send(ValueError(f'Parsed tree could not be returned: {ex}'))
+
+
+class AstParser:
+    """Parses Python source-code in a long-lived helper process.
+
+    Sufficiently complex source-code can crash the interpreter during
+    parsing (see: https://docs.python.org/3/library/ast.html#ast.parse),
+    so parsing is isolated in a helper process. The helper is re-used
+    for every parse, and is only restarted when it has died.
+
+    Each process should use its own AstParser, which can be retrieved
+    with `get_ast_parser()`.
+
+    """
+
+    def __init__(self) -> None:
+        self.process: Optional[Process] = None
+        self.conn: Optional[Connection] = None
+
+    def _start(self):
+        parent_conn, child_conn = Pipe()
+        process = Process(target=_parser_helper_main, args=(child_conn, parent_conn), daemon=True)
+        process.start()
+        # Close the parent's copy of the child's end of the pipe so
+        # that the death of the helper is detected as an EOFError.
+        child_conn.close()
+        self.process = process
+        self.conn = parent_conn
+
+    def _stop(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.process is not None:
+            self.process.join(timeout=1)
+            if self.process.is_alive():
+                self.process.kill()
+            self.process = None
+
+    def parse(self, file_text: str) -> ast.AST:
+        """Parse the given source-code into an AST.
+
+        Raises:
+            SyntaxError: The source-code could not be parsed.
+            ValueError: The source-code could not be parsed.
+            ParserCrashError: The helper process died while parsing.
+
+        """
+        return self._request(file_text, check_only=False)
+
+    def check(self, file_text: str) -> None:
+        """Check that the given source-code can be parsed, without the
+        cost of returning its AST from the helper process.
+
+        Raises:
+            SyntaxError: The source-code could not be parsed.
+            ValueError: The source-code could not be parsed.
+            ParserCrashError: The helper process died while parsing.
+
+        """
+        self._request(file_text, check_only=True)
+
+    def _request(self, file_text: str, *, check_only: bool):
+        if self.process is not None and not self.process.is_alive():
+            self._stop()
+            record_stat(PARSER_RESPAWNS_STAT)
+        if self.process is None:
+            self._start()
+        assert self.conn is not None
+
+        try:
+            self.conn.send((file_text, check_only))
+            result = self.conn.recv()
+        except (EOFError, OSError) as ex:
+            process = self.process
+            # Stop the dead helper so that the next parse starts a new one.
+            self._stop()
+            exitcode = process.exitcode if process is not None else None
+            record_stat(PARSER_RESPAWNS_STAT)
+            raise ParserCrashError(f'Parser process died with exit code {exitcode}') from ex
+
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self):
+        """Stop the helper process."""
+        self._stop()
+
+
+_parser: Optional[AstParser] = None
+_parser_pid: Optional[int] = None
+
+
+def get_ast_parser() -> AstParser:
+    """Returns the AstParser for the current process, creating it if
+    necessary.
+
+    A forked process does not inherit the AstParser of its parent, as
+    the parent's helper process can only be used by the parent.
+
+    """
+    global _parser, _parser_pid
+    if _parser is None or _parser_pid != os.getpid():
+        _parser = AstParser()
+        _parser_pid = os.getpid()
+    return _parser
@@ -0,0 +1,158 @@
+"""Columnar representations of survey results.
+
+Columns are NumPy arrays, so the `numpy` package must be installed to
+use them (e.g. with `pip install codesurvey[columns]`). Converting
+columns to Arrow tables or Parquet files also requires the `pyarrow`
+package (e.g. with `pip install codesurvey[arrow]`).
+
+"""
+
+from array import array
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional, Union
+
+INTEGER_COLUMN = 'integer'
+"""Kind of column for non-null integers."""
+
+NULLABLE_INTEGER_COLUMN = 'nullable_integer'
+"""Kind of column for integers that may be null."""
+
+STRING_COLUMN = 'string'
+"""Kind of column for strings that may be null."""
+
+TIMESTAMP_COLUMN = 'timestamp'
+"""Kind of column for integer Unix timestamps in seconds."""
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError as ex:
+        raise ImportError('numpy must be installed to use columnar survey results') from ex
+    return numpy
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError as ex:
+        raise ImportError('pyarrow must be installed to convert survey results to Arrow or Parquet') from ex
+    return pyarrow
+
+
+@dataclass(frozen=True)
+class DictionaryColumn:
+    """Column of strings that is dictionary-encoded, so that each distinct
+    string is only stored once."""
+
+    codes: Any
+    """NumPy array of `int32` codes for each row of the column, which
+    are indexes into `values`, or -1 for null strings."""
+
+    values: List[str]
+    """Distinct strings of the column."""
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def to_list(self) -> List[Optional[str]]:
+        """Returns the decoded strings of the column."""
+        return [None if code < 0 else self.values[code] for code in self.codes.tolist()]
+
+
+Column = Union[Any, DictionaryColumn]
+"""A column of survey results: a `DictionaryColumn` for strings, a NumPy
+masked array for integers that may be null, or otherwise a NumPy
+array."""
+
+
+def read_columns(cursor: Any, column_kinds: Mapping[str, str], *, batch_size: int) -> Dict[str, Column]:
+    """Reads the rows of a database cursor into columns.
+
+    Rows are fetched from the cursor `batch_size` rows at a time and
+    appended to compact buffers for each column, so that the memory used
+    is proportional to the size of the column data rather than the
+    number of rows.
+
+    Args:
+        cursor: A DB-API cursor that returns rows with a value for each
+            of the `column_kinds`.
+        column_kinds: Mapping of names for the columns of the cursor's
+            rows to their kinds (e.g. `INTEGER_COLUMN`).
+        batch_size: The number of rows to fetch from the cursor at a time.
+
+    Returns:
+        A dictionary mapping column names to columns.
+
+    """
+    numpy = _import_numpy()
+    # Values of each column, and the null mask of nullable integer columns.
+    buffers = [array('i' if kind == STRING_COLUMN else 'q') for kind in column_kinds.values()]
+    null_masks = {index: array('b') for index, kind in enumerate(column_kinds.values()) if kind == NULLABLE_INTEGER_COLUMN}
+    string_codes: Dict[int, Dict[Optional[str], int]] = {
+        index: {None: -1} for index, kind in enumerate(column_kinds.values()) if kind == STRING_COLUMN
+    }
+
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for index, values in enumerate(zip(*rows)):
+            if index in string_codes:
+                codes = string_codes[index]
+                for value in values:
+                    code = codes.get(value)
+                    if code is None:
+                        # The first code is 0, as None is in codes.
+                        code = codes[value] = len(codes) - 1
+                    buffers[index].append(code)
+            elif index in null_masks:
+                null_masks[index].extend(value is None for value in values)
+                buffers[index].extend(0 if value is None else value for value in values)
+            else:
+                buffers[index].extend(values)
+
+    columns: Dict[str, Column] = {}
+    for index, (name, kind) in enumerate(column_kinds.items()):
+        if kind == STRING_COLUMN:
+            columns[name] = DictionaryColumn(
+                codes=numpy.frombuffer(buffers[index], dtype=numpy.int32),
+                values=[value for value in string_codes[index] if value is not None],
+            )
+            continue
+        values_array = numpy.frombuffer(buffers[index], dtype=numpy.int64)
+        if kind == TIMESTAMP_COLUMN:
+            columns[name] = values_array.view('datetime64[s]')
+        elif kind == NULLABLE_INTEGER_COLUMN:
+            columns[name] = numpy.ma.masked_array(values_array, mask=numpy.frombuffer(null_masks[index], dtype=numpy.bool_))
+        else:
+            columns[name] = values_array
+    return columns
+
+
+def to_arrow_table(columns: Mapping[str, Column]):
+    """Returns a `pyarrow.Table` of the given columns, where
+    DictionaryColumns are converted to Arrow dictionary arrays and the
+    masks of masked arrays are converted to nulls."""
+    numpy = _import_numpy()
+    pyarrow = _import_pyarrow()
+    arrays = {}
+    for name, column in columns.items():
+        if isinstance(column, DictionaryColumn):
+            arrays[name] = pyarrow.DictionaryArray.from_arrays(
+                pyarrow.array(column.codes, mask=(column.codes < 0)),
+                pyarrow.array(column.values, type=pyarrow.string()),
+            )
+        elif numpy.ma.isMaskedArray(column):
+            arrays[name] = pyarrow.array(column.data, mask=numpy.ma.getmaskarray(column))
+        else:
+            arrays[name] = pyarrow.array(column)
+    return pyarrow.table(arrays)
+
+
+def write_parquet(columns: Mapping[str, Column], path: str) -> None:
+    """Writes the given columns to a Parquet file at the given path."""
+    _import_pyarrow()
+    import pyarrow.parquet
+
+    pyarrow.parquet.write_table(to_arrow_table(columns), path)
@@ -1,21 +1,29 @@
 """Top-level components for running and analyzing code surveys."""
 
+from collections import Counter, deque
 import concurrent.futures
-from dataclasses import dataclass
-from itertools import cycle
+from dataclasses import dataclass, field
+from itertools import cycle, islice
 import os
 import signal
 import sys
-from typing import cast, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+import time
+import traceback
+from typing import cast, Callable, Deque, Dict, Iterator, List, Mapping, Optional, Sequence, Set, Tuple, Union
 
 from tqdm import tqdm
 from tqdm.contrib.logging import logging_redirect_tqdm
 from tqdm.utils import _screen_shape_wrapper
 
-from .utils import logger, BreakException, get_duplicates, recursive_update
+from .utils import logger, get_duplicates, pop_stats, recursive_update
 from .sources import Repo, RepoThunk, Source
 from .analyzers import Code, CodeThunk, Analyzer
-from .database import Database, RepoFeature, CodeFeature
+from .columns import Column
+from .database import DATABASE_PROFILES, CodeFeatureWriter, Database, FeatureSummary, RepoFeature, RepoFeatureCounts, CodeFeature
+
+DEDUPLICATED_CODES_STAT = 'deduplicated_codes'
+"""Name of the run statistic counting Codes whose features were copied
+from saved features of another Code with an identical Git blob."""
 
 
 @dataclass(frozen=True)
@@ -33,11 +41,192 @@ class RepoJob(Job):
 class CodeJob(Job):
     analyzer: Analyzer
     repo: Repo
+    code_keys: Sequence[str]
+
+
+@dataclass(frozen=True)
+class RepoAnalysisJob(Job):
+    analyzer: Analyzer
+    repo: Repo
+
+
+@dataclass(frozen=True)
+class EnumerationJob(Job):
+    repo: Repo
+
+
+RepoCodeItem = Tuple[Analyzer, Union[Code, CodeThunk, Exception]]
+
+
+@dataclass
+class RepoState:
+    """State of a Repo for which Jobs are still being submitted."""
+
+    repo: Repo
+    """The Repo being analyzed."""
+
+    codes: Iterator[RepoCodeItem]
+    """Iterator over the Codes and CodeThunks of the Repo found by each
+    Analyzer (or exceptions raised while finding them), which is
+    advanced by EnumerationJobs in a background thread."""
+
+    code_thunks: Deque[Tuple[Analyzer, CodeThunk]] = field(default_factory=deque)
+    """Enumerated CodeThunks waiting to be submitted in CodeJobs."""
+
+    enumerating: bool = False
+    """Whether an EnumerationJob for the Repo is pending."""
+
+    exhausted: bool = False
+    """Whether all Codes of the Repo have been enumerated."""
+
+
+def get_repo_id(repo_or_thunk: Union[Repo, RepoThunk]) -> Tuple[str, str]:
+    """Returns the Source name and key that identify a Repo/RepoThunk."""
+    return (repo_or_thunk.source.name, repo_or_thunk.key)
+
+
+@dataclass(frozen=True)
+class RepoAnalysis:
+    """Results of analyzing all Codes of a Repo with an Analyzer in a
+    worker process, aggregated without returning individual Codes."""
+
+    feature_counts: Dict[str, RepoFeatureCounts]
+    """Counts of each feature that was found in at least one Code that
+    was not ignored."""
+
+    code_count: int
+    """Number of Codes analyzed."""
+
+    failures: List[Tuple[str, Exception]]
+    """Keys of Codes that failed to be analyzed, and the exceptions
+    raised."""
+
+    stats: Dict[str, int]
+    """Aggregated statistics of the analyzed Codes."""
+
+
+class _WorkerError(Exception):
+    """Exception raised in a worker process that is returned to the main
+    process instead of being raised, and that carries the formatted
+    traceback of the original exception (which would otherwise be lost
+    when the exception is pickled)."""
+
+    def __init__(self, traceback_text: str):
+        super().__init__(traceback_text)
+
+    def __str__(self) -> str:
+        return f'\n"""\n{self.args[0]}"""'
+
+
+def _enumerate_codes(codes: Iterator[RepoCodeItem], max_count: int,
+                     db: Optional[Database]) -> Tuple[List[RepoCodeItem], bool, Set[Tuple[str, str]]]:
+    """Returns up to max_count items from the given iterator, and whether
+    the iterator is exhausted. Run in a background thread.
+
+    If a Database is given, also returns the `(analyzer_name,
+    blob_sha)` pairs of the enumerated CodeThunks that have saved
+    features in the Database, so that the features of other CodeThunks
+    need not be looked up.
+
+    """
+    items = list(islice(codes, max_count))
+    saved_blob_shas: Set[Tuple[str, str]] = set()
+    if db is not None:
+        analyzer_blob_shas: Dict[str, List[str]] = {}
+        for analyzer, item in items:
+            if isinstance(item, CodeThunk) and item.blob_sha is not None:
+                analyzer_blob_shas.setdefault(analyzer.name, []).append(item.blob_sha)
+        for analyzer_name, blob_shas in analyzer_blob_shas.items():
+            saved_blob_shas.update(
+                (analyzer_name, blob_sha)
+                for blob_sha in db.get_saved_blob_shas(analyzer_name=analyzer_name, blob_shas=blob_shas)
+            )
+    return items, len(items) < max_count, saved_blob_shas
+
+
+def _run_code_thunks(thunks: Sequence[Callable[[], Code]]) -> Tuple[List[Union[Code, Exception]], float]:
+    """Runs a chunk of CodeThunk functions in a worker process.
+
+    Returns the Code produced by each thunk (or the exception it
+    raised, so that one failure does not prevent the results of the
+    rest of the chunk from being saved), and the seconds taken to run
+    the chunk.
+
+    """
+    start_time = time.perf_counter()
+    results: List[Union[Code, Exception]] = []
+    for thunk in thunks:
+        try:
+            results.append(thunk())
+        except Exception:
+            results.append(_WorkerError(traceback.format_exc()))
+    return results, time.perf_counter() - start_time
+
+
+def _analyze_repo(analyzer: Analyzer, repo: Repo, features: Sequence[str]) -> RepoAnalysis:
+    """Analyzes all Codes of a Repo in a worker process, aggregating
+    feature counts in the same way as `Database.save_repo_features()`."""
+    counts = {feature_name: [0, 0, 0] for feature_name in features}
+    code_count = 0
+    failures: List[Tuple[str, Exception]] = []
+    stats: Counter = Counter()
+    codes = analyzer.code_generator(repo=repo, get_code_features=lambda code_key: features)
+    for code_or_thunk in codes:
+        if isinstance(code_or_thunk, CodeThunk):
+            try:
+                code = code_or_thunk.thunk()
+            except Exception:
+                failures.append((code_or_thunk.key, _WorkerError(traceback.format_exc())))
+                continue
+        else:
+            code = code_or_thunk
+        code_count += 1
+        stats.update(code.stats)
+        for feature_name, feature in code.features.items():
+            # Do not count "ignored" Codes
+            if feature.ignore:
+                continue
+            feature_counts = counts[feature_name]
+            feature_counts[0] += len(feature.occurrences)
+            feature_counts[1] += min(len(feature.occurrences), 1)
+            feature_counts[2] += 1
+    return RepoAnalysis(
+        feature_counts={
+            feature_name: RepoFeatureCounts(
+                occurrence_count=occurrence_count,
+                code_occurrence_count=code_occurrence_count,
+                code_total_count=code_total_count,
+            )
+            for feature_name, (occurrence_count, code_occurrence_count, code_total_count) in counts.items()
+            # Features without any Codes that were not ignored are
+            # not saved.
+            if code_total_count > 0
+        },
+        code_count=code_count,
+        failures=failures,
+        stats=dict(stats),
+    )
 
 
 class CodeSurveyRunner:
     """Manages the execution of surveys."""
 
+    ADAPTIVE_CODE_CHUNK_SECONDS = 0.1
+    """Target duration of a chunk of Codes when the chunk size is adaptive."""
+
+    MAX_ADAPTIVE_CODE_CHUNK_SIZE = 500
+    """Maximum number of Codes in a chunk when the chunk size is adaptive."""
+
+    CODE_WRITE_BATCH_SIZE = 1000
+    """Maximum number of Codes to save to the database in a single transaction."""
+
+    CODE_WRITE_INTERVAL_SECONDS = 1.0
+    """Maximum seconds to wait for more Codes to save to the database in
+    the same transaction."""
+
+    MIN_ENUMERATION_BATCH_SIZE = 100
+    """Minimum number of Codes of a Repo to enumerate in each EnumerationJob."""
+
     def __init__(self, survey: 'CodeSurvey'):
         """
         Args:
@@ -49,10 +238,19 @@ class CodeSurveyRunner:
         self.analyzers = survey.analyzers
         self.analyzer_features = survey.analyzer_features
         self.max_workers = survey.max_workers
+        self.max_pending_code_jobs = survey.max_pending_code_jobs
+        self.max_fetch_workers = survey.max_fetch_workers
+        self.prefetch_repos = survey.prefetch_repos
         self.continue_on_failure = survey.continue_on_failure
         self.save_code_features = survey.save_code_features
         self.save_occurrences = survey.save_occurrences
         self.use_saved_features = survey.use_saved_features
+        self.code_chunk_size = survey.code_chunk_size
+        self.repo_local_analysis = survey.repo_local_analysis
+        # Moving average of seconds taken to analyze each Code
+        self.mean_code_seconds: Optional[float] = None
+        # Statistics of the most recent run
+        self.stats: Counter = Counter()
 
     def get_pbars(self, *, disable_progress: bool,
                   progress_analyzer_features: Optional[Mapping[str, Sequence[str]]],
@@ -163,8 +361,8 @@ class CodeSurveyRunner:
                 )
 
     def get_executor(self) -> concurrent.futures.ProcessPoolExecutor:
-        """Returns a multi-processing executor for running repo-fetching and
-        code-processing subprocesses."""
+        """Returns a multi-processing executor for running code-processing
+        subprocesses."""
 
         def init_worker():
             # Ignore keyboard interrupts in subprocesses.
@@ -175,15 +373,44 @@ class CodeSurveyRunner:
             initializer=init_worker,
         )
 
+    def get_fetch_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        """Returns a multi-threading executor for fetching Repos.
+
+        Fetching Repos (e.g. cloning Git repositories) is mostly spent
+        waiting on the network and sub-processes, so it is performed
+        in threads that do not occupy the code-processing
+        subprocesses.
+
+        """
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_fetch_workers,
+            thread_name_prefix='codesurvey-fetch',
+        )
+
+    def get_enumeration_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        """Returns a multi-threading executor for enumerating the Codes of
+        Repos.
+
+        Enumerating Codes (including looking up their saved features)
+        is performed in threads so that results of completed Jobs can
+        continue to be handled while the Codes of large Repos are
+        being enumerated.
+
+        """
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix='codesurvey-enumerate',
+        )
+
     def reached_max_repos(self) -> bool:
-        """Checks whether the number of Repos being fetched, being analyzed,
-        and fully analyzed has reached the configured max_repos."""
+        """Checks whether the number of Repos being fetched, waiting to be
+        analyzed, being analyzed, and fully analyzed has reached the
+        configured max_repos."""
         if self.max_repos is None:
             return False
 
-        pending_repos = len([job for job in self.future_to_job.values()
-                             if isinstance(job, RepoJob)])
-        repo_count = len(self.current_repos) + pending_repos + self.completed_repo_count
+        repo_count = (len(self.current_repos) + self.pending_repo_job_count
+                      + len(self.fetched_repos) + self.completed_repo_count)
         return repo_count >= self.max_repos
 
     def reached_max_codes(self) -> bool:
@@ -194,19 +421,51 @@ class CodeSurveyRunner:
 
         return self.completed_code_count >= self.max_codes
 
+    def add_job(self, future: concurrent.futures.Future, job: Job) -> None:
+        """Add a Job submitted to the executor to future_to_job, updating
+        the counts of pending Jobs."""
+        self.future_to_job[future] = job
+        if isinstance(job, RepoJob):
+            self.pending_repo_job_count += 1
+        elif isinstance(job, EnumerationJob):
+            self.pending_enumeration_job_count += 1
+        elif isinstance(job, (CodeJob, RepoAnalysisJob)):
+            self.repo_pending_job_counts[get_repo_id(job.repo)] += 1
+
+    def remove_job(self, future: concurrent.futures.Future) -> Job:
+        """Remove a finished Job from future_to_job, updating the counts
+        of pending Jobs."""
+        job = self.future_to_job.pop(future)
+        if isinstance(job, RepoJob):
+            self.pending_repo_job_count -= 1
+        elif isinstance(job, EnumerationJob):
+            self.pending_enumeration_job_count -= 1
+        elif isinstance(job, (CodeJob, RepoAnalysisJob)):
+            repo_id = get_repo_id(job.repo)
+            self.repo_pending_job_counts[repo_id] -= 1
+            if self.repo_pending_job_counts[repo_id] == 0:
+                del self.repo_pending_job_counts[repo_id]
+        return job
+
     def check_repo_completion(self, repos: Sequence[Repo]) -> None:
-        """Check whether there are any completed current_repos without any
-        remaining CodeJobs, save their results, and remove them from
-        current_repos."""
-        completed_repos = [
-            repo for repo in self.current_repos
-            if len([
-                job for job in self.future_to_job.values()
-                if isinstance(job, CodeJob) and job.repo is repo
-            ]) == 0
-        ]
-        for repo in completed_repos:
-            self.db.save_repo_features(repo, keep_code_features=self.save_code_features)
+        """Check whether any of the given current_repos are completed
+        without any remaining or pending CodeJobs, save their results,
+        and remove them from current_repos."""
+        # Repos may be given more than once, but should only be completed once.
+        completed_repos = {
+            get_repo_id(repo): repo for repo in repos
+            if (self.current_repos.get(get_repo_id(repo)) is repo
+                and get_repo_id(repo) not in self.repo_states
+                and self.repo_pending_job_counts[get_repo_id(repo)] == 0)
+        }
+        if completed_repos and not self.repo_local_analysis:
+            # Ensure all Codes have been saved before they are aggregated.
+            self.code_writer.flush()
+        for repo in completed_repos.values():
+            # Repo features were already saved from the RepoAnalysis
+            # in repo_local_analysis mode.
+            if not self.repo_local_analysis:
+                self.db.save_repo_features(repo, keep_code_features=self.save_code_features)
             self.completed_repo_count += 1
             self.pbars['repos'].update(1)
 
@@ -215,6 +474,11 @@ class CodeSurveyRunner:
                 repo_keys=[repo.key],
             )
             for repo_feature in repo_features:
+                self.record_repo_feature(
+                    repo_id=get_repo_id(repo),
+                    analyzer_name=repo_feature.analyzer_name,
+                    feature_name=repo_feature.feature_name,
+                )
                 if repo_feature.occurrence_count > 0:
                     feature_pbar_key = (
                         'feature',
@@ -225,99 +489,357 @@ class CodeSurveyRunner:
 
             logger.info(f'Completed repo "{repo}"')
             repo.cleanup()
-            self.current_repos.remove(repo)
+            del self.current_repos[get_repo_id(repo)]
+
+    def load_repo_feature_masks(self) -> None:
+        """Load a compact record of the features recorded for all Repos
+        in the database, so that the features that still need to be
+        surveyed for each Repo can be determined without querying the
+        database."""
+        self.feature_bits = {
+            (analyzer_name, feature_name): 1 << bit_index
+            for bit_index, (analyzer_name, feature_name) in enumerate(
+                (analyzer_name, feature_name)
+                for analyzer_name, feature_names in self.analyzer_features.items()
+                for feature_name in feature_names
+            )
+        }
+        self.all_features_mask = sum(self.feature_bits.values())
+        self.repo_feature_masks = (
+            self.db.get_repo_feature_masks(feature_bits=self.feature_bits)
+            if self.use_saved_features
+            else {}
+        )
+
+    def record_repo_feature(self, *, repo_id: Tuple[str, str], analyzer_name: str, feature_name: str) -> None:
+        """Record that a feature has been saved for a Repo."""
+        feature_bit = self.feature_bits.get((analyzer_name, feature_name))
+        if feature_bit is not None:
+            self.repo_feature_masks[repo_id] = self.repo_feature_masks.get(repo_id, 0) | feature_bit
+
+    def get_repo_missing_analyzer_features(self, repo_id: Tuple[str, str]) -> Dict[str, Sequence[str]]:
+        """Determine which Analyzer features still need to be surveyed for
+        the Repo with the given ID (all features if not
+        use_saved_features)."""
+        if not self.use_saved_features:
+            return self.analyzer_features
+        repo_feature_mask = self.repo_feature_masks.get(repo_id, 0)
+        if repo_feature_mask == 0:
+            return self.analyzer_features
+        if repo_feature_mask == self.all_features_mask:
+            return {}
+        missing_analyzer_features: Dict[str, Sequence[str]] = {}
+        for analyzer_name, feature_names in self.analyzer_features.items():
+            missing_features = [
+                feature_name for feature_name in feature_names
+                if not repo_feature_mask & self.feature_bits[(analyzer_name, feature_name)]
+            ]
+            if len(missing_features) > 0:
+                missing_analyzer_features[analyzer_name] = missing_features
+        return missing_analyzer_features
 
     def handle_code(self, *, code: Code) -> None:
         """Save survey results for the given Code, updating progress tracking."""
+        self.stats.update(code.stats)
         if self.reached_max_codes():
             return
 
-        self.db.save_code_features(code, save_occurrences=self.save_occurrences)
+        self.code_writer.put(code)
         self.pbars['codes'].update(1)
         self.completed_code_count += 1
 
     def handle_code_future(self, future: concurrent.futures.Future) -> None:
-        """Handle saving a completed CodeJob, handling Job failure."""
+        """Handle saving the Codes of a completed CodeJob, handling Job failure."""
         job = cast(CodeJob, self.future_to_job[future])
         try:
-            code = future.result()
+            results, seconds = future.result()
         except Exception as ex:
             self.handle_failure(
                 ex=ex,
                 message=f'Failed to analyze code from repo "{job.repo}" with analyzer "{job.analyzer}"',
             )
+            return
+
+        self.update_code_seconds(seconds=seconds, code_count=len(results))
+        for code_key, result in zip(job.code_keys, results):
+            if isinstance(result, Exception):
+                self.handle_failure(
+                    ex=result,
+                    message=f'Failed to analyze code "{code_key}" from repo "{job.repo}" with analyzer "{job.analyzer}"',
+                )
+            else:
+                self.handle_code(code=result)
+
+    def handle_duplicate_code(self, *, analyzer: Analyzer, repo: Repo, code_thunk: CodeThunk) -> bool:
+        """Save survey results for the given CodeThunk by copying the saved
+        features of another Code with the same Git blob, if they exist,
+        updating progress tracking.
+
+        Returns:
+            `True` if saved features were copied, and the CodeThunk does
+                not need to be executed.
+
+        """
+        if code_thunk.blob_sha is None:
+            return False
+        copied = self.db.copy_blob_code_features(
+            repo=repo,
+            code_key=code_thunk.key,
+            analyzer_name=analyzer.name,
+            blob_sha=code_thunk.blob_sha,
+            features=code_thunk.features,
+        )
+        if copied:
+            self.stats[DEDUPLICATED_CODES_STAT] += 1
+            self.pbars['codes'].update(1)
+            self.completed_code_count += 1
+        return copied
+
+    def update_code_seconds(self, *, seconds: float, code_count: int) -> None:
+        """Update the moving average of seconds taken to analyze each Code."""
+        if code_count == 0:
+            return
+        code_seconds = seconds / code_count
+        if self.mean_code_seconds is None:
+            self.mean_code_seconds = code_seconds
         else:
-            self.handle_code(code=code)
+            self.mean_code_seconds = 0.8 * self.mean_code_seconds + 0.2 * code_seconds
+
+    def get_code_chunk_size(self) -> int:
+        """Returns the number of CodeThunks to submit to a worker in each
+        CodeJob."""
+        if self.code_chunk_size is not None:
+            return self.code_chunk_size
+        if self.mean_code_seconds:
+            chunk_size = int(self.ADAPTIVE_CODE_CHUNK_SECONDS / self.mean_code_seconds)
+        else:
+            # Until the time taken to analyze Codes has been measured
+            # (which may not be until all Codes of the first Repo have
+            # been submitted), grow the chunk size exponentially from
+            # a single Code.
+            chunk_size = 2 ** min(self.code_job_count, 16)
+        return max(1, min(self.MAX_ADAPTIVE_CODE_CHUNK_SIZE, chunk_size))
+
+    def submit_code_thunks(self, *, analyzer: Analyzer, repo: Repo, code_thunks: Sequence[CodeThunk]) -> None:
+        """Submit a CodeJob to analyze a chunk of Codes, with a callback
+        to save the results.
+
+        Submitting multiple CodeThunks in a single CodeJob reduces the
+        overhead of communicating with worker processes, as the
+        Analyzer and Repo shared by the CodeThunks are only sent to the
+        worker once per chunk.
+
+        """
+        future = self.executor.submit(_run_code_thunks, [code_thunk.thunk for code_thunk in code_thunks])
+        self.code_job_count += 1
+        self.add_job(future, CodeJob(
+            analyzer=analyzer,
+            repo=repo,
+            code_keys=[code_thunk.key for code_thunk in code_thunks],
+            callback=self.handle_code_future,
+        ))
+
+    def handle_repo_analysis_future(self, future: concurrent.futures.Future) -> None:
+        """Handle saving the aggregated features of a completed
+        RepoAnalysisJob, handling Job failure."""
+        job = cast(RepoAnalysisJob, self.future_to_job[future])
+        try:
+            repo_analysis = future.result()
+        except Exception as ex:
+            self.handle_failure(
+                ex=ex,
+                message=f'Failed to analyze repo "{job.repo}" with analyzer "{job.analyzer}"',
+            )
+            return
+
+        self.stats.update(repo_analysis.stats)
+        for code_key, code_ex in repo_analysis.failures:
+            self.handle_failure(
+                ex=code_ex,
+                message=f'Failed to analyze code "{code_key}" from repo "{job.repo}" with analyzer "{job.analyzer}"',
+            )
+        self.db.save_repo_feature_counts(
+            job.repo,
+            analyzer_name=job.analyzer.name,
+            feature_counts=repo_analysis.feature_counts,
+        )
+        self.pbars['codes'].update(repo_analysis.code_count)
+        self.completed_code_count += repo_analysis.code_count
 
     def handle_repo(self, *, repo: Repo, analyzer_features: Mapping[str, Sequence[str]]) -> None:
-        """Analyze the given Repo for the given analyzer_features.
+        """Start analyzing the given Repo for the given analyzer_features.
 
-        All Codes for the Repo will either be analyzed or have a
-        pending CodeJob after calling this function.
+        The Codes of the Repo are enumerated in a background thread and
+        Jobs to analyze them are submitted by calls to
+        `advance_repo()`, so that only a bounded number of Jobs are
+        pending at a time, and so that the Codes of other Repos can be
+        interleaved with them.
 
         """
-        # Add the repo to the list of current_repos currently being analyzed.
-        self.current_repos.append(repo)
+        # Add the repo to the current_repos currently being analyzed.
+        repo_id = get_repo_id(repo)
+        self.current_repos[repo_id] = repo
         self.db.save_repo_metadata(repo)
+        if self.reached_max_codes():
+            logger.info(f'Max codes reached, "{repo}" will not be fully analyzed')
+            self.check_repo_completion([repo])
+            return
+
+        if not self.repo_local_analysis:
+            self.repo_states[repo_id] = RepoState(
+                repo=repo,
+                codes=self.iter_repo_codes(repo=repo, analyzer_features=analyzer_features),
+            )
+            return
+
+        for analyzer in self.analyzers.values():
+            features = analyzer_features.get(analyzer.name)
+            if features is None:
+                logger.info(f'Skipping completed analyzer "{analyzer}" for repo "{repo}"')
+                continue
+            # Submit a Job to analyze all Codes of the Repo within a
+            # single worker process.
+            logger.info(f'Analyzing repo "{repo}" with analyzer "{analyzer}"')
+            future = self.executor.submit(_analyze_repo, analyzer, repo, features)
+            self.add_job(future, RepoAnalysisJob(
+                analyzer=analyzer,
+                repo=repo,
+                callback=self.handle_repo_analysis_future,
+            ))
+        self.check_repo_completion([repo])
+
+    def iter_repo_codes(self, *, repo: Repo, analyzer_features: Mapping[str, Sequence[str]]) -> Iterator[RepoCodeItem]:
+        """Returns an iterator over the Codes and CodeThunks found by each
+        Analyzer in the given Repo for the given analyzer_features, or
+        exceptions raised by Analyzers while finding them.
+
+        The iterator is advanced in a background thread, so it must
+        not modify the state of the runner.
+
+        """
+        for analyzer in self.analyzers.values():
+            features = analyzer_features.get(analyzer.name)
+            if features is None:
+                logger.info(f'Skipping completed analyzer "{analyzer}" for repo "{repo}"')
+                continue
+
+            logger.info(f'Analyzing repo "{repo}" with analyzer "{analyzer}"')
+            # Load the saved features of all Codes of the Repo at once,
+            # rather than querying the saved features of each Code.
+            saved_code_features = (
+                self.db.get_saved_code_features(
+                    source_name=repo.source.name,
+                    repo_key=repo.key,
+                    analyzer_name=analyzer.name,
+                    features=features,
+                )
+                if self.use_saved_features
+                else set()
+            )
+
+            def get_code_features(code_key: str) -> Sequence[str]:
+                """Determine which features still need to be surveyed for the given
+                Code (all features if not use_saved_features)"""
+                if not saved_code_features:
+                    return cast(Sequence[str], features)
+                return [
+                    feature for feature in features
+                    if (code_key, feature) not in saved_code_features
+                ]
+
+            try:
+                for code_or_thunk in analyzer.code_generator(repo=repo, get_code_features=get_code_features):
+                    yield analyzer, code_or_thunk
+            except Exception as ex:
+                yield analyzer, ex
+
+    def advance_repo(self, repo_state: RepoState) -> None:
+        """Submit the next Job for the Repo of the given RepoState, moving
+        it to the back of repo_states so that Repos take turns.
+
+        If there are enough enumerated CodeThunks, a CodeJob is
+        submitted to analyze them, otherwise an EnumerationJob is
+        submitted to enumerate more Codes. When all Codes have been
+        enumerated and submitted, the Repo is removed from repo_states
+        and checked for completion.
+
+        """
+        repo = repo_state.repo
+        repo_id = get_repo_id(repo)
+        chunk_size = self.get_code_chunk_size()
+        if len(repo_state.code_thunks) >= chunk_size or (repo_state.exhausted and repo_state.code_thunks):
+            # Submit a chunk of CodeThunks for the same Analyzer.
+            analyzer = repo_state.code_thunks[0][0]
+            code_thunks: List[CodeThunk] = []
+            while (repo_state.code_thunks and len(code_thunks) < chunk_size
+                   and repo_state.code_thunks[0][0] is analyzer):
+                code_thunks.append(repo_state.code_thunks.popleft()[1])
+            self.submit_code_thunks(analyzer=analyzer, repo=repo, code_thunks=code_thunks)
+        elif not repo_state.exhausted:
+            future = self.enumeration_executor.submit(
+                _enumerate_codes,
+                repo_state.codes,
+                max(chunk_size, self.MIN_ENUMERATION_BATCH_SIZE),
+                self.db if self.use_saved_features else None,
+            )
+            self.add_job(future, EnumerationJob(
+                repo=repo,
+                callback=self.handle_enumeration_future,
+            ))
+            repo_state.enumerating = True
+        else:
+            del self.repo_states[repo_id]
+            self.check_repo_completion([repo])
+            return
+        self.repo_states[repo_id] = self.repo_states.pop(repo_id)
+
+    def handle_enumeration_future(self, future: concurrent.futures.Future) -> None:
+        """Handle the Codes enumerated by a completed EnumerationJob,
+        handling Job failure.
+
+        Analyzed Codes and CodeThunks with the same content as an
+        analyzed Code are saved immediately, while other CodeThunks are
+        queued to be submitted by `advance_repo()`.
+
+        """
+        job = cast(EnumerationJob, self.future_to_job[future])
+        repo_state = self.repo_states[get_repo_id(job.repo)]
+        repo_state.enumerating = False
         try:
+            items, repo_state.exhausted, saved_blob_shas = future.result()
+        except Exception as ex:
+            repo_state.exhausted = True
+            self.handle_failure(
+                ex=ex,
+                message=f'Failed to get codes for repo "{job.repo}"',
+            )
+            return
+
+        for analyzer, item in items:
             if self.reached_max_codes():
-                raise BreakException()
-            for analyzer in self.analyzers.values():
-                features = analyzer_features.get(analyzer.name)
-                if features is None:
-                    logger.info(f'Skipping completed analyzer "{analyzer}" for repo "{repo}"')
-                    continue
+                # Stop enumerating the Repo.
+                repo_state.exhausted = True
+                repo_state.code_thunks.clear()
+                break
 
-                analyzer = self.analyzers[analyzer.name]
-                try:
-                    logger.info(f'Analyzing repo "{repo}" with analyzer "{analyzer}"')
-
-                    def get_code_features(code_key: str) -> Sequence[str]:
-                        """Determine which features still need to be surveyed for the given
-                        Code (all features if not use_saved_features)"""
-                        if not self.use_saved_features:
-                            return cast(Sequence[str], features)
-                        return self.db.get_code_missing_features(
-                            source_name=repo.source.name,
-                            repo_key=repo.key,
-                            analyzer_name=analyzer.name,
-                            code_key=code_key,
-                            features=features,
-                        )
-
-                    analyzer_codes = analyzer.code_generator(
-                        repo=repo,
-                        get_code_features=get_code_features,
-                    )
-                except Exception as ex:
-                    self.handle_failure(
-                        ex=ex,
-                        message=f'Failed to get analyzer "{analyzer}" codes for repo "{repo}"',
-                    )
-                else:
-                    # Loop over each Code found by the Analyzer
-                    for code_or_thunk in analyzer_codes:
-                        if self.reached_max_codes():
-                            raise BreakException()
-
-                        if isinstance(code_or_thunk, CodeThunk):
-                            # If it's a CodeThunk, submit a Job to
-                            # analyze the Code, with a callback to
-                            # save the results.
-                            future = self.executor.submit(cast(Callable, code_or_thunk.thunk))
-                            self.future_to_job[future] = CodeJob(
-                                analyzer=analyzer,
-                                repo=repo,
-                                callback=self.handle_code_future,
-                            )
-                        else:
-                            # If it's a Code that is already analyzed,
-                            # go straight to saving the results.
-                            self.handle_code(code=cast(Code, code_or_thunk))
-        except BreakException:
-            logger.info(f'Max codes reached, "{repo}" will not be fully analyzed')
-        finally:
-            self.check_repo_completion([repo])
+            if isinstance(item, Exception):
+                self.handle_failure(
+                    ex=item,
+                    message=f'Failed to get analyzer "{analyzer}" codes for repo "{job.repo}"',
+                )
+            elif isinstance(item, CodeThunk):
+                # If it's a CodeThunk with the same content as a Code
+                # that has already been analyzed, copy its features.
+                if (analyzer.name, item.blob_sha) in saved_blob_shas and self.handle_duplicate_code(
+                        analyzer=analyzer, repo=job.repo, code_thunk=item):
+                    continue
+                # Otherwise, queue it to be submitted as part of a
+                # Job to analyze a chunk of Codes.
+                repo_state.code_thunks.append((analyzer, item))
+            else:
+                # If it's a Code that is already analyzed, go straight
+                # to saving the results.
+                self.handle_code(code=item)
 
     def handle_repo_future(self, future: concurrent.futures.Future) -> None:
         """Handle analysis of a completed RepoJob, handling Job failure."""
@@ -330,30 +852,65 @@ class CodeSurveyRunner:
                 message=f'Failed to fetch repo from source "{job.source}"',
             )
         else:
-            self.handle_repo(
-                repo=repo,
-                analyzer_features=job.analyzer_features,
-            )
+            # Queue the Repo to be analyzed once there are idle workers.
+            self.fetched_repos.append((repo, job.analyzer_features))
 
     def consume_repos(self) -> None:
         """Consume Repos from the repo_generator
 
-        When a Source yields a RepoThunk or an Analyzer yields a
-        CodeThunk, it starts a RepoJob/CodeJob and adds it to
-        future_to_job - and this function returns when the number of
-        pending tasks reaches the number of sub-process workers.
+        Jobs to analyze the Codes of current Repos are submitted in
+        turn while fewer than `max_pending_code_jobs` are pending:
+        Codes are enumerated in the background by EnumerationJobs, and
+        chunks of enumerated CodeThunks are submitted as CodeJobs.
+        Analysis of fetched Repos is started while fewer than
+        `max_workers` Repos are having Jobs submitted.
 
-        When a Source yields a Repo or an Analyzer yields a
-        Code, they are handled synchronously in this function.
+        Meanwhile, Repos are drawn from the repo_generator until
+        `prefetch_repos` Repos are being fetched or waiting to be
+        analyzed: when a Source yields a RepoThunk, it starts a RepoJob
+        in the fetching threads and adds it to future_to_job, while
+        when it yields a Repo, it is immediately queued for analysis.
 
         """
-        while (
-            # Check for idle workers
-            (len(self.future_to_job) < self.max_workers)
-            # Check for max_repos and max_codes
-            and not self.reached_max_repos()
-            and not self.reached_max_codes()
-        ):
+        while True:
+            if self.reached_max_codes():
+                # Stop submitting Jobs for current Repos that are not
+                # waiting for an EnumerationJob (which will be stopped
+                # once it completes).
+                for repo_state in list(self.repo_states.values()):
+                    if not repo_state.enumerating:
+                        logger.info(f'Max codes reached, "{repo_state.repo}" will not be fully analyzed')
+                        del self.repo_states[get_repo_id(repo_state.repo)]
+                        self.check_repo_completion([repo_state.repo])
+                break
+
+            if self.fetched_repos and len(self.repo_states) < self.max_workers:
+                repo, repo_analyzer_features = self.fetched_repos.popleft()
+                # Skip if this is a duplicate of a repo we're already analyzing.
+                if get_repo_id(repo) in self.current_repos:
+                    logger.info(f'Skipping in-progress repo "{repo}"')
+                    repo.cleanup()
+                    continue
+                self.handle_repo(
+                    repo=repo,
+                    analyzer_features=repo_analyzer_features,
+                )
+                continue
+
+            analysis_job_count = len(self.future_to_job) - self.pending_repo_job_count - self.pending_enumeration_job_count
+            if analysis_job_count < self.max_pending_code_jobs:
+                # Advance the next Repo that is not waiting for an
+                # EnumerationJob.
+                next_repo_state = next((repo_state for repo_state in self.repo_states.values()
+                                        if not repo_state.enumerating), None)
+                if next_repo_state is not None:
+                    self.advance_repo(next_repo_state)
+                    continue
+
+            if (self.pending_repo_job_count + len(self.fetched_repos) >= self.prefetch_repos
+                    or self.reached_max_repos()):
+                break
+
             # Get the next Repo or RepoThunk from the repo_generator
             try:
                 repo_or_thunk = next(self.repo_generator)
@@ -362,20 +919,10 @@ class CodeSurveyRunner:
             # Determine which Analyzer features still need to be
             # surveyed for the Repo (all features if not
             # use_saved_features)
-            repo_analyzer_features = (
-                self.db.get_repo_missing_analyzer_features(
-                    source_name=repo_or_thunk.source.name,
-                    repo_key=repo_or_thunk.key,
-                    analyzer_features=self.analyzer_features,
-                )
-                if self.use_saved_features
-                else self.analyzer_features
-            )
+            repo_analyzer_features = self.get_repo_missing_analyzer_features(get_repo_id(repo_or_thunk))
 
             # Continue if this is a duplicate of a repo we're already analyzing.
-            if any((repo.source.name == repo_or_thunk.source.name)
-                   and (repo.key == repo_or_thunk.key)
-                   for repo in self.current_repos):
+            if get_repo_id(repo_or_thunk) in self.current_repos:
                 logger.info(f'Skipping in-progress repo "{repo_or_thunk}"')
                 continue
 
@@ -386,21 +933,18 @@ class CodeSurveyRunner:
 
             if isinstance(repo_or_thunk, RepoThunk):
                 # If it's a RepoThunk, submit a Job to fetch the Repo,
-                # with a callback to handle it's analysis later.
+                # with a callback to queue it for analysis later.
                 logger.info(f'Fetching repo "{repo_or_thunk}"')
-                future = self.executor.submit(cast(Callable, repo_or_thunk.thunk))
-                self.future_to_job[future] = RepoJob(
+                future = self.fetch_executor.submit(cast(Callable, repo_or_thunk.thunk))
+                self.add_job(future, RepoJob(
                     source=repo_or_thunk.source,
                     analyzer_features=repo_analyzer_features,
                     callback=self.handle_repo_future,
-                )
+                ))
             else:
                 # If it's a Repo that doesn't need to be fetched, go
-                # straight to handling the analysis of the Repo.
-                self.handle_repo(
-                    repo=cast(Repo, repo_or_thunk),
-                    analyzer_features=repo_analyzer_features,
-                )
+                # straight to queueing it for analysis.
+                self.fetched_repos.append((cast(Repo, repo_or_thunk), repo_analyzer_features))
 
     def run(self,
             max_repos: Optional[int] = None,
@@ -414,6 +958,11 @@ class CodeSurveyRunner:
         # State initialization
         self.completed_repo_count = 0
         self.completed_code_count = 0
+        self.mean_code_seconds = None
+        self.code_job_count = 0
+        self.stats = Counter()
+        # Discard any statistics recorded outside of a run.
+        pop_stats()
         self.db = self.survey.get_db()
         self.pbars = self.get_pbars(
             disable_progress=disable_progress,
@@ -421,13 +970,38 @@ class CodeSurveyRunner:
         )
         self.repo_generator = self.get_repo_generator()
         self.executor = self.get_executor()
+        self.fetch_executor = self.get_fetch_executor()
+        self.enumeration_executor = self.get_enumeration_executor()
         # Keep track of jobs submitted to the executor
         self.future_to_job: Dict[concurrent.futures.Future, Job] = {}
-        # Keep track of Repos that are currently being analyzed.
-        self.current_repos: List[Repo] = []
+        # Counts of pending RepoJobs, and of pending CodeJobs and
+        # RepoAnalysisJobs for each Repo, so that they do not need to
+        # be counted by scanning future_to_job.
+        self.pending_repo_job_count = 0
+        self.pending_enumeration_job_count = 0
+        self.repo_pending_job_counts: Counter = Counter()
+        # Keep track of Repos that are currently being analyzed,
+        # keyed by their Source name and key.
+        self.current_repos: Dict[Tuple[str, str], Repo] = {}
+        # Current Repos for which Jobs are still being submitted, in
+        # the order they will next be advanced.
+        self.repo_states: Dict[Tuple[str, str], RepoState] = {}
+        # Repos that have been fetched and are waiting to be analyzed,
+        # along with the Analyzer features to survey for them.
+        self.fetched_repos: Deque[Tuple[Repo, Dict[str, Sequence[str]]]] = deque()
 
         logger.info(f'Preparing database in {self.db.filepath}')
         self.db.initialize()
+        self.load_repo_feature_masks()
+        # Save Codes in a background thread, so that the results of
+        # completed Jobs can be handled without waiting for them to
+        # be committed.
+        self.code_writer = CodeFeatureWriter(
+            self.db,
+            save_occurrences=self.save_occurrences,
+            batch_size=self.CODE_WRITE_BATCH_SIZE,
+            interval_seconds=self.CODE_WRITE_INTERVAL_SECONDS,
+        )
 
         with logging_redirect_tqdm(loggers=[logger]):
             try:
@@ -446,17 +1020,18 @@ class CodeSurveyRunner:
                         self.future_to_job,
                         return_when=concurrent.futures.FIRST_COMPLETED,
                     )
-                    # Process each finished job
+                    # Process each finished job, then remove it from
+                    # future_to_job.
+                    done_repos = []
                     for future in done:
                         job = self.future_to_job[future]
                         job.callback(future)
-                    # Remove finished sub-tasks from future_to_job
-                    self.future_to_job = {future: self.future_to_job[future]
-                                          for future in self.future_to_job
-                                          if future not in done}
+                        self.remove_job(future)
+                        if isinstance(job, (CodeJob, RepoAnalysisJob)):
+                            done_repos.append(job.repo)
                     # Finish the processing of any completed
                     # current_repos, removing them from current_repos.
-                    self.check_repo_completion(self.current_repos)
+                    self.check_repo_completion(done_repos)
             except KeyboardInterrupt:
                 logger.info('Interrupted')
                 raise
@@ -466,11 +1041,44 @@ class CodeSurveyRunner:
                 for process in self.executor._processes.values():
                     process.terminate()
                 self.executor.shutdown()
-                for repo in self.current_repos:
+                # Pending enumerations were cancelled above, so only
+                # wait for running enumerations to finish.
+                self.enumeration_executor.shutdown(wait=True)
+                # Pending fetches were cancelled above, but fetches
+                # that are already running cannot be cancelled, so
+                # wait for them to finish in order to cleanup the
+                # fetched Repos.
+                self.fetch_executor.shutdown(wait=True)
+                for future, job in self.future_to_job.items():
+                    if isinstance(job, RepoJob) and not future.cancelled() and future.exception() is None:
+                        future.result().cleanup()
+                for repo, _ in self.fetched_repos:
+                    repo.cleanup()
+                for repo in self.current_repos.values():
                     repo.cleanup()
                 for pbar in self.pbars.values():
                     pbar.close()
-                self.db.close()
+                # Save any queued Codes, so that they are not lost
+                # when the run is interrupted.
+                propagating_ex = sys.exc_info()[1]
+                try:
+                    self.code_writer.close()
+                except Exception as ex:
+                    # Do not replace an exception that is already
+                    # propagating.
+                    if propagating_ex is None:
+                        raise
+                    logger.error(f'Failed to save queued codes: {ex}')
+                finally:
+                    self.db.close()
+                    self.stats.update(pop_stats())
+                    if self.stats:
+                        stats_str = ', '.join(f'{name}={count}' for name, count in sorted(self.stats.items()))
+                        logger.info(f'Run statistics: {stats_str}')
+                    if self.stats[DEDUPLICATED_CODES_STAT] and self.completed_code_count:
+                        dedup_rate = self.stats[DEDUPLICATED_CODES_STAT] / self.completed_code_count
+                        logger.info((f'Copied features of {self.stats[DEDUPLICATED_CODES_STAT]} of '
+                                     f'{self.completed_code_count} codes ({dedup_rate:.1%}) from identical Git blobs'))
 
 
 class CodeSurvey:
@@ -509,11 +1117,19 @@ class CodeSurvey:
                  sources: Sequence[Source],
                  analyzers: Sequence[Analyzer],
                  db_filepath: str = ':memory:',
+                 db_profile: str = 'default',
+                 db_normalized: bool = False,
                  max_workers: Optional[int] = 1,
+                 max_fetch_workers: Optional[int] = None,
+                 max_pending_code_jobs: Optional[int] = None,
+                 prefetch_repos: Optional[int] = None,
                  continue_on_failure: bool = True,
                  save_code_features: bool = True,
                  save_occurrences: bool = True,
-                 use_saved_features: bool = True):
+                 compact_occurrences: bool = False,
+                 use_saved_features: bool = True,
+                 code_chunk_size: Optional[int] = 1,
+                 repo_local_analysis: bool = False):
         """
         Args:
             sources: Sources from which to fetch Repos of Codes
@@ -523,9 +1139,34 @@ class CodeSurvey:
             db_filepath: Path to an sqlite database file for persisting survey
                 results. Creates a new sqlite database if the path does not
                 exist. Defaults to a non-persistent in-memory database.
+            db_profile: Performance profile of the sqlite database
+                connection: `'default'` uses sqlite's default settings,
+                while `'fast'` enables write-ahead logging and relaxed
+                syncing to disk, which speeds up saving results and allows
+                the database to be read while a survey is running, but
+                risks losing the most recent results on a power failure
+                or operating system crash. See [Performance
+                profiles](database.md#performance-profiles).
+            db_normalized: If `True`, store survey results in the
+                normalized database schema, where names and keys are
+                stored once and referenced by integer IDs to reduce the
+                size of the database. An existing database at
+                `db_filepath` is migrated to the normalized schema. See
+                [Normalized schema](database.md#normalized-schema).
             max_workers: The maximum number of parallel worker processes for
-                fetching Repos from Sources and executing Analyzers. Defaults
-                to a single worker.
+                executing Analyzers. Defaults to a single worker.
+            max_fetch_workers: The maximum number of parallel worker threads
+                for fetching Repos from Sources (e.g. cloning Git
+                repositories), which do not occupy the worker processes
+                executing Analyzers. Defaults to `max_workers`.
+            max_pending_code_jobs: The maximum number of Jobs analyzing
+                chunks of Codes to be pending in worker processes at a time.
+                Codes of each Repo are enumerated as pending Jobs complete, so
+                that the memory used does not grow with the size of Repos.
+                Defaults to twice `max_workers`.
+            prefetch_repos: The maximum number of Repos to be fetching or
+                holding fetched ahead of their analysis. Defaults to
+                `max_fetch_workers`.
             continue_on_failure: If `True`, exceptions raised by Sources and
                 Analyzers will be logged, but will not halt the survey.
             save_code_features: If `True`, features of individual Codes will be
@@ -534,9 +1175,32 @@ class CodeSurvey:
                 features of its respective Repo.
             save_occurrences: If `True`, occurrence objects returned by
                 FeatureFinders will be saved in the survey database.
+            compact_occurrences: If `True`, occurrences that consist of
+                only a line number (as returned by the built-in
+                FeatureFinders) are saved in a compact binary encoding
+                instead of as JSON. See [Compact
+                occurrences](database.md#compact-occurrences).
             use_saved_features: If `True`, re-use saved features from an
                 Analyzer for a Code when they already exist in the survey
-                database. Otherwise, reapply all Analyzers to all Codes.
+                database. For Codes of
+                [Git-backed][codesurvey.sources.Source.git_backed] Repos,
+                saved features of Codes with identical Git blobs are also
+                copied instead of re-analyzing the Code (as long as those
+                Code features are retained with `save_code_features=True`,
+                or belong to a Repo that is still being analyzed). Otherwise,
+                reapply all Analyzers to all Codes.
+            code_chunk_size: The number of Codes from a Repo to send to
+                a worker process for analysis at a time. Larger chunks reduce
+                the overhead of communicating with workers for Repos with
+                many small Codes. If `None`, the chunk size is adapted to the
+                time taken to analyze each Code, targeting chunks that take
+                around 0.1 seconds. Defaults to sending each Code separately.
+            repo_local_analysis: If `True`, all Codes of a Repo are analyzed
+                by a single worker process, which only returns the aggregated
+                features of the Repo. This avoids the overhead of sending,
+                saving, and deleting the features of each Code, but requires
+                `save_code_features=False`, and `max_codes` is only checked
+                after each Repo is analyzed.
 
         Raises:
             ValueError: Invalid survey configuration was specified.
@@ -561,17 +1225,33 @@ class CodeSurvey:
         self.analyzer_features = {analyzer.name: analyzer.get_feature_names()
                                   for analyzer in analyzers}
         self.db_filepath = db_filepath
+        if db_profile not in DATABASE_PROFILES:
+            profiles_str = ', '.join(DATABASE_PROFILES)
+            raise ValueError(f'Unknown db_profile "{db_profile}", expected one of: {profiles_str}')
+        self.db_profile = db_profile
+        self.db_normalized = db_normalized
         self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_fetch_workers = max_fetch_workers or self.max_workers
+        self.max_pending_code_jobs = max_pending_code_jobs or 2 * self.max_workers
+        self.prefetch_repos = prefetch_repos or self.max_fetch_workers
         self.continue_on_failure = continue_on_failure
         self.save_code_features = save_code_features
         self.save_occurrences = save_occurrences
+        self.compact_occurrences = compact_occurrences
         self.use_saved_features = use_saved_features
+        if code_chunk_size is not None and code_chunk_size < 1:
+            raise ValueError('code_chunk_size must be at least 1')
+        self.code_chunk_size = code_chunk_size
+        if repo_local_analysis and save_code_features:
+            raise ValueError('repo_local_analysis requires save_code_features=False')
+        self.repo_local_analysis = repo_local_analysis
 
         self._runner = CodeSurveyRunner(self)
 
     def get_db(self):
         """Returns the Database that persists survey results."""
-        return Database(self.db_filepath)
+        return Database(self.db_filepath, profile=self.db_profile, normalized=self.db_normalized,
+                        compact_occurrences=self.compact_occurrences)
 
     def run(self, *,
             max_repos: Optional[int] = None,
@@ -605,6 +1285,12 @@ class CodeSurvey:
             progress_analyzer_features=progress_analyzer_features,
         )
 
+    def get_run_stats(self) -> Dict[str, int]:
+        """Returns counters of notable events during the most recent
+        [`run()`][codesurvey.CodeSurvey.run], such as the number of
+        restarted parser processes."""
+        return dict(self._runner.stats)
+
     def get_repo_features(self, *,
                           source_names: Optional[Sequence[str]] = None,
                           analyzer_names: Optional[Sequence[str]] = None,
@@ -624,10 +1310,121 @@ class CodeSurvey:
                                                analyzer_names=analyzer_names,
                                                feature_names=feature_names)
 
+    def iter_repo_features(self, *,
+                           source_names: Optional[Sequence[str]] = None,
+                           analyzer_names: Optional[Sequence[str]] = None,
+                           feature_names: Optional[Sequence[str]] = None,
+                           after: Optional[Sequence[str]] = None,
+                           batch_size: int = 1000) -> Iterator[RepoFeature]:
+        """Yields RepoFeatures of surveyed Repos ordered by their
+        [`sort_key`][codesurvey.RepoFeature.sort_key], querying them from
+        the database in batches so that memory use does not grow with
+        the number of results.
+
+        Args:
+            source_names: If specified, only features from the named Sources
+                will be returned.
+            analyzer_names: If specified, only features from the named Analyzers
+                will be returned.
+            feature_names: If specified, only results for the named features
+                will be returned.
+            after: If specified, only features after the given `sort_key`
+                of a previously returned RepoFeature will be returned
+                (e.g. to resume an interrupted export).
+            batch_size: The number of RepoFeatures to query from the
+                database at a time.
+
+        """
+        return self.get_db().iter_repo_features(source_names=source_names,
+                                                analyzer_names=analyzer_names,
+                                                feature_names=feature_names,
+                                                after=after,
+                                                batch_size=batch_size)
+
+    def get_repo_features_columns(self, *,
+                                  source_names: Optional[Sequence[str]] = None,
+                                  analyzer_names: Optional[Sequence[str]] = None,
+                                  feature_names: Optional[Sequence[str]] = None) -> Dict[str, Column]:
+        """Returns the fields of surveyed RepoFeatures (excluding
+        `repo_metadata`) as columns, which use much less memory than
+        RepoFeature objects for large surveys. Requires `numpy`.
+
+        Counts are returned as NumPy arrays, `updated` as a NumPy
+        array of `datetime64` values, and names and keys as
+        [`DictionaryColumns`][codesurvey.columns.DictionaryColumn]. The
+        columns can be converted to an Arrow table or Parquet file with
+        [`to_arrow_table()`][codesurvey.columns.to_arrow_table] or
+        [`write_parquet()`][codesurvey.columns.write_parquet].
+
+        Args:
+            source_names: If specified, only features from the named Sources
+                will be returned.
+            analyzer_names: If specified, only features from the named Analyzers
+                will be returned.
+            feature_names: If specified, only results for the named features
+                will be returned.
+
+        Returns:
+            A dictionary mapping RepoFeature field names to columns.
+
+        """
+        return self.get_db().get_repo_features_columns(source_names=source_names,
+                                                       analyzer_names=analyzer_names,
+                                                       feature_names=feature_names)
+
+    def get_feature_summaries(self, *,
+                              source_names: Optional[Sequence[str]] = None,
+                              analyzer_names: Optional[Sequence[str]] = None,
+                              feature_names: Optional[Sequence[str]] = None,
+                              quantiles: Sequence[float] = (0.5,),
+                              metadata_key: Optional[str] = None,
+                              metadata_buckets: Optional[Sequence[float]] = None) -> List[FeatureSummary]:
+        """Returns FeatureSummaries of the number of surveyed Repos using each
+        feature, the total occurrences of the feature, and quantiles of its
+        occurrences per Repo.
+
+        Summaries are aggregated by the database, so only the
+        summaries (rather than all RepoFeatures) are loaded into memory.
+
+        Example usage to summarize Repos in buckets of GitHub stars:
+
+        ```python
+        survey.get_feature_summaries(
+            quantiles=[0.5, 0.9],
+            metadata_key='stars',
+            metadata_buckets=[0, 10, 100, 1000],
+        )
+        ```
+
+        Args:
+            source_names: If specified, only features from the named Sources
+                will be summarized.
+            analyzer_names: If specified, only features from the named Analyzers
+                will be summarized.
+            feature_names: If specified, only the named features will be
+                summarized.
+            quantiles: Quantiles (between 0 and 1) of the occurrences of
+                each feature per Repo to compute. Defaults to the median.
+            metadata_key: If specified, separate summaries are returned
+                for Repos with each value of the named Repo metadata.
+            metadata_buckets: If specified with a `metadata_key` with
+                numeric values, separate summaries are returned for Repos
+                in each bucket of metadata values starting at each of the
+                given lower bounds.
+
+        """
+        return self.get_db().get_feature_summaries(source_names=source_names,
+                                                   analyzer_names=analyzer_names,
+                                                   feature_names=feature_names,
+                                                   quantiles=quantiles,
+                                                   metadata_key=metadata_key,
+                                                   metadata_buckets=metadata_buckets)
+
     def get_code_features(self, *,
                           source_names: Optional[Sequence[str]] = None,
                           analyzer_names: Optional[Sequence[str]] = None,
-                          feature_names: Optional[Sequence[str]] = None) -> List[CodeFeature]:
+                          feature_names: Optional[Sequence[str]] = None,
+                          include_occurrences: bool = True) -> List[CodeFeature]:
         """Returns CodeFeatures of surveyed Codes.
 
         Only returns results from runs where `save_code_results` was `True`.
@@ -639,11 +1436,85 @@ class CodeSurvey:
                 will be returned.
             feature_names: If specified, only results for the named features
                 will be returned.
+            include_occurrences: If `False`, the saved occurrences of
+                features are not loaded, and the `occurrences` of all
+                returned CodeFeatures are `None`.
 
         """
         return self.get_db().get_code_features(source_names=source_names,
                                                analyzer_names=analyzer_names,
-                                               feature_names=feature_names)
+                                               feature_names=feature_names,
+                                               include_occurrences=include_occurrences)
+
+    def iter_code_features(self, *,
+                           source_names: Optional[Sequence[str]] = None,
+                           analyzer_names: Optional[Sequence[str]] = None,
+                           feature_names: Optional[Sequence[str]] = None,
+                           include_occurrences: bool = True,
+                           after: Optional[Sequence[str]] = None,
+                           batch_size: int = 1000) -> Iterator[CodeFeature]:
+        """Yields CodeFeatures of surveyed Codes ordered by their
+        [`sort_key`][codesurvey.CodeFeature.sort_key], querying them from
+        the database in batches so that memory use does not grow with
+        the number of results.
+
+        Only returns results from runs where `save_code_results` was `True`.
+
+        Args:
+            source_names: If specified, only features from the named Sources
+                will be returned.
+            analyzer_names: If specified, only features from the named Analyzers
+                will be returned.
+            feature_names: If specified, only results for the named features
+                will be returned.
+            include_occurrences: If `False`, the saved occurrences of
+                features are not loaded, and the `occurrences` of all
+                returned CodeFeatures are `None`.
+            after: If specified, only features after the given `sort_key`
+                of a previously returned CodeFeature will be returned
+                (e.g. to resume an interrupted export).
+            batch_size: The number of CodeFeatures to query from the
+                database at a time.
+
+        """
+        return self.get_db().iter_code_features(source_names=source_names,
+                                                analyzer_names=analyzer_names,
+                                                feature_names=feature_names,
+                                                include_occurrences=include_occurrences,
+                                                after=after,
+                                                batch_size=batch_size)
+
+    def get_code_features_columns(self, *,
+                                  source_names: Optional[Sequence[str]] = None,
+                                  analyzer_names: Optional[Sequence[str]] = None,
+                                  feature_names: Optional[Sequence[str]] = None) -> Dict[str, Column]:
+        """Returns the fields of surveyed CodeFeatures (excluding
+        `occurrences` and `repo_metadata`) as columns, which use much less
+        memory than CodeFeature objects for large surveys. Requires
+        `numpy`.
+
+        Columns are returned as for
+        [`get_repo_features_columns()`][codesurvey.CodeSurvey.get_repo_features_columns],
+        except that `occurrence_count` is a NumPy masked array that is
+        masked for Codes where analysis of the feature was skipped.
+
+        Only returns results from runs where `save_code_results` was `True`.
+
+        Args:
+            source_names: If specified, only features from the named Sources
+                will be returned.
+            analyzer_names: If specified, only features from the named Analyzers
+                will be returned.
+            feature_names: If specified, only results for the named features
+                will be returned.
+
+        Returns:
+            A dictionary mapping CodeFeature field names to columns.
+
+        """
+        return self.get_db().get_code_features_columns(source_names=source_names,
+                                                       analyzer_names=analyzer_names,
+                                                       feature_names=feature_names)
 
     def get_survey_tree(self, *,
                         source_names: Optional[Sequence[str]] = None,
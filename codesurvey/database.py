@@ -3,8 +3,15 @@
 from collections import defaultdict
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, Dict, List, Mapping, Optional, Protocol, Sequence, Tuple
-
+from functools import wraps
+import queue
+import struct
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Protocol, Sequence, Set, Tuple, TypeVar, cast
+
+from peewee import Node, Tuple as TupleNode
+from playhouse.migrate import SqliteMigrator, migrate
 from playhouse.sqlite_ext import (
     SqliteExtDatabase,
     Model,
@@ -13,11 +20,19 @@ from playhouse.sqlite_ext import (
     IntegerField,
     JSONField,
     CompositeKey,
+    Case,
+    JOIN,
+    Value,
+    chunked,
     fn,
 )
 
 from codesurvey.sources import Repo
 from codesurvey.analyzers import Code
+from codesurvey.columns import (
+    INTEGER_COLUMN, NULLABLE_INTEGER_COLUMN, STRING_COLUMN, TIMESTAMP_COLUMN,
+    Column, read_columns,
+)
 
 
 @dataclass(frozen=True)
@@ -49,6 +64,13 @@ class RepoFeature:
     repo_metadata: Dict[str, Any]
     """Metadata of the Repo provided by the Source."""
 
+    @property
+    def sort_key(self) -> Tuple[str, str, str, str]:
+        """Key by which RepoFeatures are ordered by
+        `iter_repo_features()`, which can be passed as its `after`
+        argument to resume iteration after this RepoFeature."""
+        return (self.source_name, self.repo_key, self.analyzer_name, self.feature_name)
+
 
 @dataclass(frozen=True)
 class CodeFeature:
@@ -77,9 +99,70 @@ class CodeFeature:
     occurrences: Optional[List[Dict[str, Any]]]
     """Original occurrence objects returned by FeatureFinders."""
 
+    blob_sha: Optional[str]
+    """SHA of the Git blob of the Code's content, if known."""
+
     repo_metadata: Dict[str, Any]
     """Metadata of the Repo provided by the Source."""
 
+    @property
+    def sort_key(self) -> Tuple[str, str, str, str, str]:
+        """Key by which CodeFeatures are ordered by
+        `iter_code_features()`, which can be passed as its `after`
+        argument to resume iteration after this CodeFeature."""
+        return (self.source_name, self.repo_key, self.analyzer_name, self.code_key, self.feature_name)
+
+
+@dataclass(frozen=True)
+class FeatureSummary:
+    """Aggregate statistics of a feature across surveyed Repos."""
+
+    analyzer_name: str
+    """Name of the Analyzer that produced this feature."""
+
+    feature_name: str
+    """Name of the analyzed feature."""
+
+    metadata_value: Any
+    """Value of the grouped Repo metadata (or the lower bound of its
+    bucket) for the Repos in this summary, or `None` if summaries were
+    not grouped by metadata or the Repos have no value for it."""
+
+    repo_count: int
+    """Number of Repos analyzed for this feature."""
+
+    repo_occurrence_count: int
+    """Number of Repos containing this feature."""
+
+    occurrence_count: int
+    """Total number of occurrences of this feature in all Repos."""
+
+    code_occurrence_count: int
+    """Total number of Codes containing this feature in all Repos."""
+
+    code_total_count: int
+    """Total number of Codes analyzed for this feature in all Repos."""
+
+    occurrence_count_quantiles: Dict[float, float]
+    """Mapping of each requested quantile to that quantile of the
+    number of occurrences of this feature per Repo (linearly
+    interpolated between Repos)."""
+
+
+@dataclass(frozen=True)
+class RepoFeatureCounts:
+    """Counts of a feature within a Repo, aggregated from the features of
+    its Codes without saving CodeFeatures."""
+
+    occurrence_count: int
+    """Number of occurrences of this feature within the Repo."""
+
+    code_occurrence_count: int
+    """Number of Codes within the Repo containing this feature."""
+
+    code_total_count: int
+    """Total number of Codes analyzed for this feature within the Repo."""
+
 
 class MetadataCache(Protocol):
     """Memoized function for retrieving Repo metadata."""
@@ -88,12 +171,239 @@ class MetadataCache(Protocol):
         pass
 
 
+_PACKED_LINE_NUMBERS_HEADER = b'\x01'
+_MAX_PACKED_LINE_NUMBER = 2 ** 32 - 1
+
+
+def pack_occurrences(occurrences: Any) -> Optional[bytes]:
+    """Returns the given occurrences in a compact binary encoding, or
+    `None` if they cannot be encoded.
+
+    Only lists of occurrences that each consist of a single
+    non-negative integer `first_line_number` (as returned by the
+    built-in FeatureFinders) can be encoded: their line numbers are
+    packed as little-endian 32-bit unsigned integers.
+
+    """
+    if not isinstance(occurrences, list):
+        return None
+    line_numbers = []
+    for occurrence in occurrences:
+        if not (isinstance(occurrence, dict) and len(occurrence) == 1):
+            return None
+        line_number = occurrence.get('first_line_number')
+        if type(line_number) is not int or not 0 <= line_number <= _MAX_PACKED_LINE_NUMBER:
+            return None
+        line_numbers.append(line_number)
+    return _PACKED_LINE_NUMBERS_HEADER + struct.pack(f'<{len(line_numbers)}I', *line_numbers)
+
+
+def unpack_occurrences(packed: bytes) -> List[Dict[str, Any]]:
+    """Returns the occurrences encoded by `pack_occurrences()`."""
+    if packed[:1] != _PACKED_LINE_NUMBERS_HEADER:
+        raise ValueError('Unknown encoding of packed occurrences')
+    return [
+        {'first_line_number': line_number}
+        for line_number, in struct.iter_unpack('<I', packed[1:])
+    ]
+
+
+class OccurrencesField(JSONField):
+    """JSONField for the occurrences of Code features that can also
+    read (and, if `compact=True`, write) occurrences encoded by
+    `pack_occurrences()`, falling back to JSON for occurrences that
+    cannot be packed."""
+
+    def __init__(self, *, compact: bool, **kwargs):
+        self.compact = compact
+        super().__init__(**kwargs)
+
+    def db_value(self, value):
+        if self.compact and value is not None and not isinstance(value, Node):
+            packed = pack_occurrences(value)
+            if packed is not None:
+                return packed
+        return super().db_value(value)
+
+    def python_value(self, value):
+        if isinstance(value, bytes):
+            return unpack_occurrences(value)
+        return super().python_value(value)
+
+
+DATABASE_PROFILES: Dict[str, Dict[str, Any]] = {
+    'default': {},
+    'fast': {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        # Negative cache sizes are in KiB.
+        'cache_size': -64 * 1024,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'memory',
+    },
+}
+"""SQLite pragmas applied to each connection to a survey Database, by
+the name of the performance profile."""
+
+
+_CODE_FEATURE_ID_LOOKUPS = {
+    'code_id': ('(SELECT code_dim.id FROM code_dim'
+                ' JOIN repo_dim ON repo_dim.id = code_dim.repo_id'
+                ' JOIN source_dim ON source_dim.id = repo_dim.source_id'
+                ' WHERE source_dim.name = {row}.source_name AND repo_dim.key = {row}.repo_key'
+                ' AND code_dim.key = {row}.code_key)'),
+    'feature_id': ('(SELECT feature_dim.id FROM feature_dim'
+                   ' JOIN analyzer_dim ON analyzer_dim.id = feature_dim.analyzer_id'
+                   ' WHERE analyzer_dim.name = {row}.analyzer_name AND feature_dim.name = {row}.feature_name)'),
+}
+_REPO_ID_LOOKUP = ('(SELECT repo_dim.id FROM repo_dim'
+                   ' JOIN source_dim ON source_dim.id = repo_dim.source_id'
+                   ' WHERE source_dim.name = {row}.source_name AND repo_dim.key = {row}.repo_key)')
+_INTERN_DIMENSIONS_SQL = """
+    INSERT OR IGNORE INTO source_dim (name) VALUES (NEW.source_name);
+    INSERT OR IGNORE INTO repo_dim (source_id, key)
+        VALUES ((SELECT id FROM source_dim WHERE name = NEW.source_name), NEW.repo_key);
+    INSERT OR IGNORE INTO analyzer_dim (name) VALUES (NEW.analyzer_name);
+    INSERT OR IGNORE INTO feature_dim (analyzer_id, name)
+        VALUES ((SELECT id FROM analyzer_dim WHERE name = NEW.analyzer_name), NEW.feature_name);
+"""
+
+NORMALIZED_SCHEMA_SQL = [
+    'CREATE TABLE IF NOT EXISTS source_dim (id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL UNIQUE)',
+    ('CREATE TABLE IF NOT EXISTS repo_dim (id INTEGER PRIMARY KEY, source_id INTEGER NOT NULL, '
+     'key VARCHAR(255) NOT NULL, UNIQUE (source_id, key))'),
+    'CREATE TABLE IF NOT EXISTS analyzer_dim (id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL UNIQUE)',
+    ('CREATE TABLE IF NOT EXISTS feature_dim (id INTEGER PRIMARY KEY, analyzer_id INTEGER NOT NULL, '
+     'name VARCHAR(255) NOT NULL, UNIQUE (analyzer_id, name))'),
+    ('CREATE TABLE IF NOT EXISTS code_dim (id INTEGER PRIMARY KEY, repo_id INTEGER NOT NULL, '
+     'key VARCHAR(255) NOT NULL, UNIQUE (repo_id, key))'),
+    ('CREATE TABLE IF NOT EXISTS code_feature_data (code_id INTEGER NOT NULL, feature_id INTEGER NOT NULL, '
+     'updated INTEGER NOT NULL, occurrence_count INTEGER, occurrences JSON, blob_sha VARCHAR(255), '
+     'PRIMARY KEY (code_id, feature_id))'),
+    'CREATE INDEX IF NOT EXISTS code_feature_data_blob_sha ON code_feature_data (blob_sha)',
+    ('CREATE TABLE IF NOT EXISTS repo_feature_data (repo_id INTEGER NOT NULL, feature_id INTEGER NOT NULL, '
+     'updated INTEGER NOT NULL, occurrence_count INTEGER NOT NULL, code_occurrence_count INTEGER NOT NULL, '
+     'code_total_count INTEGER NOT NULL, PRIMARY KEY (repo_id, feature_id))'),
+    # Views with the same names and columns as the tables of the
+    # default schema.
+    """CREATE VIEW IF NOT EXISTS code_feature AS
+    SELECT code_feature_data.updated, source_dim.name AS source_name, repo_dim.key AS repo_key,
+           analyzer_dim.name AS analyzer_name, code_dim.key AS code_key, feature_dim.name AS feature_name,
+           code_feature_data.occurrence_count, code_feature_data.occurrences, code_feature_data.blob_sha
+    FROM code_feature_data
+    JOIN code_dim ON code_dim.id = code_feature_data.code_id
+    JOIN repo_dim ON repo_dim.id = code_dim.repo_id
+    JOIN source_dim ON source_dim.id = repo_dim.source_id
+    JOIN feature_dim ON feature_dim.id = code_feature_data.feature_id
+    JOIN analyzer_dim ON analyzer_dim.id = feature_dim.analyzer_id""",
+    """CREATE VIEW IF NOT EXISTS repo_feature AS
+    SELECT repo_feature_data.updated, source_dim.name AS source_name, repo_dim.key AS repo_key,
+           analyzer_dim.name AS analyzer_name, feature_dim.name AS feature_name,
+           repo_feature_data.occurrence_count, repo_feature_data.code_occurrence_count,
+           repo_feature_data.code_total_count
+    FROM repo_feature_data
+    JOIN repo_dim ON repo_dim.id = repo_feature_data.repo_id
+    JOIN source_dim ON source_dim.id = repo_dim.source_id
+    JOIN feature_dim ON feature_dim.id = repo_feature_data.feature_id
+    JOIN analyzer_dim ON analyzer_dim.id = feature_dim.analyzer_id""",
+    # Inserts into the views intern their strings and upsert rows
+    # into the underlying tables.
+    f"""CREATE TRIGGER IF NOT EXISTS code_feature_insert INSTEAD OF INSERT ON code_feature BEGIN
+    {_INTERN_DIMENSIONS_SQL}
+    INSERT OR IGNORE INTO code_dim (repo_id, key) VALUES ({_REPO_ID_LOOKUP.format(row='NEW')}, NEW.code_key);
+    INSERT INTO code_feature_data (code_id, feature_id, updated, occurrence_count, occurrences, blob_sha)
+        VALUES ({_CODE_FEATURE_ID_LOOKUPS['code_id'].format(row='NEW')},
+                {_CODE_FEATURE_ID_LOOKUPS['feature_id'].format(row='NEW')},
+                NEW.updated, NEW.occurrence_count, NEW.occurrences, NEW.blob_sha)
+        ON CONFLICT (code_id, feature_id) DO UPDATE SET
+            updated = excluded.updated, occurrence_count = excluded.occurrence_count,
+            occurrences = excluded.occurrences, blob_sha = excluded.blob_sha;
+END""",
+    f"""CREATE TRIGGER IF NOT EXISTS code_feature_delete INSTEAD OF DELETE ON code_feature BEGIN
+    DELETE FROM code_feature_data
+        WHERE code_id = {_CODE_FEATURE_ID_LOOKUPS['code_id'].format(row='OLD')}
+        AND feature_id = {_CODE_FEATURE_ID_LOOKUPS['feature_id'].format(row='OLD')};
+    DELETE FROM code_dim
+        WHERE id = {_CODE_FEATURE_ID_LOOKUPS['code_id'].format(row='OLD')}
+        AND NOT EXISTS (SELECT 1 FROM code_feature_data WHERE code_id = code_dim.id);
+END""",
+    f"""CREATE TRIGGER IF NOT EXISTS repo_feature_insert INSTEAD OF INSERT ON repo_feature BEGIN
+    {_INTERN_DIMENSIONS_SQL}
+    INSERT INTO repo_feature_data (repo_id, feature_id, updated, occurrence_count,
+                                   code_occurrence_count, code_total_count)
+        VALUES ({_REPO_ID_LOOKUP.format(row='NEW')},
+                {_CODE_FEATURE_ID_LOOKUPS['feature_id'].format(row='NEW')},
+                NEW.updated, NEW.occurrence_count, NEW.code_occurrence_count, NEW.code_total_count)
+        ON CONFLICT (repo_id, feature_id) DO UPDATE SET
+            updated = excluded.updated, occurrence_count = excluded.occurrence_count,
+            code_occurrence_count = excluded.code_occurrence_count, code_total_count = excluded.code_total_count;
+END""",
+]
+"""Statements creating the normalized schema of a survey Database."""
+
+
+FeatureType = TypeVar('FeatureType', RepoFeature, CodeFeature)
+
+DatabaseMethod = TypeVar('DatabaseMethod', bound=Callable[..., Any])
+
+
+def synchronized(method: DatabaseMethod) -> DatabaseMethod:
+    """Decorator for Database methods that must hold the Database's lock
+    while they use its connection."""
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+
+    return cast(DatabaseMethod, wrapper)
+
+
 class Database:
-    """Stores and fetches survey results from an sqlite database."""
+    """Stores and fetches survey results from an sqlite database.
 
-    def __init__(self, filepath: str):
+    A Database may be used from multiple threads: they share a single
+    connection, which is only used by one thread at a time.
+
+    """
+
+    def __init__(self, filepath: str, *, profile: str = 'default', normalized: bool = False,
+                 compact_occurrences: bool = False):
+        """
+        Args:
+            filepath: Path to the sqlite database file.
+            profile: Name of the performance profile in `DATABASE_PROFILES`
+                that determines the sqlite pragmas of the connection.
+            normalized: If `True`, the database is initialized with (or
+                migrated to) the normalized schema, where the names and keys
+                of `code_feature` and `repo_feature` rows are stored once
+                in tables of integer IDs, and `code_feature` and
+                `repo_feature` are views. Databases that already use the
+                normalized schema continue to use it.
+            compact_occurrences: If `True`, occurrences are saved in the
+                compact binary encoding of `pack_occurrences()` when
+                possible instead of as JSON. Occurrences in either
+                encoding can always be read.
+
+        Raises:
+            ValueError: An unknown profile was specified.
+        """
+        if profile not in DATABASE_PROFILES:
+            profiles_str = ', '.join(DATABASE_PROFILES)
+            raise ValueError(f'Unknown database profile "{profile}", expected one of: {profiles_str}')
         self.filepath = filepath
-        self.db = SqliteExtDatabase(self.filepath)
+        self.profile = profile
+        self.normalized = normalized
+        self.compact_occurrences = compact_occurrences
+        # Share a single connection between threads, so that threads
+        # see the same in-memory database.
+        self.db = SqliteExtDatabase(
+            self.filepath,
+            pragmas=DATABASE_PROFILES[profile],
+            thread_safe=False,
+            check_same_thread=False,
+        )
+        self._lock = threading.RLock()
 
         class BaseModel(Model):
             class Meta:
@@ -150,6 +460,10 @@ class Database:
                     'code_key',
                     'feature_name',
                 )
+                indexes = (
+                    # For finding features of Codes with identical Git blobs.
+                    (('analyzer_name', 'blob_sha'), False),
+                )
 
             updated = TimestampField()
             source_name = CharField()
@@ -159,22 +473,88 @@ class Database:
             feature_name = CharField()
             # null occurrence_count or occurrences indicates an ignored code.
             occurrence_count = IntegerField(null=True)
-            occurrences = JSONField(null=True)
+            occurrences = OccurrencesField(null=True, compact=compact_occurrences)
+            blob_sha = CharField(null=True)
 
         self.RepoMetadataModel = RepoMetadataModel
         self.RepoFeatureModel = RepoFeatureModel
         self.CodeFeatureModel = CodeFeatureModel
         self.tables = [self.RepoMetadataModel, self.RepoFeatureModel, self.CodeFeatureModel]
 
+    @synchronized
     def initialize(self):
         """Connect to the database and initialize the schema."""
         self.db.connect()
-        self.db.create_tables(self.tables)
+        if self.db.table_exists('code_feature_data'):
+            self.normalized = True
+        self.migrate()
+        if self.normalized:
+            self.db.create_tables([self.RepoMetadataModel])
+            self.migrate_to_normalized_schema()
+        else:
+            self.db.create_tables(self.tables)
+
+    @synchronized
+    def migrate(self):
+        """Add any columns missing from tables created by earlier versions
+        of codesurvey."""
+        migrator = SqliteMigrator(self.db)
+        for model in self.tables:
+            table_name = model._meta.table_name
+            if not self.db.table_exists(table_name):
+                continue
+            column_names = {column.name for column in self.db.get_columns(table_name)}
+            migrate(*[
+                migrator.add_column(table_name, field.column_name, field)
+                for field in model._meta.sorted_fields
+                if field.column_name not in column_names
+            ])
+
+    @synchronized
+    def migrate_to_normalized_schema(self):
+        """Create the normalized schema, moving the rows of any existing
+        `code_feature` and `repo_feature` tables into it.
+
+        The space freed from the database file by the migration is only
+        returned to the filesystem after running sqlite's `VACUUM`.
 
+        """
+        with self.db.atomic():
+            legacy_models = [model for model in [self.CodeFeatureModel, self.RepoFeatureModel]
+                             if self.db.table_exists(model._meta.table_name)]
+            for model in legacy_models:
+                self.db.execute_sql(f'ALTER TABLE {model._meta.table_name} RENAME TO {model._meta.table_name}_legacy')
+            for statement in NORMALIZED_SCHEMA_SQL:
+                self.db.execute_sql(statement)
+            for model in legacy_models:
+                table_name = model._meta.table_name
+                columns_str = ', '.join(field.column_name for field in model._meta.sorted_fields)
+                self.db.execute_sql(f'INSERT INTO {table_name} ({columns_str}) SELECT {columns_str} FROM {table_name}_legacy')
+                self.db.execute_sql(f'DROP TABLE {table_name}_legacy')
+
+    def _upsert(self, query, *, model):
+        """Returns the given insert query for the given model, updating the
+        non-key fields of rows with conflicting primary keys.
+
+        Inserts into the views of the normalized schema are already
+        upserts performed by triggers.
+
+        """
+        if self.normalized and model is not self.RepoMetadataModel:
+            return query
+        conflict_target = model.get_primary_key_columns()
+        key_names = {field.name for field in conflict_target}
+        return query.on_conflict(
+            conflict_target=conflict_target,
+            preserve=[field for field in model._meta.sorted_fields if field.name not in key_names],
+        )
+
+    @synchronized
     def close(self):
         """Close the database."""
         self.db.close()
 
+    @synchronized
     def get_repo_missing_analyzer_features(
         self, *,
         source_name: str,
@@ -214,6 +594,163 @@ class Database:
                 missing_analyzer_features[analyzer_name] = missing_features
         return missing_analyzer_features
 
+    @synchronized
+    def get_repo_feature_masks(self, *, feature_bits: Mapping[Tuple[str, str], int]) -> Dict[Tuple[str, str], int]:
+        """Returns a compact record of the features recorded for all
+        surveyed Repos.
+
+        Args:
+            feature_bits: Mapping of `(analyzer_name, feature_name)` pairs
+                to distinct bit flags.
+
+        Returns:
+            A dictionary mapping the `(source_name, repo_key)` of each
+                Repo with recorded features to the bitwise OR of the
+                bit flags of its recorded features.
+
+        """
+        analyzer_names = list({analyzer_name for analyzer_name, _ in feature_bits.keys()})
+        rows = (self.RepoFeatureModel
+                .select(
+                    self.RepoFeatureModel.source_name,
+                    self.RepoFeatureModel.repo_key,
+                    self.RepoFeatureModel.analyzer_name,
+                    self.RepoFeatureModel.feature_name,
+                )
+                .where(self.RepoFeatureModel.analyzer_name.in_(analyzer_names))
+                .tuples())
+        repo_feature_masks: Dict[Tuple[str, str], int] = defaultdict(int)
+        for source_name, repo_key, analyzer_name, feature_name in rows.iterator():
+            feature_bit = feature_bits.get((analyzer_name, feature_name))
+            if feature_bit is not None:
+                repo_feature_masks[(source_name, repo_key)] |= feature_bit
+        return dict(repo_feature_masks)
+
+    @synchronized
+    def get_feature_summaries(self, *,
+                              source_names: Optional[Sequence[str]] = None,
+                              analyzer_names: Optional[Sequence[str]] = None,
+                              feature_names: Optional[Sequence[str]] = None,
+                              quantiles: Sequence[float] = (0.5,),
+                              metadata_key: Optional[str] = None,
+                              metadata_buckets: Optional[Sequence[float]] = None) -> List[FeatureSummary]:
+        """Returns FeatureSummaries aggregating the features of surveyed
+        Repos, which are computed by the database.
+
+        Args:
+            source_names: If specified, only features from the named Sources
+                will be summarized.
+            analyzer_names: If specified, only features from the named Analyzers
+                will be summarized.
+            feature_names: If specified, only the named features will be
+                summarized.
+            quantiles: Quantiles (between 0 and 1) of the occurrences of
+                each feature per Repo to compute.
+            metadata_key: If specified, separate summaries are returned
+                for Repos with each value of the named Repo metadata.
+            metadata_buckets: If specified with a `metadata_key` with
+                numeric values, separate summaries are returned for Repos
+                in each bucket of metadata values starting at each of the
+                given (ascending) lower bounds.
+
+        Raises:
+            ValueError: A quantile was not between 0 and 1.
+
+        """
+        if any(not 0 <= quantile <= 1 for quantile in quantiles):
+            raise ValueError('Quantiles must be between 0 and 1')
+        model = self.RepoFeatureModel
+
+        if metadata_key is None:
+            metadata_value: Any = Value(None)
+            query = model.select()
+        else:
+            metadata_value = fn.json_extract(self.RepoMetadataModel.metadata_value, '$')
+            if metadata_buckets is not None:
+                # Map each value to the greatest lower bound that it is
+                # not less than.
+                metadata_value = Case(None, [
+                    (metadata_value >= lower_bound, lower_bound)
+                    for lower_bound in sorted(metadata_buckets, reverse=True)
+                ], None)
+            query = model.select().join(
+                self.RepoMetadataModel,
+                JOIN.LEFT_OUTER,
+                on=((self.RepoMetadataModel.source_name == model.source_name)
+                    & (self.RepoMetadataModel.repo_key == model.repo_key)
+                    & (self.RepoMetadataModel.metadata_key == metadata_key)),
+            )
+        group_fields = [model.analyzer_name, model.feature_name, metadata_value]
+        # Rank Repos by occurrences within each group to find quantiles.
+        ranked_query = self._filter_features_query(
+            query.select(
+                model.analyzer_name,
+                model.feature_name,
+                metadata_value.alias('metadata_value'),
+                model.occurrence_count,
+                model.code_occurrence_count,
+                model.code_total_count,
+                fn.ROW_NUMBER().over(partition_by=group_fields, order_by=[model.occurrence_count]).alias('occurrence_rank'),
+                fn.COUNT(model.occurrence_count).over(partition_by=group_fields).alias('group_repo_count'),
+            ),
+            model=model,
+            source_names=source_names,
+            repo_keys=None,
+            analyzer_names=analyzer_names,
+            feature_names=feature_names,
+        ).alias('ranked')
+        ranked = ranked_query.c
+
+        quantile_columns = []
+        for quantile in quantiles:
+            # Rank of the Repo at or below the quantile position.
+            lower_rank = ((ranked.group_repo_count - 1) * quantile).cast('INTEGER') + 1
+            quantile_columns += [
+                fn.MAX(Case(None, [(ranked.occurrence_rank == lower_rank, ranked.occurrence_count)], None)),
+                fn.MAX(Case(None, [(ranked.occurrence_rank == lower_rank + 1, ranked.occurrence_count)], None)),
+            ]
+        rows = (ranked_query
+                .select_from(
+                    ranked.analyzer_name,
+                    ranked.feature_name,
+                    ranked.metadata_value,
+                    fn.COUNT(),
+                    fn.SUM(fn.MIN(ranked.occurrence_count, 1)),
+                    fn.SUM(ranked.occurrence_count),
+                    fn.SUM(ranked.code_occurrence_count),
+                    fn.SUM(ranked.code_total_count),
+                    *quantile_columns,
+                )
+                .group_by(ranked.analyzer_name, ranked.feature_name, ranked.metadata_value)
+                .order_by(ranked.analyzer_name, ranked.feature_name, ranked.metadata_value)
+                .tuples())
+
+        summaries = []
+        for (analyzer_name, feature_name, group_metadata_value, repo_count, repo_occurrence_count,
+             occurrence_count, code_occurrence_count, code_total_count, *quantile_values) in rows:
+            occurrence_count_quantiles = {}
+            for index, quantile in enumerate(quantiles):
+                lower_value, upper_value = quantile_values[index * 2:index * 2 + 2]
+                position = (repo_count - 1) * quantile
+                fraction = position - int(position)
+                if fraction == 0:
+                    occurrence_count_quantiles[quantile] = float(lower_value)
+                else:
+                    occurrence_count_quantiles[quantile] = lower_value + fraction * (upper_value - lower_value)
+            summaries.append(FeatureSummary(
+                analyzer_name=analyzer_name,
+                feature_name=feature_name,
+                metadata_value=group_metadata_value,
+                repo_count=repo_count,
+                repo_occurrence_count=repo_occurrence_count,
+                occurrence_count=occurrence_count,
+                code_occurrence_count=code_occurrence_count,
+                code_total_count=code_total_count,
+                occurrence_count_quantiles=occurrence_count_quantiles,
+            ))
+        return summaries
+
+    @synchronized
     def get_code_missing_features(
         self, *,
         source_name: str,
@@ -247,29 +784,54 @@ class Database:
             if feature not in existing_features
         ]
 
+    @synchronized
+    def get_saved_code_features(
+        self, *,
+        source_name: str,
+        repo_key: str,
+        analyzer_name: str,
+        features: Sequence[str],
+    ) -> Set[Tuple[str, str]]:
+        """Returns the set of `(code_key, feature_name)` pairs recorded for
+        all Codes of a given Repo, so that the missing features of each
+        Code can be determined without a query per Code.
+
+        Args:
+            source_name: Name of the target Repo's Source
+            repo_key: Key of the target Repo
+            analyzer_name: Name of the Analyzer to get features for
+            features: Names of the Analyzer's features
+
+        """
+        rows = (self.CodeFeatureModel
+                .select(self.CodeFeatureModel.code_key, self.CodeFeatureModel.feature_name)
+                .where(
+                    (self.CodeFeatureModel.source_name == source_name)
+                    & (self.CodeFeatureModel.repo_key == repo_key)
+                    & (self.CodeFeatureModel.analyzer_name == analyzer_name)
+                    & (self.CodeFeatureModel.feature_name.in_(features)))
+                .tuples())
+        return set(rows)
+
+    @synchronized
     def save_repo_metadata(self, repo: Repo):
         """Save metadata for the given Repo."""
         with self.db.atomic():
-            (self.RepoMetadataModel
-             .insert_many([
-                 dict(
-                     updated=datetime.now(),
-                     source_name=repo.source.name,
-                     repo_key=repo.key,
-                     metadata_key=metadata_key,
-                     metadata_value=metadata_value,
-                 )
-                 for metadata_key, metadata_value in repo.metadata.items()
-             ])
-             .on_conflict(
-                 conflict_target=self.RepoMetadataModel.get_primary_key_columns(),
-                 preserve=[
-                     self.RepoMetadataModel.updated,
-                     self.RepoMetadataModel.metadata_value,
-                 ],
-             )
-             .execute())
+            self._upsert(
+                self.RepoMetadataModel.insert_many([
+                    dict(
+                        updated=datetime.now(),
+                        source_name=repo.source.name,
+                        repo_key=repo.key,
+                        metadata_key=metadata_key,
+                        metadata_value=metadata_value,
+                    )
+                    for metadata_key, metadata_value in repo.metadata.items()
+                ]),
+                model=self.RepoMetadataModel,
+            ).execute()
 
+    @synchronized
     def save_code_features(self, code: Code, *, save_occurrences: bool):
         """Save Analyzer features for the given Code.
 
@@ -277,36 +839,141 @@ class Database:
         `True`.
 
         """
+        self.save_many_code_features([code], save_occurrences=save_occurrences)
+
+    @synchronized
+    def save_many_code_features(self, codes: Sequence[Code], *, save_occurrences: bool):
+        """Save Analyzer features for the given Codes in a single
+        transaction.
+
+        Only save the raw occurrence objects if save_occurrences is
+        `True`.
+
+        """
+        rows = [
+            dict(
+                updated=datetime.now(),
+                source_name=code.repo.source.name,
+                repo_key=code.repo.key,
+                analyzer_name=code.analyzer.name,
+                code_key=code.key,
+                feature_name=feature_name,
+                occurrence_count=(
+                    None if feature.ignore else len(feature.occurrences)
+                ),
+                occurrences=(
+                    None if (feature.ignore or not save_occurrences)
+                    else feature.occurrences
+                ),
+                blob_sha=code.blob_sha,
+            )
+            for code in codes
+            for feature_name, feature in code.features.items()
+        ]
+        if not rows:
+            return
         with self.db.atomic():
-            (self.CodeFeatureModel
-             .insert_many([
-                 dict(
-                     updated=datetime.now(),
-                     source_name=code.repo.source.name,
-                     repo_key=code.repo.key,
-                     analyzer_name=code.analyzer.name,
-                     code_key=code.key,
-                     feature_name=feature_name,
-                     occurrence_count=(
-                         None if feature.ignore else len(feature.occurrences)
-                     ),
-                     occurrences=(
-                         None if (feature.ignore or not save_occurrences)
-                         else feature.occurrences
-                     ),
-                 )
-                 for feature_name, feature in code.features.items()
-             ])
-             .on_conflict(
-                 conflict_target=self.CodeFeatureModel.get_primary_key_columns(),
-                 preserve=[
-                     self.CodeFeatureModel.updated,
-                     self.CodeFeatureModel.occurrence_count,
-                     self.CodeFeatureModel.occurrences,
-                 ],
-             )
-             .execute())
+            # Limit the number of rows per statement to stay within
+            # sqlite's limit on the number of query parameters.
+            for rows_chunk in chunked(rows, 100):
+                self._upsert(
+                    self.CodeFeatureModel.insert_many(rows_chunk),
+                    model=self.CodeFeatureModel,
+                ).execute()
+
+    @synchronized
+    def get_saved_blob_shas(self, *, analyzer_name: str, blob_shas: Sequence[str]) -> Set[str]:
+        """Returns those of the given Git blob SHAs for which Analyzer
+        features of a Code are saved, so that
+        `copy_blob_code_features()` need only be called for Codes whose
+        blob may have saved features.
+
+        Args:
+            analyzer_name: Name of the Analyzer to check features for
+            blob_shas: Git blob SHAs to check
 
+        """
+        saved_blob_shas: Set[str] = set()
+        for blob_shas_chunk in chunked(sorted(set(blob_shas)), 500):
+            rows = (self.CodeFeatureModel
+                    .select(self.CodeFeatureModel.blob_sha)
+                    .distinct(True)
+                    .where(
+                        (self.CodeFeatureModel.analyzer_name == analyzer_name)
+                        & (self.CodeFeatureModel.blob_sha.in_(blob_shas_chunk)))
+                    .tuples())
+            saved_blob_shas.update(blob_sha for blob_sha, in rows)
+        return saved_blob_shas
+
+    @synchronized
+    def copy_blob_code_features(self, *, repo: Repo, code_key: str, analyzer_name: str,
+                                blob_sha: str, features: Sequence[str]) -> bool:
+        """Save Analyzer features for the given Code by copying the saved
+        features of another Code with the same Git blob SHA.
+
+        Features are only copied if saved features exist for all of the
+        given features.
+
+        Returns:
+            `True` if features were copied.
+
+        """
+        feature_filter = ((self.CodeFeatureModel.analyzer_name == analyzer_name)
+                          & (self.CodeFeatureModel.feature_name.in_(features)))
+        # Select a single Code of the blob with all of the features saved.
+        source_codes = (self.CodeFeatureModel
+                        .select(
+                            self.CodeFeatureModel.source_name,
+                            self.CodeFeatureModel.repo_key,
+                            self.CodeFeatureModel.code_key,
+                        )
+                        .where(feature_filter & (self.CodeFeatureModel.blob_sha == blob_sha))
+                        .group_by(
+                            self.CodeFeatureModel.source_name,
+                            self.CodeFeatureModel.repo_key,
+                            self.CodeFeatureModel.code_key,
+                        )
+                        .having(fn.COUNT() == len(set(features)))
+                        .limit(1))
+        with self.db.atomic():
+            source_code = source_codes.first()
+            if source_code is None:
+                return False
+            self._upsert(
+                self.CodeFeatureModel.insert_from(
+                    query=(self.CodeFeatureModel
+                           .select(
+                               Value(self.CodeFeatureModel.updated.db_value(datetime.now())),
+                               Value(repo.source.name),
+                               Value(repo.key),
+                               self.CodeFeatureModel.analyzer_name,
+                               Value(code_key),
+                               self.CodeFeatureModel.feature_name,
+                               self.CodeFeatureModel.occurrence_count,
+                               self.CodeFeatureModel.occurrences,
+                               self.CodeFeatureModel.blob_sha,
+                           )
+                           .where(feature_filter
+                                  & (self.CodeFeatureModel.source_name == source_code.source_name)
+                                  & (self.CodeFeatureModel.repo_key == source_code.repo_key)
+                                  & (self.CodeFeatureModel.code_key == source_code.code_key))),
+                    fields=[
+                        self.CodeFeatureModel.updated,
+                        self.CodeFeatureModel.source_name,
+                        self.CodeFeatureModel.repo_key,
+                        self.CodeFeatureModel.analyzer_name,
+                        self.CodeFeatureModel.code_key,
+                        self.CodeFeatureModel.feature_name,
+                        self.CodeFeatureModel.occurrence_count,
+                        self.CodeFeatureModel.occurrences,
+                        self.CodeFeatureModel.blob_sha,
+                    ],
+                ),
+                model=self.CodeFeatureModel,
+            ).execute()
+        return True
+
+    @synchronized
     def save_repo_features(self, repo: Repo, *, keep_code_features: bool):
         """Save Analyzer features for the given Repo by aggregating Code
         features.
@@ -317,48 +984,40 @@ class Database:
         """
         repo_code_filter = ((self.CodeFeatureModel.source_name == repo.source.name)
                             & (self.CodeFeatureModel.repo_key == repo.key))
-        (self.RepoFeatureModel
-         .insert_from(
-             query=(self.CodeFeatureModel
-                    .select(
-                        # Most recent CodeFeatureModel updated time
-                        fn.MAX(self.CodeFeatureModel.updated),
-                        self.CodeFeatureModel.source_name,
-                        self.CodeFeatureModel.repo_key,
-                        self.CodeFeatureModel.analyzer_name,
-                        self.CodeFeatureModel.feature_name,
-                        # Sum of all occurrences in CodeFeatureModels
-                        fn.SUM(self.CodeFeatureModel.occurrence_count),
-                        # Count of all CodeFeatureModels with at least one occurrence
-                        fn.SUM(fn.MIN(self.CodeFeatureModel.occurrence_count, 1)),
-                        # Count of all CodeFeatureModels
-                        fn.COUNT(),
-                    )
-                    .where(repo_code_filter
-                           # Do not count "ignored" CodeFeatureModels
-                           & self.CodeFeatureModel.occurrence_count.is_null(False))
-                    .group_by(self.CodeFeatureModel.feature_name)),
-             fields=[
-                 self.RepoFeatureModel.updated,
-                 self.RepoFeatureModel.source_name,
-                 self.RepoFeatureModel.repo_key,
-                 self.RepoFeatureModel.analyzer_name,
-                 self.RepoFeatureModel.feature_name,
-                 self.RepoFeatureModel.occurrence_count,
-                 self.RepoFeatureModel.code_occurrence_count,
-                 self.RepoFeatureModel.code_total_count,
-             ],
-         )
-         .on_conflict(
-             conflict_target=self.RepoFeatureModel.get_primary_key_columns(),
-             preserve=[
-                 self.RepoFeatureModel.updated,
-                 self.RepoFeatureModel.occurrence_count,
-                 self.RepoFeatureModel.code_occurrence_count,
-                 self.RepoFeatureModel.code_total_count,
-             ],
-         )
-         .execute())
+        self._upsert(
+            self.RepoFeatureModel.insert_from(
+                query=(self.CodeFeatureModel
+                       .select(
+                           # Most recent CodeFeatureModel updated time
+                           fn.MAX(self.CodeFeatureModel.updated),
+                           self.CodeFeatureModel.source_name,
+                           self.CodeFeatureModel.repo_key,
+                           self.CodeFeatureModel.analyzer_name,
+                           self.CodeFeatureModel.feature_name,
+                           # Sum of all occurrences in CodeFeatureModels
+                           fn.SUM(self.CodeFeatureModel.occurrence_count),
+                           # Count of all CodeFeatureModels with at least one occurrence
+                           fn.SUM(fn.MIN(self.CodeFeatureModel.occurrence_count, 1)),
+                           # Count of all CodeFeatureModels
+                           fn.COUNT(),
+                       )
+                       .where(repo_code_filter
+                              # Do not count "ignored" CodeFeatureModels
+                              & self.CodeFeatureModel.occurrence_count.is_null(False))
+                       .group_by(self.CodeFeatureModel.feature_name)),
+                fields=[
+                    self.RepoFeatureModel.updated,
+                    self.RepoFeatureModel.source_name,
+                    self.RepoFeatureModel.repo_key,
+                    self.RepoFeatureModel.analyzer_name,
+                    self.RepoFeatureModel.feature_name,
+                    self.RepoFeatureModel.occurrence_count,
+                    self.RepoFeatureModel.code_occurrence_count,
+                    self.RepoFeatureModel.code_total_count,
+                ],
+            ),
+            model=self.RepoFeatureModel,
+        ).execute()
 
         # Optionally delete matched CodeFeatureModel rows to reduce storage.
         if not keep_code_features:
@@ -367,6 +1026,42 @@ class Database:
              .where(repo_code_filter)
              .execute())
 
+    @synchronized
+    def save_repo_feature_counts(self, repo: Repo, *, analyzer_name: str,
+                                 feature_counts: Mapping[str, RepoFeatureCounts]):
+        """Save Analyzer features for the given Repo from counts that were
+        aggregated without saving Code features.
+
+        Any Code features saved for the Repo and Analyzer (e.g. by a
+        previously interrupted run) are deleted, as they are superseded
+        by the saved counts.
+
+        """
+        with self.db.atomic():
+            if feature_counts:
+                self._upsert(
+                    self.RepoFeatureModel.insert_many([
+                        dict(
+                            updated=datetime.now(),
+                            source_name=repo.source.name,
+                            repo_key=repo.key,
+                            analyzer_name=analyzer_name,
+                            feature_name=feature_name,
+                            occurrence_count=counts.occurrence_count,
+                            code_occurrence_count=counts.code_occurrence_count,
+                            code_total_count=counts.code_total_count,
+                        )
+                        for feature_name, counts in feature_counts.items()
+                    ]),
+                    model=self.RepoFeatureModel,
+                ).execute()
+            (self.CodeFeatureModel
+             .delete()
+             .where((self.CodeFeatureModel.source_name == repo.source.name)
+                    & (self.CodeFeatureModel.repo_key == repo.key)
+                    & (self.CodeFeatureModel.analyzer_name == analyzer_name))
+             .execute())
+
     def _get_repo_metadata(self, *, source_name: str, repo_key: str) -> Dict[str, Any]:
         """Retrieves metadata for a given Repo from the database."""
         rows = (self.RepoMetadataModel
@@ -381,19 +1076,152 @@ class Database:
             for row in rows
         }
 
-    def _get_repo_metadata_cache(self) -> MetadataCache:
+    def _get_repo_metadata_cache(self, *, max_size: Optional[int] = None) -> MetadataCache:
         """Returns a function that returns the metadata for a given Repo with
-        caching to prevent repeated database queries."""
+        caching to prevent repeated database queries.
+
+        If `max_size` is specified, the cache is cleared whenever it
+        would exceed that number of Repos.
+
+        """
         cache: Dict[Tuple[str, str], Dict[str, Any]] = {}
 
         def metadata_cache(*, source_name: str, repo_key: str) -> Dict[str, Any]:
             cache_key = (source_name, repo_key)
             if cache_key not in cache:
+                if max_size is not None and len(cache) >= max_size:
+                    cache.clear()
                 cache[cache_key] = self._get_repo_metadata(source_name=source_name, repo_key=repo_key)
             return cache[cache_key]
 
         return metadata_cache
 
+    def _filter_features_query(self, query, *, model,
+                               source_names: Optional[Sequence[str]],
+                               repo_keys: Optional[Sequence[str]],
+                               analyzer_names: Optional[Sequence[str]],
+                               feature_names: Optional[Sequence[str]]):
+        """Returns the given query of RepoFeatureModels or CodeFeatureModels
+        filtered to the given names and keys."""
+        if source_names is not None:
+            query = query.where(model.source_name.in_(source_names))
+        if repo_keys is not None:
+            query = query.where(model.repo_key.in_(repo_keys))
+        if analyzer_names is not None:
+            query = query.where(model.analyzer_name.in_(analyzer_names))
+        if feature_names is not None:
+            query = query.where(model.feature_name.in_(feature_names))
+        return query
+
+    def _code_features_query(self, *, include_occurrences: bool, **filters):
+        """Returns a query of CodeFeatureModels filtered to the given names
+        and keys, which only selects occurrences if include_occurrences."""
+        if include_occurrences:
+            query = self.CodeFeatureModel.select()
+        else:
+            query = self.CodeFeatureModel.select(*[
+                field for field in self.CodeFeatureModel._meta.sorted_fields
+                if field.name != 'occurrences'
+            ])
+        return self._filter_features_query(query, model=self.CodeFeatureModel, **filters)
+
+    def _iter_feature_batches(self, query, *, model,
+                              make_feature: Callable[[Dict[str, Any]], FeatureType],
+                              after: Optional[Sequence[str]],
+                              batch_size: int) -> Iterator[FeatureType]:
+        """Yields features for the rows of the given query in the order of
+        the model's primary key, querying `batch_size` rows at a time."""
+        key_fields = [model._meta.fields[field_name] for field_name in model._meta.primary_key.field_names]
+        if not self.normalized:
+            yield from self._iter_keyset_batches(query, key_fields=key_fields, make_feature=make_feature,
+                                                 after=after, batch_size=batch_size)
+            return
+
+        # The views of the normalized schema cannot be ordered by an
+        # index, so each batch would need to sort all rows. Instead,
+        # iterate through Repos in order, and then through the rows of
+        # each Repo (which only need to be sorted within the Repo).
+        after_repo_id = None if after is None else (after[0], after[1])
+        for repo_id in self._iter_normalized_repo_ids(start=after_repo_id, batch_size=batch_size):
+            source_name, repo_key = repo_id
+            yield from self._iter_keyset_batches(
+                query.where((model.source_name == source_name) & (model.repo_key == repo_key)),
+                key_fields=key_fields[2:],
+                make_feature=make_feature,
+                after=(after[2:] if (after is not None and repo_id == after_repo_id) else None),
+                batch_size=batch_size,
+            )
+
+    def _iter_keyset_batches(self, query, *, key_fields: Sequence[Any],
+                             make_feature: Callable[[Dict[str, Any]], FeatureType],
+                             after: Optional[Sequence[str]],
+                             batch_size: int) -> Iterator[FeatureType]:
+        """Yields features for the rows of the given query ordered by the
+        given key fields.
+
+        Each batch is queried with a separate statement that starts
+        after the key of the last row of the previous batch (keyset
+        pagination), so that the database is free to be used by other
+        threads between batches.
+
+        """
+        query = query.order_by(*key_fields).limit(batch_size)
+        while True:
+            batch_query = query
+            if after is not None:
+                batch_query = batch_query.where(TupleNode(*key_fields) > TupleNode(*after))
+            with self._lock:
+                rows = list(batch_query.dicts())
+                features = [make_feature(row) for row in rows]
+            yield from features
+            if len(rows) < batch_size:
+                return
+            after = [rows[-1][field.name] for field in key_fields]
+
+    def _iter_normalized_repo_ids(self, *, start: Optional[Tuple[str, str]],
+                                  batch_size: int) -> Iterator[Tuple[str, str]]:
+        """Yields the source names and keys of Repos in the normalized
+        schema in order, starting from the given Repo."""
+        repo_ids_sql = ('SELECT source_dim.name, repo_dim.key FROM repo_dim '
+                        'JOIN source_dim ON source_dim.id = repo_dim.source_id '
+                        'WHERE (source_dim.name, repo_dim.key) {operator} (?, ?) '
+                        'ORDER BY source_dim.name, repo_dim.key LIMIT ?')
+        # All strings are greater than or equal to the empty string.
+        after, operator = (start or ('', '')), '>='
+        while True:
+            with self._lock:
+                repo_ids = self.db.execute_sql(repo_ids_sql.format(operator=operator), (*after, batch_size)).fetchall()
+            yield from repo_ids
+            if len(repo_ids) < batch_size:
+                return
+            after, operator = repo_ids[-1], '>'
+
+    def _make_repo_feature_factory(self, *, max_cached_repos: Optional[int] = None) -> Callable[[Dict[str, Any]], RepoFeature]:
+        metadata_cache = self._get_repo_metadata_cache(max_size=max_cached_repos)
+
+        def make_repo_feature(row: Dict[str, Any]) -> RepoFeature:
+            return RepoFeature(
+                **row,
+                repo_metadata=metadata_cache(source_name=row['source_name'],
+                                             repo_key=row['repo_key']),
+            )
+
+        return make_repo_feature
+
+    def _make_code_feature_factory(self, *, max_cached_repos: Optional[int] = None) -> Callable[[Dict[str, Any]], CodeFeature]:
+        metadata_cache = self._get_repo_metadata_cache(max_size=max_cached_repos)
+
+        def make_code_feature(row: Dict[str, Any]) -> CodeFeature:
+            return CodeFeature(
+                # occurrences are not selected if include_occurrences=False.
+                **{'occurrences': None, **row},
+                repo_metadata=metadata_cache(source_name=row['source_name'],
+                                             repo_key=row['repo_key']),
+            )
+
+        return make_code_feature
+
+    @synchronized
     def get_repo_features(self, *,
                           source_names: Optional[Sequence[str]] = None,
                           repo_keys: Optional[Sequence[str]] = None,
@@ -412,31 +1240,68 @@ class Database:
                 will be returned.
 
         """
-        query = self.RepoFeatureModel.select()
-        if source_names is not None:
-            query = query.where(self.RepoFeatureModel.source_name.in_(source_names))
-        if repo_keys is not None:
-            query = query.where(self.RepoFeatureModel.repo_key.in_(repo_keys))
-        if analyzer_names is not None:
-            query = query.where(self.RepoFeatureModel.analyzer_name.in_(analyzer_names))
-        if feature_names is not None:
-            query = query.where(self.RepoFeatureModel.feature_name.in_(feature_names))
+        query = self._filter_features_query(
+            self.RepoFeatureModel.select(),
+            model=self.RepoFeatureModel,
+            source_names=source_names,
+            repo_keys=repo_keys,
+            analyzer_names=analyzer_names,
+            feature_names=feature_names,
+        )
+        make_repo_feature = self._make_repo_feature_factory()
+        return [make_repo_feature(row) for row in query.dicts()]
+
+    def iter_repo_features(self, *,
+                           source_names: Optional[Sequence[str]] = None,
+                           repo_keys: Optional[Sequence[str]] = None,
+                           analyzer_names: Optional[Sequence[str]] = None,
+                           feature_names: Optional[Sequence[str]] = None,
+                           after: Optional[Sequence[str]] = None,
+                           batch_size: int = 1000) -> Iterator[RepoFeature]:
+        """Yields RepoFeatures of surveyed Repos ordered by their
+        [`sort_key`][codesurvey.RepoFeature.sort_key], without loading
+        all RepoFeatures into memory at once.
 
-        metadata_cache = self._get_repo_metadata_cache()
-        return [
-            RepoFeature(
-                **row,
-                repo_metadata=metadata_cache(source_name=row['source_name'],
-                                             repo_key=row['repo_key']),
-            )
-            for row in query.dicts()
-        ]
+        Args:
+            source_names: If specified, only features from the named Sources
+                will be returned.
+            repo_keys: If specified, only features from the named Repos
+                will be returned.
+            analyzer_names: If specified, only features from the named Analyzers
+                will be returned.
+            feature_names: If specified, only results for the named features
+                will be returned.
+            after: If specified, only features after the given `sort_key`
+                of a previously returned RepoFeature will be returned.
+            batch_size: The number of RepoFeatures to query from the
+                database at a time.
 
+        """
+        query = self._filter_features_query(
+            self.RepoFeatureModel.select(),
+            model=self.RepoFeatureModel,
+            source_names=source_names,
+            repo_keys=repo_keys,
+            analyzer_names=analyzer_names,
+            feature_names=feature_names,
+        )
+        return self._iter_feature_batches(
+            query,
+            model=self.RepoFeatureModel,
+            # Features are ordered by Repo, so only the current Repo's
+            # metadata needs to be cached.
+            make_feature=self._make_repo_feature_factory(max_cached_repos=1),
+            after=after,
+            batch_size=batch_size,
+        )
+
+    @synchronized
     def get_code_features(self, *,
                           source_names: Optional[Sequence[str]] = None,
                           repo_keys: Optional[Sequence[str]] = None,
                           analyzer_names: Optional[Sequence[str]] = None,
-                          feature_names: Optional[Sequence[str]] = None) -> List[CodeFeature]:
+                          feature_names: Optional[Sequence[str]] = None,
+                          include_occurrences: bool = True) -> List[CodeFeature]:
         """Returns CodeFeatures of surveyed Codes.
 
         Args:
@@ -448,24 +1313,271 @@ class Database:
                 will be returned.
             feature_names: If specified, only results for the named features
                 will be returned.
+            include_occurrences: If `False`, occurrences are not read
+                from the database (avoiding the cost of decoding them),
+                and the `occurrences` of all returned CodeFeatures are
+                `None`.
 
         """
-        query = self.CodeFeatureModel.select()
-        if source_names is not None:
-            query = query.where(self.CodeFeatureModel.source_name.in_(source_names))
-        if repo_keys is not None:
-            query = query.where(self.CodeFeatureModel.repo_key.in_(repo_keys))
-        if analyzer_names is not None:
-            query = query.where(self.CodeFeatureModel.analyzer_name.in_(analyzer_names))
-        if feature_names is not None:
-            query = query.where(self.CodeFeatureModel.feature_name.in_(feature_names))
+        query = self._code_features_query(
+            include_occurrences=include_occurrences,
+            source_names=source_names,
+            repo_keys=repo_keys,
+            analyzer_names=analyzer_names,
+            feature_names=feature_names,
+        )
+        make_code_feature = self._make_code_feature_factory()
+        return [make_code_feature(row) for row in query.dicts()]
+
+    def iter_code_features(self, *,
+                           source_names: Optional[Sequence[str]] = None,
+                           repo_keys: Optional[Sequence[str]] = None,
+                           analyzer_names: Optional[Sequence[str]] = None,
+                           feature_names: Optional[Sequence[str]] = None,
+                           include_occurrences: bool = True,
+                           after: Optional[Sequence[str]] = None,
+                           batch_size: int = 1000) -> Iterator[CodeFeature]:
+        """Yields CodeFeatures of surveyed Codes ordered by their
+        [`sort_key`][codesurvey.CodeFeature.sort_key], without loading
+        all CodeFeatures into memory at once.
 
-        metadata_cache = self._get_repo_metadata_cache()
-        return [
-            CodeFeature(
-                **row,
-                repo_metadata=metadata_cache(source_name=row['source_name'],
-                                             repo_key=row['repo_key']),
-            )
-            for row in query.dicts()
-        ]
+        Args:
+            source_names: If specified, only features from the named Sources
+                will be returned.
+            repo_keys: If specified, only features from the named Repos
+                will be returned.
+            analyzer_names: If specified, only features from the named Analyzers
+                will be returned.
+            feature_names: If specified, only results for the named features
+                will be returned.
+            include_occurrences: If `False`, occurrences are not read
+                from the database (avoiding the cost of decoding them),
+                and the `occurrences` of all returned CodeFeatures are
+                `None`.
+            after: If specified, only features after the given `sort_key`
+                of a previously returned CodeFeature will be returned.
+            batch_size: The number of CodeFeatures to query from the
+                database at a time.
+
+        """
+        query = self._code_features_query(
+            include_occurrences=include_occurrences,
+            source_names=source_names,
+            repo_keys=repo_keys,
+            analyzer_names=analyzer_names,
+            feature_names=feature_names,
+        )
+        return self._iter_feature_batches(
+            query,
+            model=self.CodeFeatureModel,
+            # Features are ordered by Repo, so only the current Repo's
+            # metadata needs to be cached.
+            make_feature=self._make_code_feature_factory(max_cached_repos=1),
+            after=after,
+            batch_size=batch_size,
+        )
+
+    @synchronized
+    def _get_features_columns(self, *, model, batch_size: int, **filters) -> Dict[str, Column]:
+        """Returns columns of the RepoFeatureModels or CodeFeatureModels
+        filtered to the given names and keys, excluding JSON columns."""
+        column_kinds = {}
+        for field in model._meta.sorted_fields:
+            if isinstance(field, JSONField):
+                continue
+            # TimestampFields are also IntegerFields.
+            if isinstance(field, TimestampField):
+                column_kinds[field.name] = TIMESTAMP_COLUMN
+            elif isinstance(field, IntegerField):
+                column_kinds[field.name] = NULLABLE_INTEGER_COLUMN if field.null else INTEGER_COLUMN
+            else:
+                column_kinds[field.name] = STRING_COLUMN
+        query = self._filter_features_query(
+            model.select(*[getattr(model, field_name) for field_name in column_kinds]),
+            model=model,
+            **filters,
+        )
+        # Read rows from the cursor, rather than a peewee result
+        # wrapper that would retain an object for every row.
+        return read_columns(self.db.execute(query), column_kinds, batch_size=batch_size)
+
+    def get_repo_features_columns(self, *,
+                                  source_names: Optional[Sequence[str]] = None,
+                                  repo_keys: Optional[Sequence[str]] = None,
+                                  analyzer_names: Optional[Sequence[str]] = None,
+                                  feature_names: Optional[Sequence[str]] = None,
+                                  batch_size: int = 10000) -> Dict[str, Column]:
+        """Returns columns of the fields of surveyed RepoFeatures (excluding
+        `repo_metadata`). Requires `numpy`.
+
+        Args:
+            source_names: If specified, only features from the named Sources
+                will be returned.
+            repo_keys: If specified, only features from the named Repos
+                will be returned.
+            analyzer_names: If specified, only features from the named Analyzers
+                will be returned.
+            feature_names: If specified, only results for the named features
+                will be returned.
+            batch_size: The number of rows to read from the database at a time.
+
+        Returns:
+            A dictionary mapping field names to
+                [columns][codesurvey.columns.Column].
+
+        """
+        return self._get_features_columns(
+            model=self.RepoFeatureModel,
+            batch_size=batch_size,
+            source_names=source_names,
+            repo_keys=repo_keys,
+            analyzer_names=analyzer_names,
+            feature_names=feature_names,
+        )
+
+    def get_code_features_columns(self, *,
+                                  source_names: Optional[Sequence[str]] = None,
+                                  repo_keys: Optional[Sequence[str]] = None,
+                                  analyzer_names: Optional[Sequence[str]] = None,
+                                  feature_names: Optional[Sequence[str]] = None,
+                                  batch_size: int = 10000) -> Dict[str, Column]:
+        """Returns columns of the fields of surveyed CodeFeatures (excluding
+        `occurrences` and `repo_metadata`). Requires `numpy`.
+
+        Args:
+            source_names: If specified, only features from the named Sources
+                will be returned.
+            repo_keys: If specified, only features from the named Repos
+                will be returned.
+            analyzer_names: If specified, only features from the named Analyzers
+                will be returned.
+            feature_names: If specified, only results for the named features
+                will be returned.
+            batch_size: The number of rows to read from the database at a time.
+
+        Returns:
+            A dictionary mapping field names to
+                [columns][codesurvey.columns.Column].
+
+        """
+        return self._get_features_columns(
+            model=self.CodeFeatureModel,
+            batch_size=batch_size,
+            source_names=source_names,
+            repo_keys=repo_keys,
+            analyzer_names=analyzer_names,
+            feature_names=feature_names,
+        )
+
+
+_FLUSH = object()
+_STOP = object()
+
+
+class CodeFeatureWriter:
+    """Saves the features of Codes to a Database in a background thread.
+
+    Codes are saved in groups, with a single transaction for all
+    Codes queued within `interval_seconds` of each other (up to
+    `batch_size` Codes), so that the cost of committing a transaction
+    is not paid for every Code.
+
+    """
+
+    def __init__(self, db: Database, *, save_occurrences: bool,
+                 batch_size: int, interval_seconds: float):
+        """
+        Args:
+            db: Database to save Code features to.
+            save_occurrences: Whether to save the raw occurrence objects
+                of features.
+            batch_size: Maximum number of Codes to save in a single
+                transaction.
+            interval_seconds: Maximum number of seconds that a Code will
+                be queued before it is saved.
+        """
+        self.db = db
+        self.save_occurrences = save_occurrences
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        self._queue: queue.Queue = queue.Queue()
+        self._error: Optional[Exception] = None
+        self._thread = threading.Thread(target=self._run, name='codesurvey-writer', daemon=True)
+        self._thread.start()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _write(self, codes: List[Code]) -> None:
+        try:
+            self.db.save_many_code_features(codes, save_occurrences=self.save_occurrences)
+        except Exception as ex:
+            # Report the failure to the thread using the writer.
+            self._error = ex
+
+    def _run(self) -> None:
+        codes: List[Code] = []
+        # Number of items received from the queue that are not yet done.
+        received_count = 0
+        deadline: Optional[float] = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                # Save Codes that have been queued for interval_seconds.
+                item = _FLUSH
+            else:
+                received_count += 1
+                if isinstance(item, Code):
+                    codes.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.interval_seconds
+                    if len(codes) < self.batch_size:
+                        continue
+
+            if codes:
+                self._write(codes)
+                codes = []
+            deadline = None
+            for _ in range(received_count):
+                self._queue.task_done()
+            received_count = 0
+            if item is _STOP:
+                return
+
+    def put(self, code: Code) -> None:
+        """Queue the features of the given Code to be saved.
+
+        Raises:
+            Exception: An exception raised while saving previously queued
+                Codes.
+
+        """
+        self._raise_error()
+        self._queue.put(code)
+
+    def flush(self) -> None:
+        """Wait until all queued Codes have been saved.
+
+        Raises:
+            Exception: An exception raised while saving queued Codes.
+
+        """
+        self._queue.put(_FLUSH)
+        self._queue.join()
+        self._raise_error()
+
+    def close(self) -> None:
+        """Save all queued Codes and stop the background thread.
+
+        Raises:
+            Exception: An exception raised while saving queued Codes.
+
+        """
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._raise_error()
@@ -81,6 +81,11 @@ class Source(ABC):
     """Default name to be assigned to Sources of this type if a custom
     name is not specified."""
 
+    git_backed: bool = False
+    """If `True`, the Repos provided by this Source are Git working trees,
+    allowing Analyzers to find the files to analyze from the Git index
+    instead of scanning the directory tree."""
+
     def __init__(self, *, name: Optional[str] = None):
         """
         Args:
@@ -175,6 +180,42 @@ def fetch_git_repo(clone_url: str) -> str:
     return temp_dir
 
 
+GIT_SYMLINK_MODE = '120000'
+GIT_GITLINK_MODE = '160000'
+
+
+def get_git_index_files(repo_path: str) -> Dict[str, Optional[str]]:
+    """Helper function to list the files tracked in the index of the Git
+    working tree at the given path.
+
+    Returns:
+        A dictionary mapping the relative path (with `/` separators) of
+            each tracked file to the SHA of its Git blob, or to `None` for
+            symlinks, whose blobs do not contain the content of the file
+            they link to. Submodules are excluded.
+
+    """
+    try:
+        result = subprocess.run(['git', 'ls-files', '--stage', '-z'], cwd=repo_path,
+                                capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError) as ex:
+        stderr = getattr(ex, 'stderr', b'') or b''
+        raise SourceError((f'Failed to list Git index files in "{repo_path}": {ex}\n'
+                           f'> STDERR {stderr.decode(errors="replace")}\n'))
+
+    files: Dict[str, Optional[str]] = {}
+    for entry in os.fsdecode(result.stdout).split('\0'):
+        if not entry:
+            continue
+        # Each entry has the format: "<mode> <sha> <stage>\t<path>"
+        info, rel_path = entry.split('\t', 1)
+        mode, blob_sha, _ = info.split(' ')
+        if mode == GIT_GITLINK_MODE:
+            continue
+        files[rel_path] = None if mode == GIT_SYMLINK_MODE else blob_sha
+    return files
+
+
 class GitSource(Source):
     """
     Source of Repos from remote Git repositories.
@@ -191,6 +232,7 @@ class GitSource(Source):
 
     """
     default_name = 'git'
+    git_backed = True
 
     def __init__(self, repo_urls: Sequence[str], *, name: Optional[str] = None):
         """
@@ -243,6 +285,7 @@ class GithubSampleSource(Source):
 
     """
     default_name = 'github_sample'
+    git_backed = True
 
     REPOS_PER_PAGE = 100
     # GitHub only returns the first 1,000 search results
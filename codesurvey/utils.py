@@ -1,7 +1,13 @@
 """Common utility functions."""
 
+from collections import Counter
+import fnmatch
+import glob
 import logging
-from typing import Dict, Hashable, List, Sequence, TypeVar
+import os
+import re
+from threading import Lock
+from typing import Callable, Dict, FrozenSet, Hashable, Iterable, Iterator, List, NamedTuple, Optional, Pattern, Sequence, Tuple, TypeVar
 
 
 def get_logger():
@@ -72,3 +78,210 @@ def recursive_update(dict_a: Dict, dict_b: Dict):
             dict_a[key] = b_value
         elif isinstance(b_value, dict):
             recursive_update(dict_a[key], b_value)
+
+
+_stats: Counter = Counter()
+_stats_lock = Lock()
+
+
+def record_stat(name: str, count: int = 1):
+    """
+    Increment the named run statistic counter for the current process.
+
+    Counters recorded while analyzing a Code are attached to the
+    resulting Code and aggregated by the survey runner, so they can
+    be recorded from sub-processes.
+    """
+    with _stats_lock:
+        _stats[name] += count
+
+
+def pop_stats() -> Dict[str, int]:
+    """
+    Return and reset the run statistic counters recorded in the current
+    process since the last call.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+        _stats.clear()
+    return stats
+
+
+class _GlobSegment(NamedTuple):
+    """Matcher for a single path component of a glob pattern."""
+
+    recursive: bool
+    """True if the component is `**`, matching any number of
+    directories."""
+
+    regex: Pattern[str]
+    """Regular expression matching the names of entries."""
+
+    match_hidden: bool
+    """True if the component can match names beginning with a dot."""
+
+    def matches(self, name: str) -> bool:
+        if not self.match_hidden and name.startswith('.'):
+            return False
+        return self.regex.match(_normcase(name)) is not None
+
+
+# Paths are only case-insensitive on Windows, so avoid the cost of
+# normalizing case for every path on other platforms.
+_normcase = os.path.normcase if os.name == 'nt' else str
+
+
+def _compile_glob_segment(segment: str) -> _GlobSegment:
+    # As with glob(), wildcards do not match hidden names unless the
+    # pattern component begins with a dot.
+    return _GlobSegment(
+        recursive=(segment == '**'),
+        regex=re.compile(fnmatch.translate(_normcase(segment))),
+        match_hidden=(segment.startswith('.') or not glob.has_magic(segment)),
+    )
+
+
+class _GlobMatcher:
+    """Matches paths against a glob pattern one path component at a
+    time, so that directories that cannot contain matching files can be
+    identified.
+
+    The state of a partially matched path is the set of indexes of
+    pattern components that the next path component may match.
+
+    """
+
+    def __init__(self, pattern: str):
+        self.segments = [_compile_glob_segment(segment) for segment in pattern.replace(os.sep, '/').split('/') if segment]
+        self.last_index = len(self.segments) - 1
+        self.initial_states = self._close(frozenset([0]) if self.segments else frozenset())
+
+    def _close(self, states: FrozenSet[int]) -> FrozenSet[int]:
+        """Adds the states reachable by `**` components matching no
+        directories."""
+        closed_states = set(states)
+        for index in sorted(states):
+            while index < self.last_index and self.segments[index].recursive:
+                index += 1
+                closed_states.add(index)
+        return frozenset(closed_states)
+
+    def enter_dir(self, states: FrozenSet[int], name: str) -> FrozenSet[int]:
+        """Returns the states of paths within the named directory, which is
+        empty if the directory cannot contain matching files."""
+        segments = self.segments
+        return self._close(frozenset(
+            {index + 1 for index in states
+             if index < self.last_index and not segments[index].recursive and segments[index].matches(name)}
+            | {index for index in states
+               if segments[index].recursive and segments[index].matches(name)}
+        ))
+
+    def matches_file(self, states: FrozenSet[int], name: str) -> bool:
+        """Returns True if the named file matches the pattern."""
+        return self.last_index in states and self.segments[self.last_index].matches(name)
+
+
+def iter_glob_files(root_path: str, pattern: str, *,
+                    exclude_dir: Optional[Callable[[str], bool]] = None) -> Iterator[str]:
+    """
+    Yields the paths relative to root_path of files matching the given
+    glob pattern, which may contain `**` to match any number of
+    directories.
+
+    Files are matched in the same way as by `glob.iglob(pattern,
+    root_dir=root_path, recursive=True)` (including skipping hidden
+    files and directories unless a pattern component begins with a
+    dot), except that:
+
+    * Directories are scanned with `os.scandir()`, so that checking
+      whether each entry is a file does not require a separate stat
+      call.
+    * Directories that cannot contain matching files (such as those
+      deeper than a pattern without `**`) are not scanned.
+    * Directories for which `exclude_dir` returns `True` when given
+      their relative path are not scanned.
+    * Symlinks to directories that contain a directory being scanned
+      are not followed, so that symlink loops are not scanned until
+      paths become too long.
+    """
+    matcher = _GlobMatcher(pattern)
+    if not matcher.initial_states:
+        return
+
+    # Each directory to scan is paired with the real paths of the
+    # parent directories of the symlinks followed to reach it, whose
+    # ancestors must not be re-entered.
+    stack: List[Tuple[str, FrozenSet[int], Tuple[str, ...]]] = [('', matcher.initial_states, ())]
+    while stack:
+        rel_dir_path, states, link_parent_paths = stack.pop()
+        try:
+            with os.scandir(os.path.join(root_path, rel_dir_path)) as entries_iterator:
+                entries = list(entries_iterator)
+        except OSError:
+            continue
+
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    subdir_states = matcher.enter_dir(states, entry.name)
+                    if subdir_states:
+                        subdirs.append((entry.name, subdir_states, entry.is_symlink()))
+                elif matcher.matches_file(states, entry.name) and entry.is_file():
+                    yield os.path.join(rel_dir_path, entry.name)
+            except OSError:
+                continue
+
+        # Scan sub-directories depth-first in the order they were listed.
+        real_dir_path = None
+        for name, subdir_states, is_symlink in reversed(subdirs):
+            rel_subdir_path = os.path.join(rel_dir_path, name)
+            if exclude_dir is not None and exclude_dir(rel_subdir_path):
+                continue
+            subdir_link_parent_paths = link_parent_paths
+            if is_symlink:
+                if real_dir_path is None:
+                    real_dir_path = os.path.realpath(os.path.join(root_path, rel_dir_path))
+                real_subdir_path = os.path.realpath(os.path.join(root_path, rel_subdir_path))
+                if any(_is_path_within(path, real_subdir_path) for path in (real_dir_path, *link_parent_paths)):
+                    continue
+                subdir_link_parent_paths = (*link_parent_paths, real_dir_path)
+            stack.append((rel_subdir_path, subdir_states, subdir_link_parent_paths))
+
+
+def _is_path_within(path: str, dir_path: str) -> bool:
+    """Returns True if the given path is the same as or within the
+    given directory path."""
+    return path == dir_path or path.startswith(os.path.join(dir_path, ''))
+
+
+def filter_glob_paths(rel_paths: Iterable[str], pattern: str, *,
+                      exclude_dir: Optional[Callable[[str], bool]] = None) -> Iterator[str]:
+    """
+    Yields those of the given relative file paths (with `/` separators)
+    that match the given glob pattern, in the same way as
+    `iter_glob_files()` would find them if they exist.
+
+    As with `iter_glob_files()`, `exclude_dir` receives relative
+    directory paths with the platform's separator.
+    """
+    matcher = _GlobMatcher(pattern)
+    dir_states: Dict[str, FrozenSet[int]] = {'': matcher.initial_states}
+
+    def get_dir_states(rel_dir_path: str) -> FrozenSet[int]:
+        states = dir_states.get(rel_dir_path)
+        if states is None:
+            parent_path, _, name = rel_dir_path.rpartition('/')
+            states = get_dir_states(parent_path)
+            if states:
+                states = matcher.enter_dir(states, name)
+            if states and exclude_dir is not None and exclude_dir(rel_dir_path.replace('/', os.sep)):
+                states = frozenset()
+            dir_states[rel_dir_path] = states
+        return states
+
+    for rel_path in rel_paths:
+        rel_dir_path, _, name = rel_path.rpartition('/')
+        if matcher.matches_file(get_dir_states(rel_dir_path), name):
+            yield rel_path
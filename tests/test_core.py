@@ -0,0 +1,402 @@
+import sqlite3
+import subprocess
+import time
+
+import pytest
+
+from codesurvey import CodeSurvey
+from codesurvey.core import DEDUPLICATED_CODES_STAT
+from codesurvey.database import CodeFeatureWriter, Database, pack_occurrences, unpack_occurrences
+from codesurvey.analyzers import feature_finder
+from codesurvey.analyzers.python import PythonAstAnalyzer, PythonNativeAstAnalyzer
+from codesurvey.analyzers.python.native_features import has_set, has_walrus
+from codesurvey.sources import GitSource, LocalSource, Repo, TestSource as SnippetSource
+
+SNIPPETS = {
+    f'file_{i}.py': ('x = {1}\n' if i % 2 else '(y := 2)\n') * i
+    for i in range(10)
+}
+
+
+def run_survey(db_filepath, **kwargs):
+    survey = CodeSurvey(
+        sources=[SnippetSource(SNIPPETS)],
+        analyzers=[PythonNativeAstAnalyzer(feature_finders=[has_set, has_walrus])],
+        db_filepath=str(db_filepath),
+        max_workers=2,
+        **kwargs,
+    )
+    survey.run(disable_progress=True)
+    return survey
+
+
+@feature_finder('failing')
+def has_failing(xml):
+    raise RuntimeError('Feature finder failed')
+
+
+def get_repo_counts(survey):
+    return sorted(
+        (repo_feature.feature_name, repo_feature.occurrence_count,
+         repo_feature.code_occurrence_count, repo_feature.code_total_count)
+        for repo_feature in survey.get_repo_features()
+    )
+
+
+@pytest.mark.parametrize('code_chunk_size', [3, None])
+def test_code_chunk_size(tmp_path, code_chunk_size):
+    expected_counts = get_repo_counts(run_survey(tmp_path / 'unchunked.sqlite3'))
+    assert expected_counts == [('set', 25, 5, 10), ('walrus', 20, 4, 10)]
+    survey = run_survey(tmp_path / 'chunked.sqlite3', code_chunk_size=code_chunk_size)
+    assert get_repo_counts(survey) == expected_counts
+    assert len(survey.get_code_features()) == 20
+
+
+def test_max_pending_code_jobs(tmp_path):
+
+    def run_two_repo_survey(db_filepath, **kwargs):
+        survey = CodeSurvey(
+            sources=[SnippetSource(SNIPPETS, name='a'), SnippetSource(SNIPPETS, name='b')],
+            analyzers=[PythonNativeAstAnalyzer(feature_finders=[has_set, has_walrus])],
+            db_filepath=str(db_filepath),
+            max_workers=2,
+            max_pending_code_jobs=1,
+            code_chunk_size=2,
+        )
+        survey.run(disable_progress=True, **kwargs)
+        return survey
+
+    survey = run_two_repo_survey(tmp_path / 'complete.sqlite3')
+    assert get_repo_counts(survey) == sorted([('set', 25, 5, 10), ('walrus', 20, 4, 10)] * 2)
+
+    # Codes of both Repos are analyzed in turn.
+    survey = run_two_repo_survey(tmp_path / 'partial.sqlite3', max_codes=8)
+    code_sources = [code_feature.source_name for code_feature in survey.get_code_features(feature_names=['set'])]
+    assert len(code_sources) == 8
+    assert set(code_sources) == {'a', 'b'}
+
+
+def test_repo_local_analysis(tmp_path):
+    expected_counts = get_repo_counts(run_survey(tmp_path / 'per_code.sqlite3', save_code_features=False))
+    survey = run_survey(tmp_path / 'repo_local.sqlite3', save_code_features=False, repo_local_analysis=True)
+    assert get_repo_counts(survey) == expected_counts
+    assert len(survey.get_code_features()) == 0
+
+    with pytest.raises(ValueError):
+        run_survey(tmp_path / 'invalid.sqlite3', repo_local_analysis=True)
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'code_chunk_size': 3},
+    {'repo_local_analysis': True, 'save_code_features': False},
+])
+def test_code_failure_traceback(tmp_path, kwargs):
+    survey = CodeSurvey(
+        sources=[SnippetSource(SNIPPETS)],
+        analyzers=[PythonAstAnalyzer(feature_finders=[has_failing])],
+        db_filepath=str(tmp_path / 'survey.sqlite3'),
+        max_workers=2,
+        continue_on_failure=False,
+        **kwargs,
+    )
+    # The traceback of the failure in the worker process is reported.
+    with pytest.raises(Exception, match='in has_failing'):
+        survey.run(disable_progress=True)
+
+
+def test_code_writer_failure(tmp_path, monkeypatch):
+    def fail_close(writer):
+        raise RuntimeError('Writer failed')
+
+    monkeypatch.setattr(CodeFeatureWriter, 'close', fail_close)
+    with pytest.raises(RuntimeError, match='Writer failed'):
+        run_survey(tmp_path / 'survey.sqlite3')
+
+    # The writer failure does not replace a failure of the run.
+    survey = CodeSurvey(
+        sources=[SnippetSource(SNIPPETS)],
+        analyzers=[PythonAstAnalyzer(feature_finders=[has_failing])],
+        db_filepath=str(tmp_path / 'failing.sqlite3'),
+        continue_on_failure=False,
+    )
+    with pytest.raises(Exception, match='Feature finder failed'):
+        survey.run(disable_progress=True)
+
+
+class GitLocalSource(LocalSource):
+    git_backed = True
+
+
+def make_git_repos(tmp_path, repo_names, *, commit=False):
+    repo_paths = []
+    for repo_name in repo_names:
+        repo_path = tmp_path / repo_name
+        for filename, snippet in SNIPPETS.items():
+            (repo_path / filename).parent.mkdir(parents=True, exist_ok=True)
+            (repo_path / filename).write_text(snippet)
+        subprocess.run(['git', 'init', '-q', str(repo_path)], check=True)
+        subprocess.run(['git', 'add', '.'], cwd=repo_path, check=True)
+        if commit:
+            subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com',
+                            'commit', '-q', '-m', 'Add snippets'], cwd=repo_path, check=True)
+        repo_paths.append(str(repo_path))
+    return repo_paths
+
+
+def test_blob_deduplication(tmp_path):
+    repo_paths = make_git_repos(tmp_path, ['repo_a', 'repo_b'])
+
+    def run_git_survey(repo_paths):
+        survey = CodeSurvey(
+            sources=[GitLocalSource(repo_paths)],
+            analyzers=[PythonNativeAstAnalyzer(feature_finders=[has_set, has_walrus])],
+            db_filepath=str(tmp_path / 'survey.sqlite3'),
+            max_workers=2,
+        )
+        survey.run(disable_progress=True)
+        return survey
+
+    expected_counts = get_repo_counts(run_git_survey(repo_paths[:1]))
+    survey = run_git_survey(repo_paths)
+    assert survey.get_run_stats()[DEDUPLICATED_CODES_STAT] == len(SNIPPETS)
+    code_features = survey.get_code_features()
+    assert len(code_features) == 40
+    assert all(code_feature.blob_sha is not None for code_feature in code_features)
+    assert get_repo_counts(survey) == sorted(expected_counts * 2)
+    blob_sha = code_features[0].blob_sha
+    assert survey.get_db().get_saved_blob_shas(analyzer_name='python_native', blob_shas=[blob_sha, '0' * 40]) == {blob_sha}
+
+
+def test_blob_sha_migration(tmp_path):
+    db_filepath = tmp_path / 'old.sqlite3'
+    conn = sqlite3.connect(db_filepath)
+    conn.execute((
+        'CREATE TABLE "code_feature" ("updated" INTEGER NOT NULL, "source_name" VARCHAR(255) NOT NULL, '
+        '"repo_key" VARCHAR(255) NOT NULL, "analyzer_name" VARCHAR(255) NOT NULL, "code_key" VARCHAR(255) NOT NULL, '
+        '"feature_name" VARCHAR(255) NOT NULL, "occurrence_count" INTEGER, "occurrences" JSON, '
+        'PRIMARY KEY ("source_name", "repo_key", "analyzer_name", "code_key", "feature_name"))'
+    ))
+    conn.commit()
+    conn.close()
+    survey = run_survey(db_filepath)
+    assert len(survey.get_code_features()) == 20
+
+
+def test_fetch_stage(tmp_path):
+    repo_paths = make_git_repos(tmp_path, ['repo_a', 'repo_b', 'repo_c'], commit=True)
+    survey = CodeSurvey(
+        sources=[GitSource(repo_paths)],
+        analyzers=[PythonNativeAstAnalyzer(feature_finders=[has_set, has_walrus])],
+        db_filepath=str(tmp_path / 'survey.sqlite3'),
+        max_workers=1,
+        max_fetch_workers=2,
+        prefetch_repos=3,
+    )
+    survey.run(max_repos=2, disable_progress=True)
+    assert len({repo_feature.repo_key for repo_feature in survey.get_repo_features()}) == 2
+    survey.run(disable_progress=True)
+    assert get_repo_counts(survey) == sorted([('set', 25, 5, 10), ('walrus', 20, 4, 10)] * 3)
+
+
+def test_in_memory_database():
+    # Codes are enumerated in background threads, which must share the
+    # connection to the in-memory database.
+    survey = CodeSurvey(
+        sources=[SnippetSource(SNIPPETS)],
+        analyzers=[PythonNativeAstAnalyzer(feature_finders=[has_set, has_walrus])],
+        continue_on_failure=False,
+    )
+    survey.run(disable_progress=True)
+
+
+def test_saved_code_features(tmp_path):
+    repo_path = tmp_path / 'repo'
+    repo_path.mkdir()
+    for filename, snippet in SNIPPETS.items():
+        (repo_path / filename).write_text(snippet)
+
+    def run_local_survey(feature_finders):
+        survey = CodeSurvey(
+            sources=[LocalSource([str(repo_path)])],
+            analyzers=[PythonNativeAstAnalyzer(feature_finders=feature_finders)],
+            db_filepath=str(tmp_path / 'survey.sqlite3'),
+        )
+        survey.run(disable_progress=True)
+        return survey
+
+    feature_bits = {('python_native', 'set'): 1, ('python_native', 'walrus'): 2}
+    survey = run_local_survey([has_set])
+    assert survey.get_db().get_repo_feature_masks(feature_bits=feature_bits) == {('local', str(repo_path)): 1}
+    survey = run_local_survey([has_set, has_walrus])
+    assert survey.get_db().get_repo_feature_masks(feature_bits=feature_bits) == {('local', str(repo_path)): 3}
+    assert get_repo_counts(survey) == [('set', 25, 5, 10), ('walrus', 20, 4, 10)]
+    saved_code_features = survey.get_db().get_saved_code_features(
+        source_name='local', repo_key=str(repo_path), analyzer_name='python_native', features=['set', 'walrus'],
+    )
+    assert saved_code_features == {(code_key, feature) for code_key in SNIPPETS for feature in ['set', 'walrus']}
+
+
+def test_code_feature_writer(tmp_path):
+    db = Database(str(tmp_path / 'survey.sqlite3'))
+    db.initialize()
+    repo = next(SnippetSource(SNIPPETS).repo_generator())
+    analyzer = PythonNativeAstAnalyzer(feature_finders=[has_set])
+    codes = [analyzer.analyze_code(repo, code_key, ['set']) for code_key in SNIPPETS]
+    repo.cleanup()
+    writer = CodeFeatureWriter(db, save_occurrences=True, batch_size=100, interval_seconds=0.01)
+
+    # Queued Codes are saved after the interval.
+    writer.put(codes[0])
+    for _ in range(100):
+        if db.get_code_features():
+            break
+        time.sleep(0.05)
+    assert [code_feature.code_key for code_feature in db.get_code_features()] == [codes[0].key]
+
+    # Queued Codes are saved when the writer is closed.
+    writer.interval_seconds = 60
+    for code in codes[1:]:
+        writer.put(code)
+    writer.close()
+    assert len(db.get_code_features()) == len(SNIPPETS)
+
+
+def test_db_profile(tmp_path):
+    db_filepath = tmp_path / 'fast.sqlite3'
+    survey = run_survey(db_filepath, db_profile='fast')
+    assert get_repo_counts(survey) == [('set', 25, 5, 10), ('walrus', 20, 4, 10)]
+    journal_mode, = sqlite3.connect(db_filepath).execute('PRAGMA journal_mode').fetchone()
+    assert journal_mode == 'wal'
+
+    with pytest.raises(ValueError):
+        run_survey(tmp_path / 'invalid.sqlite3', db_profile='invalid')
+
+
+def get_code_feature_rows(survey):
+    return sorted(
+        (code_feature.code_key, code_feature.feature_name, code_feature.occurrence_count, code_feature.occurrences)
+        for code_feature in survey.get_code_features()
+    )
+
+
+def test_normalized_schema(tmp_path):
+    expected_survey = run_survey(tmp_path / 'default.sqlite3')
+    survey = run_survey(tmp_path / 'normalized.sqlite3', db_normalized=True)
+    assert get_repo_counts(survey) == get_repo_counts(expected_survey)
+    assert get_code_feature_rows(survey) == get_code_feature_rows(expected_survey)
+
+    # Code features are deleted through the normalized views.
+    survey = run_survey(tmp_path / 'repo_only.sqlite3', db_normalized=True, save_code_features=False)
+    assert get_repo_counts(survey) == get_repo_counts(expected_survey)
+    assert len(survey.get_code_features()) == 0
+
+
+def test_normalized_schema_migration(tmp_path):
+    repo_path = tmp_path / 'repo'
+    repo_path.mkdir()
+    for filename, snippet in SNIPPETS.items():
+        (repo_path / filename).write_text(snippet)
+    db_filepath = tmp_path / 'survey.sqlite3'
+
+    def run_local_survey(**kwargs):
+        survey = CodeSurvey(
+            sources=[LocalSource([str(repo_path)])],
+            analyzers=[PythonNativeAstAnalyzer(feature_finders=[has_set, has_walrus])],
+            db_filepath=str(db_filepath),
+            **kwargs,
+        )
+        survey.run(disable_progress=True)
+        return survey
+
+    expected_survey = run_local_survey()
+    expected_code_feature_rows = get_code_feature_rows(expected_survey)
+    survey = run_local_survey(db_normalized=True)
+    assert get_repo_counts(survey) == get_repo_counts(expected_survey)
+    assert get_code_feature_rows(survey) == expected_code_feature_rows
+
+    def get_table_names():
+        return {name for name, in sqlite3.connect(db_filepath).execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    assert 'code_feature_data' in get_table_names()
+    assert 'code_feature' not in get_table_names()
+
+    # The database continues to use the normalized schema.
+    survey = run_local_survey()
+    assert get_code_feature_rows(survey) == expected_code_feature_rows
+    assert 'code_feature' not in get_table_names()
+
+
+def test_compact_occurrences(tmp_path):
+    occurrences = [{'first_line_number': 3}, {'first_line_number': 2 ** 32 - 1}]
+    assert unpack_occurrences(pack_occurrences(occurrences)) == occurrences
+    assert pack_occurrences([{'first_line_number': None}]) is None
+    assert pack_occurrences([{'first_line_number': 3, 'col': 1}]) is None
+    assert pack_occurrences([{'first_line_number': 2 ** 32}]) is None
+
+    db_filepath = tmp_path / 'compact.sqlite3'
+    expected_survey = run_survey(tmp_path / 'json.sqlite3')
+    survey = run_survey(db_filepath, compact_occurrences=True)
+    assert get_code_feature_rows(survey) == get_code_feature_rows(expected_survey)
+    occurrence_types = {occurrence_type for occurrence_type, in sqlite3.connect(db_filepath).execute(
+        'SELECT DISTINCT typeof(occurrences) FROM code_feature'
+    )}
+    assert occurrence_types == {'blob'}
+    assert all(code_feature.occurrences is None for code_feature in survey.get_code_features(include_occurrences=False))
+
+
+@pytest.mark.parametrize('db_normalized', [False, True])
+def test_iter_features(tmp_path, db_normalized):
+    survey = run_survey(tmp_path / 'survey.sqlite3', db_normalized=db_normalized)
+    code_features = sorted(survey.get_code_features(), key=lambda code_feature: code_feature.sort_key)
+    assert list(survey.iter_code_features(batch_size=3)) == code_features
+    assert list(survey.iter_repo_features(batch_size=1)) == sorted(survey.get_repo_features(),
+                                                                   key=lambda repo_feature: repo_feature.sort_key)
+
+    # Iteration can be resumed after a previously returned feature.
+    set_code_features = [code_feature for code_feature in code_features if code_feature.feature_name == 'set']
+    resumed_code_features = survey.iter_code_features(feature_names=['set'], after=set_code_features[3].sort_key, batch_size=4)
+    assert list(resumed_code_features) == set_code_features[4:]
+
+
+def test_features_columns(tmp_path):
+    pytest.importorskip('numpy')
+    survey = run_survey(tmp_path / 'survey.sqlite3')
+    repo_columns = survey.get_repo_features_columns()
+    assert sorted(zip(repo_columns['feature_name'].to_list(), repo_columns['occurrence_count'].tolist(),
+                      repo_columns['code_occurrence_count'].tolist(), repo_columns['code_total_count'].tolist())) == get_repo_counts(survey)
+
+    code_columns = survey.get_code_features_columns(feature_names=['set'])
+    code_features = survey.get_code_features(feature_names=['set'])
+    assert sorted(zip(code_columns['code_key'].to_list(), code_columns['occurrence_count'].tolist())) == sorted(
+        (code_feature.code_key, code_feature.occurrence_count) for code_feature in code_features
+    )
+    assert code_columns['blob_sha'].to_list() == [None] * len(code_features)
+    assert 'occurrences' not in code_columns
+
+    pytest.importorskip('pyarrow')
+    from codesurvey.columns import to_arrow_table
+    table = to_arrow_table(code_columns)
+    assert table.num_rows == len(code_features)
+    assert table.column('blob_sha').null_count == len(code_features)
+
+
+def test_feature_summaries(tmp_path):
+    survey = CodeSurvey(
+        sources=[SnippetSource(SNIPPETS, name='a'), SnippetSource({'file.py': 'x = {1}\n'}, name='b')],
+        analyzers=[PythonNativeAstAnalyzer(feature_finders=[has_set, has_walrus])],
+        db_filepath=str(tmp_path / 'survey.sqlite3'),
+    )
+    survey.run(disable_progress=True)
+    summaries = survey.get_feature_summaries(feature_names=['set'], quantiles=[0, 0.25, 0.5])
+    assert len(summaries) == 1
+    assert summaries[0].repo_count == 2
+    assert summaries[0].repo_occurrence_count == 2
+    assert summaries[0].occurrence_count == 26
+    assert summaries[0].code_total_count == 11
+    assert summaries[0].occurrence_count_quantiles == {0: 1.0, 0.25: 7.0, 0.5: 13.0}
+
+    db = survey.get_db()
+    repo_feature = next(repo_feature for repo_feature in survey.get_repo_features() if repo_feature.source_name == 'b')
+    db.save_repo_metadata(Repo(source=SnippetSource({}, name='b'), key=repo_feature.repo_key, path='', metadata={'stars': 50}))
+    summaries = survey.get_feature_summaries(feature_names=['set'], metadata_key='stars', metadata_buckets=[0, 10, 100])
+    assert [(summary.metadata_value, summary.occurrence_count) for summary in summaries] == [(None, 25), (10, 1)]
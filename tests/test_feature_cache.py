@@ -0,0 +1,69 @@
+from codesurvey.analyzers import FeatureCache
+from codesurvey.analyzers.cache import (
+    FEATURE_CACHE_EVICTIONS_STAT, FEATURE_CACHE_HITS_STAT, FEATURE_CACHE_MISSES_STAT,
+)
+from codesurvey.analyzers.python import PythonNativeAstAnalyzer
+from codesurvey.analyzers.python import core as python_core
+from codesurvey.analyzers.python.native_features import has_set, has_walrus
+from codesurvey.analyzers.python.parser import ParserCrashError
+from codesurvey import sources
+
+
+def analyze_snippet(analyzer, code_snippet):
+    repo = next(sources.TestSource({'test.py': code_snippet}).repo_generator())
+    try:
+        return analyzer.analyze_code(repo=repo, code_key='test.py', features=analyzer.get_feature_names())
+    finally:
+        repo.cleanup()
+
+
+def test_feature_cache(tmp_path):
+    cache = FeatureCache(str(tmp_path / 'cache.sqlite3'))
+    analyzer = PythonNativeAstAnalyzer(feature_finders=[has_set, has_walrus], cache=cache)
+
+    code = analyze_snippet(analyzer, 'x = {1}')
+    assert code.stats == {FEATURE_CACHE_HITS_STAT: 0, FEATURE_CACHE_MISSES_STAT: 2}
+    assert len(code.features['set'].occurrences) == 1
+    cached_code = analyze_snippet(analyzer, 'x = {1}')
+    assert cached_code.stats == {FEATURE_CACHE_HITS_STAT: 2, FEATURE_CACHE_MISSES_STAT: 0}
+    assert cached_code.features == code.features
+
+    # Results of unparseable files are also cached.
+    assert analyze_snippet(analyzer, 'x = (').features['set'].ignore
+    cached_code = analyze_snippet(analyzer, 'x = (')
+    assert cached_code.features['set'].ignore
+    assert cached_code.stats == {FEATURE_CACHE_HITS_STAT: 2, FEATURE_CACHE_MISSES_STAT: 0}
+
+    # Results are not shared with different FeatureFinders.
+    other_analyzer = PythonNativeAstAnalyzer(feature_finders=[has_walrus, has_set], cache=cache, single_pass=False)
+    assert analyze_snippet(other_analyzer, 'x = {1}').stats[FEATURE_CACHE_HITS_STAT] == 2
+    assert analyze_snippet(other_analyzer, 'x = {2}').stats[FEATURE_CACHE_HITS_STAT] == 0
+
+
+def test_feature_cache_eviction(tmp_path):
+    cache = FeatureCache(str(tmp_path / 'cache.sqlite3'), max_size_mb=0.05)
+    analyzer = PythonNativeAstAnalyzer(feature_finders=[has_set], cache=cache)
+    evictions = 0
+    for i in range(300):
+        code = analyze_snippet(analyzer, f'x = {{{i}}}\n' * 20)
+        evictions += code.stats.get(FEATURE_CACHE_EVICTIONS_STAT, 0)
+    assert evictions > 0
+    cache.evict()
+    assert cache.get_size_mb() <= 0.05
+
+
+def test_feature_cache_parser_crash(tmp_path, monkeypatch):
+    cache = FeatureCache(str(tmp_path / 'cache.sqlite3'))
+    analyzer = PythonNativeAstAnalyzer(feature_finders=[has_set], cache=cache)
+
+    class CrashingParser:
+        def parse(self, text):
+            raise ParserCrashError('Parser process died')
+
+    # Files ignored because the parser crashed are not cached.
+    with monkeypatch.context() as patch:
+        patch.setattr(python_core, 'get_ast_parser', CrashingParser)
+        assert analyze_snippet(analyzer, 'x = {1}').features['set'].ignore
+    code = analyze_snippet(analyzer, 'x = {1}')
+    assert code.stats == {FEATURE_CACHE_HITS_STAT: 0, FEATURE_CACHE_MISSES_STAT: 1}
+    assert not code.features['set'].ignore
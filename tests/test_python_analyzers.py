@@ -0,0 +1,203 @@
+import ast
+import os
+import pickle
+import subprocess
+
+import astpath
+import lxml.etree
+
+from codesurvey.analyzers import Feature, union_feature_finder
+from codesurvey.analyzers.python import (
+    PythonAstAnalyzer,
+    PythonNativeAstAnalyzer,
+    node_modules_dir_filter,
+    py_module_feature_finder,
+    py_node_module_feature_finder,
+    py_site_packages_dir_filter,
+    py_virtualenv_dir_filter,
+)
+from codesurvey.analyzers.python import features, native_features
+from codesurvey.sources import LocalSource
+from codesurvey.sources.core import get_git_index_files
+
+FEATURE_FINDER_NAMES = [
+    'has_for_else',
+    'has_try_finally',
+    'has_type_hint',
+    'has_set_function',
+    'has_set_value',
+    'has_set',
+    'has_fstring',
+    'has_ternary',
+    'has_pattern_matching',
+    'has_walrus',
+]
+
+TEST_CODE = '''
+import os.path, dataclasses
+from collections import abc
+from . import relative
+
+@decorator(
+    x := 1)
+def f(a: int, /, b, *c: str, d=lambda q: q, **e: dict) -> int:
+    if (n := len(a)) > 1:
+        return {n}
+    for i in c:
+        pass
+    else:
+        y = f"{i!r:>{n}}"
+    try:
+        try:
+            pass
+        finally:
+            pass
+    finally:
+        z = set([1]) if a else set()
+    match a:
+        case [1, *rest]:
+            pass
+'''
+
+
+def get_features(analyzer_class, feature_module, module_feature_finder):
+    analyzer = analyzer_class(feature_finders=[
+        *[getattr(feature_module, name) for name in FEATURE_FINDER_NAMES],
+        module_feature_finder('modules', modules=['os', 'collections']),
+    ])
+    return analyzer.test(TEST_CODE)
+
+
+def test_native_features_match_xml_features():
+    xml_features = get_features(PythonAstAnalyzer, features, py_module_feature_finder)
+    native_features_ = get_features(PythonNativeAstAnalyzer, native_features, py_node_module_feature_finder)
+    assert xml_features == native_features_
+    assert native_features_['try_finally'].occurrences == [
+        {'first_line_number': 19},
+        {'first_line_number': 21},
+    ]
+    assert len(native_features_['type_hint'].occurrences) == 3
+    assert len(native_features_['modules'].occurrences) == 2
+
+
+def test_native_features_unparseable():
+    analyzer = PythonNativeAstAnalyzer(feature_finders=[native_features.has_set])
+    assert analyzer.test('x = (')['set'].ignore
+
+
+def test_native_features_pickle():
+    for name in FEATURE_FINDER_NAMES:
+        feature_finder = getattr(native_features, name)
+        unpickled = pickle.loads(pickle.dumps(feature_finder))
+        assert unpickled.name == feature_finder.name
+
+
+def test_native_features_single_pass():
+    feature_finders = [
+        *[getattr(native_features, name) for name in FEATURE_FINDER_NAMES],
+        py_node_module_feature_finder('modules', modules=['os', 'collections']),
+    ]
+    single_pass_analyzer = PythonNativeAstAnalyzer(feature_finders=feature_finders)
+    multi_pass_analyzer = PythonNativeAstAnalyzer(feature_finders=feature_finders, single_pass=False)
+    single_pass_features = single_pass_analyzer.test(TEST_CODE)
+    assert single_pass_features == multi_pass_analyzer.test(TEST_CODE)
+    assert list(single_pass_features.keys()) == [finder.name for finder in feature_finders]
+
+
+def test_convert_to_xml():
+    tree = ast.parse(TEST_CODE)
+    xml = features.convert_to_xml(tree)
+    expected_xml = astpath.convert_to_xml(tree)
+    assert lxml.etree.tostring(xml) == lxml.etree.tostring(expected_xml)
+    # Indexed first line numbers match a scan of each element's descendents.
+    for el in xml.iter():
+        line_nos = el.xpath('descendant-or-self::*[@lineno]/@lineno')
+        expected_line_no = min(map(int, line_nos)) if line_nos else None
+        assert features.get_first_line_number(el) == expected_line_no
+    # Line numbers of documents that were not indexed are found by scanning.
+    assert features.get_first_line_number(lxml.etree.fromstring('<Name lineno="3"><ctx lineno="2"/></Name>')) == 2
+
+
+def test_prefilters():
+    snippets = [TEST_CODE, 'import os\nx = {1}\n', 'matches = f"{x}" if y else None\n', 'x = {(\n']
+    for analyzer_class, feature_module, module_feature_finder in [
+            (PythonAstAnalyzer, features, py_module_feature_finder),
+            (PythonNativeAstAnalyzer, native_features, py_node_module_feature_finder),
+    ]:
+        feature_finders = [
+            *[getattr(feature_module, name) for name in FEATURE_FINDER_NAMES],
+            module_feature_finder('modules', modules=['os.path', 'collections']),
+        ]
+        analyzer = analyzer_class(feature_finders=feature_finders)
+        prefilter_analyzer = analyzer_class(feature_finders=feature_finders, use_prefilters=True)
+        for snippet in snippets:
+            assert prefilter_analyzer.test(snippet) == analyzer.test(snippet)
+
+        # Unions only have a prefilter if all of their FeatureFinders do.
+        assert feature_module.has_set.prefilter is None
+        union = union_feature_finder('union', [feature_module.has_walrus, feature_module.has_pattern_matching])
+        assert union.prefilter.search('match x:') and union.prefilter.search('(y := 2)')
+        assert feature_module.has_walrus.prefilter.search('(y := 2)')
+        assert feature_module.has_fstring.prefilter.search('x = rF"{y}"')
+        assert not feature_module.has_fstring.prefilter.search('x = "{y}"')
+
+        # Files that cannot contain any analyzed feature are only
+        # checked, so files that cannot be parsed are still ignored.
+        walrus_analyzer = analyzer_class(feature_finders=[feature_module.has_walrus], use_prefilters=True)
+        assert walrus_analyzer.test('x = 1')['walrus'] == Feature(name='walrus', occurrences=[])
+        assert walrus_analyzer.test('x = (')['walrus'].ignore
+
+
+class GitLocalSource(LocalSource):
+    git_backed = True
+
+
+def test_git_index_files(tmp_path):
+    for rel_path in ['a.py', 'b/c.py', 'b/d.txt', 'site-packages/e.py', 'lib/site-packages/f.py']:
+        path = tmp_path / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('x = 1\n')
+    (tmp_path / 'g.py').symlink_to(tmp_path / 'a.py')
+    (tmp_path / 'h.py').symlink_to(tmp_path / 'b')
+    subprocess.run(['git', 'init', '-q', str(tmp_path)], check=True)
+    subprocess.run(['git', 'add', '.'], cwd=tmp_path, check=True)
+    # Untracked files are not analyzed.
+    (tmp_path / 'b' / 'untracked.py').write_text('x = 1\n')
+
+    git_files = get_git_index_files(str(tmp_path))
+    assert git_files['a.py'] == subprocess.run(
+        ['git', 'hash-object', 'a.py'], cwd=tmp_path, capture_output=True, text=True, check=True,
+    ).stdout.strip()
+    assert git_files['g.py'] is None
+
+    analyzer = PythonNativeAstAnalyzer(feature_finders=[native_features.has_set])
+    scanned_repo = next(LocalSource([str(tmp_path)]).repo_generator())
+    git_repo = next(GitLocalSource([str(tmp_path)]).repo_generator())
+    scanned_keys, git_keys = [
+        sorted(code_thunk.key for code_thunk in analyzer.code_generator(repo, get_code_features=lambda key: ['set']))
+        for repo in [scanned_repo, git_repo]
+    ]
+    assert scanned_keys == [
+        'a.py', os.path.join('b', 'c.py'), os.path.join('b', 'untracked.py'), 'g.py',
+        os.path.join('h.py', 'c.py'), os.path.join('h.py', 'untracked.py'), os.path.join('site-packages', 'e.py'),
+    ]
+    assert git_keys == ['a.py', os.path.join('b', 'c.py'), 'g.py', os.path.join('site-packages', 'e.py')]
+
+
+def test_dir_filters(tmp_path):
+    for rel_path in ['a.py', 'venv/pyvenv.cfg', 'venv/b.py', 'node_modules/c.py', 'lib/site-packages/d.py']:
+        path = tmp_path / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('x = 1\n')
+    repo = next(LocalSource([str(tmp_path)]).repo_generator())
+
+    def get_keys(analyzer):
+        return sorted(code_thunk.key for code_thunk in analyzer.code_generator(repo, get_code_features=lambda key: ['set']))
+
+    # Only site-packages directories are excluded by default.
+    assert get_keys(PythonNativeAstAnalyzer(feature_finders=[native_features.has_set])) == [
+        'a.py', os.path.join('node_modules', 'c.py'), os.path.join('venv', 'b.py'),
+    ]
+    assert get_keys(PythonNativeAstAnalyzer(feature_finders=[native_features.has_set], dir_filters=[
+        py_site_packages_dir_filter, py_virtualenv_dir_filter, node_modules_dir_filter,
+    ])) == ['a.py']
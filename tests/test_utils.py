@@ -1,5 +1,11 @@
+import glob
+import os
+
 from codesurvey.utils import (
     get_duplicates,
+    iter_glob_files,
+    pop_stats,
+    record_stat,
     recursive_update,
 )
 
@@ -24,3 +30,56 @@ def test_recursive_update():
     test_dict = {'a': {1: 'I'}, 'b': {}}
     recursive_update(test_dict, {'a': {1: 'i', 2: 'ii'}, 'b': 'test'})
     assert test_dict == {'a': {1: 'I', 2: 'ii'}, 'b': {}}
+
+
+def test_record_stat():
+    pop_stats()
+    assert pop_stats() == {}
+
+    record_stat('a')
+    record_stat('b', 3)
+    record_stat('a')
+    assert pop_stats() == {'a': 2, 'b': 3}
+    assert pop_stats() == {}
+
+
+def test_iter_glob_files(tmp_path):
+    for rel_path in ['a.py', 'b.txt', '.c.py', 'd/e.py', 'd/f/g.py', 'd/.h/i.py', '.j/k.py', 'l/m.py']:
+        path = tmp_path / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('')
+    (tmp_path / 'n.py').mkdir()
+    # Symlinked directories are followed.
+    (tmp_path / 'o').symlink_to(tmp_path / 'd' / 'f')
+
+    for pattern in ['**/*.py', '*.py', '*/*.py', 'd/**/*.py', '**/.*', '.j/*', '**', '[ad]*/*.py']:
+        expected_paths = sorted(
+            os.path.relpath(path, tmp_path)
+            for path in glob.iglob(os.path.join(tmp_path, pattern), recursive=True)
+            if os.path.isfile(path)
+        )
+        assert sorted(iter_glob_files(str(tmp_path), pattern)) == expected_paths
+
+    # Symlinks to directories that contain a directory being scanned
+    # are not followed.
+    (tmp_path / 'd' / 'loop').symlink_to(tmp_path)
+    (tmp_path / 'd' / 'f' / 'loop').symlink_to(tmp_path / 'l')
+    (tmp_path / 'l' / 'loop').symlink_to(tmp_path / 'd')
+    assert sorted(iter_glob_files(str(tmp_path), '**/*.py')) == sorted(os.path.join(*rel_path.split('/')) for rel_path in [
+        'a.py', 'd/e.py', 'd/f/g.py', 'd/f/loop/m.py', 'l/m.py', 'l/loop/e.py', 'l/loop/f/g.py',
+        'o/g.py', 'o/loop/m.py',
+    ])
+
+    excluded_dirs = []
+
+    def exclude_dir(rel_path):
+        excluded_dirs.append(rel_path)
+        return os.path.basename(rel_path) in ['l', 'o', 'loop']
+
+    assert sorted(iter_glob_files(str(tmp_path), '**/*.py', exclude_dir=exclude_dir)) == [
+        'a.py', os.path.join('d', 'e.py'), os.path.join('d', 'f', 'g.py'),
+    ]
+    # Hidden directories are not considered.
+    assert sorted(excluded_dirs) == [
+        'd', os.path.join('d', 'f'), os.path.join('d', 'f', 'loop'), os.path.join('d', 'loop'), 'l', 'n.py', 'o',
+    ]